@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the app as ``src.*``; make that work whichever directory pytest is run from
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -4,16 +4,26 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
-import uvicorn
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.exceptions import RequestValidationError
 from src.routes.chatbot.router import router as chatbot_router
 from src.routes.chatbot_v2.router import router as chatbot_router_v2
+from src.utils.services import services
+from src.utils.serve import serve
+from src.utils.telemetry import RequestIdFilter, TelemetryMiddleware, metrics, metrics_enabled
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build shared upstream clients and warm their connections before serving
+    await services.start()
+    yield
+    await services.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -22,8 +32,12 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "Server-Timing", "X-Stream-ID", "Retry-After"],
 )
 
+# Correlation ids, per-stage timings and request metrics
+app.add_middleware(TelemetryMiddleware)
+
 # Include routers
 app.include_router(chatbot_router,prefix="")
 app.include_router(chatbot_router_v2,prefix="/v2")
@@ -37,8 +51,23 @@ app.include_router(chatbot_router_v2,prefix="/v2")
 async def root():
     return {"message": "Server is up and running!"}
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+@app.get("/ready")
+async def ready():
+    status_code = 200 if services.ready else 503
+    return JSONResponse(
+        status_code=status_code,
+        content={"ready": services.ready, "warmup": services.warmup_report},
+    )
+
+if metrics_enabled:
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Configure logging, tagging records with the request's correlation id
+logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(name)s:[%(request_id)s] %(message)s")
+for handler in logging.getLogger().handlers:
+    handler.addFilter(RequestIdFilter())
 logger = logging.getLogger(__name__)
 
 @app.exception_handler(Exception)
@@ -59,4 +88,5 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 
 if __name__ == "__main__":
     environment = os.getenv("ENVIRONMENT")
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=(environment == "dev"))
\ No newline at end of file
+    # WEB_CONCURRENCY > 1 pre-forks workers that share a conversation store
+    serve("main:app", reload=(environment == "dev"))
@@ -0,0 +1,208 @@
+import time
+import json
+import base64
+import asyncio
+import hashlib
+import argparse
+import numpy as np
+import uvicorn
+from typing import List
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Local stand-ins for the OpenAI and Pinecone APIs, so the service can be
+# load-tested without network access or API quota. Only the endpoints the
+# backend calls are implemented, with the response shapes the SDKs expect.
+
+embedding_dimension = 1536
+
+answer_text = (
+    "Paloma The Grandeur is a luxurious residential project in Kanpur by Paloma Realty, offering "
+    "spacious 3 and 4 BHK apartments with premium finishes, a landscaped central garden, a clubhouse "
+    "with a swimming pool and gym, covered parking and round-the-clock security. Residents enjoy "
+    "excellent connectivity to schools, hospitals and shopping, making it an ideal address for families."
+)
+
+corpus_topics = [
+    "3 BHK apartments with carpet area of 1850 sq ft and three balconies",
+    "4 BHK apartments with carpet area of 2450 sq ft and a private lift lobby",
+    "clubhouse with swimming pool, gym, indoor games and a banquet hall",
+    "location on the main road in Kanpur close to schools, hospitals and malls",
+    "RERA registration number UPRERAPRJ123456 and KDA approval",
+    "possession timeline and construction progress of each tower",
+    "price list, payment plans, bank loans and EMI options",
+    "covered parking, EV charging points and visitor parking",
+    "security with CCTV, intercom and manned gates round the clock",
+    "landscaped central garden, jogging track and children's play area",
+    "specifications: vitrified flooring, modular kitchen and branded fittings",
+    "Paloma Realty track record of delivered projects in Kanpur",
+]
+
+def hashed_embedding(text: str, dimension: int = embedding_dimension) -> List[float]:
+    """Deterministic bag-of-words embedding, so similar texts get similar vectors."""
+    vector = np.zeros(dimension, dtype=np.float32)
+    for word in text.casefold().split():
+        digest = hashlib.blake2b(word.strip(".,?!").encode(), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % dimension
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = float(np.linalg.norm(vector))
+    if norm == 0.0:
+        vector[0] = 1.0
+        norm = 1.0
+    return (vector / norm).tolist()
+
+def _word_tokens(text: str) -> List[str]:
+    words = text.split(" ")
+    return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+def create_fake_openai(first_token_latency: float = 0.3, token_rate: float = 50.0,
+                       embedding_latency: float = 0.05, completion_latency: float = 0.4,
+                       dimension: int = embedding_dimension) -> FastAPI:
+    """Fake OpenAI API: embeddings, chat completions (streamed or not), model lookup and a contact sink.
+
+    Streamed completions send one word per chunk at ``token_rate`` chunks per
+    second after ``first_token_latency`` seconds.
+    """
+    app = FastAPI()
+    app.state.counts = {"embeddings": 0, "chat": 0, "chat_stream": 0, "contacts": 0}
+
+    @app.get("/v1/models/{model}")
+    async def retrieve_model(model: str):
+        return {"id": model, "object": "model", "created": 0, "owned_by": "bench"}
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        app.state.counts["embeddings"] += 1
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(embedding_latency)
+        data = []
+        for i, text in enumerate(inputs):
+            vector = hashed_embedding(str(text), dimension)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(np.asarray(vector, dtype="<f4").tobytes()).decode()
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        tokens = sum(len(str(text).split()) for text in inputs)
+        return {"object": "list", "data": data, "model": body.get("model"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "gpt-4o-mini")
+        created = int(time.time())
+        json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+        content = json.dumps({"user_name": None}) if json_mode else answer_text
+        if not body.get("stream"):
+            app.state.counts["chat"] += 1
+            await asyncio.sleep(completion_latency)
+            return {
+                "id": "chatcmpl-bench", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(content.split()), "total_tokens": len(content.split())},
+            }
+
+        app.state.counts["chat_stream"] += 1
+        max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+        tokens = _word_tokens(content)[:max_tokens] if max_tokens else _word_tokens(content)
+
+        def chunk(delta: dict, finish_reason=None) -> str:
+            payload = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": created, "model": model,
+                       "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def stream():
+            await asyncio.sleep(first_token_latency)
+            yield chunk({"role": "assistant", "content": ""})
+            interval = 1.0 / token_rate if token_rate > 0 else 0.0
+            started = time.perf_counter()
+            for i, token in enumerate(tokens):
+                # Pace against the start time so sleep overshoot does not accumulate
+                delay = started + i * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                yield chunk({"content": token})
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.post("/contacts")
+    async def contacts(request: Request):
+        await request.body()
+        app.state.counts["contacts"] += 1
+        return {"status": "ok"}
+
+    @app.get("/stats")
+    async def stats():
+        return dict(app.state.counts)
+
+    return app
+
+def create_fake_pinecone(query_latency: float = 0.03, dimension: int = embedding_dimension,
+                         pages: int = 36) -> FastAPI:
+    """Fake Pinecone data plane: cosine search over a small synthetic corpus embedded like the fake OpenAI."""
+    app = FastAPI()
+    app.state.queries = 0
+    ids, metadata, rows = [], [], []
+    for page in range(1, pages + 1):
+        topic = corpus_topics[(page - 1) % len(corpus_topics)]
+        content = f"Paloma The Grandeur, page {page}: {topic}. " + answer_text
+        ids.append(f"paloma_marketing_facts_page_{page}_chunk_0")
+        metadata.append({"filename": "Paloma Marketing Facts", "page": page, "content": content})
+        rows.append(hashed_embedding(content, dimension))
+    matrix = np.asarray(rows, dtype=np.float32)
+
+    @app.post("/query")
+    async def query(request: Request):
+        body = await request.json()
+        app.state.queries += 1
+        await asyncio.sleep(query_latency)
+        vector = np.asarray(body.get("vector") or [], dtype=np.float32)
+        top_k = min(int(body.get("topK", body.get("top_k", 10))), len(ids))
+        if vector.shape != (dimension,) or top_k <= 0:
+            return {"matches": [], "namespace": body.get("namespace", "")}
+        scores = matrix @ (vector / (np.linalg.norm(vector) or 1.0))
+        top = np.argsort(-scores)[:top_k]
+        include_metadata = body.get("includeMetadata", body.get("include_metadata", True))
+        matches = []
+        for row in top:
+            match = {"id": ids[row], "score": float(scores[row]), "values": []}
+            if include_metadata:
+                match["metadata"] = metadata[row]
+            matches.append(match)
+        return {"matches": matches, "namespace": body.get("namespace", ""), "usage": {"readUnits": 1}}
+
+    @app.api_route("/describe_index_stats", methods=["GET", "POST"])
+    async def describe_index_stats():
+        return {"namespaces": {"": {"vectorCount": len(ids)}}, "dimension": dimension,
+                "indexFullness": 0.0, "totalVectorCount": len(ids)}
+
+    @app.get("/stats")
+    async def stats():
+        return JSONResponse({"queries": app.state.queries})
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for OpenAI or Pinecone.")
+    parser.add_argument("service", choices=["openai", "pinecone"])
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--dimension", type=int, default=embedding_dimension)
+    parser.add_argument("--first-token-latency", type=float, default=0.3, help="seconds before the first streamed token")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="streamed tokens per second")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="seconds per embeddings call")
+    parser.add_argument("--completion-latency", type=float, default=0.4, help="seconds per non-streamed completion")
+    parser.add_argument("--query-latency", type=float, default=0.03, help="seconds per vector query")
+    args = parser.parse_args()
+
+    if args.service == "openai":
+        app = create_fake_openai(args.first_token_latency, args.token_rate, args.embedding_latency,
+                                 args.completion_latency, args.dimension)
+    else:
+        app = create_fake_pinecone(args.query_latency, args.dimension)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import asyncio
+import argparse
+import platform
+import subprocess
+import tempfile
+import httpx
+import numpy as np
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Load test for the chat API against local OpenAI and Pinecone stand-ins.
+#
+# Starts fake_upstreams.py twice (OpenAI, Pinecone) and main:app under uvicorn
+# in separate processes, drives /chat and /v2/chat with concurrent multi-turn
+# sessions, and writes throughput, time-to-first-token, inter-token gap and
+# latency percentiles plus server memory growth to a JSON file. Pass the file
+# of an earlier run with --compare to see the change per metric.
+#
+#   python src/benchmark/run_benchmark.py --sessions 50 --concurrency 20 --turns 4
+
+backend_dir = Path(__file__).resolve().parents[2]
+fake_upstreams_path = Path(__file__).resolve().parent / "fake_upstreams.py"
+
+openers = ["Hi", "Hello there", "I am Ravi", "My name is Anita Sharma", "Priya"]
+questions = [
+    "What is the price of a 3 BHK apartment?",
+    "Tell me about the amenities",
+    "Where is the project located?",
+    "What is the carpet area of the 4 BHK?",
+    "Is covered parking available?",
+    "When is possession expected?",
+    "What is the RERA number?",
+    "What payment plans and loan options do you have?",
+    "What security features does the society have?",
+    "Who is the developer and what have they delivered before?",
+    "What are the flooring and kitchen specifications?",
+    "Is there a swimming pool and gym in the clubhouse?",
+]
+small_talk = ["thanks", "ok got it", "great, thank you", "bye"]
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """Resident memory of a process and its direct children (uvicorn workers); None off Linux."""
+    total = 0
+    pids = [pid]
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                pids.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    for each in pids:
+        try:
+            with open(f"/proc/{each}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            if each == pid:
+                return None
+    return total
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """Count, mean, p50/p95/p99 and max of ``values`` in milliseconds."""
+    if not values:
+        return {"count": 0, "mean": None, "p50": None, "p95": None, "p99": None, "max": None}
+    data = np.asarray(values, dtype=np.float64) * 1000.0
+    p50, p95, p99 = np.percentile(data, [50, 95, 99])
+    return {
+        "count": len(values),
+        "mean": round(float(data.mean()), 2),
+        "p50": round(float(p50), 2),
+        "p95": round(float(p95), 2),
+        "p99": round(float(p99), 2),
+        "max": round(float(data.max()), 2),
+    }
+
+class RequestResult:
+    """Timings of one chat request, measured from send to each streamed frame."""
+
+    __slots__ = ("endpoint", "kind", "status", "error", "latency", "ttft", "gaps", "frames", "chars")
+
+    def __init__(self, endpoint: str, kind: str):
+        self.endpoint = endpoint
+        self.kind = kind
+        self.status = None
+        self.error = None
+        self.latency = None
+        self.ttft = None
+        self.gaps: List[float] = []
+        self.frames = 0
+        self.chars = 0
+
+class ServerProcesses:
+    """The fake upstreams and the app under test, each in its own process."""
+
+    def __init__(self, args):
+        self.args = args
+        self.processes: List[subprocess.Popen] = []
+        self.workdir = tempfile.mkdtemp(prefix="paloma-bench-")
+        self.openai_port = free_port()
+        self.pinecone_port = free_port()
+        self.app_port = free_port()
+        self.app: Optional[subprocess.Popen] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.app_port}"
+
+    def start(self) -> None:
+        args = self.args
+        log = open(os.path.join(self.workdir, "servers.log"), "w")
+        self.processes.append(subprocess.Popen([
+            sys.executable, str(fake_upstreams_path), "openai", "--port", str(self.openai_port),
+            "--first-token-latency", str(args.first_token_latency), "--token-rate", str(args.token_rate),
+            "--embedding-latency", str(args.embedding_latency), "--completion-latency", str(args.completion_latency),
+        ], stdout=log, stderr=subprocess.STDOUT))
+        self.processes.append(subprocess.Popen([
+            sys.executable, str(fake_upstreams_path), "pinecone", "--port", str(self.pinecone_port),
+            "--query-latency", str(args.query_latency),
+        ], stdout=log, stderr=subprocess.STDOUT))
+
+        env = dict(os.environ)
+        env.update({
+            "OPENAI_API_KEY": "bench",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{self.openai_port}/v1",
+            "PINECONE_API_KEY": "bench",
+            "PINECONE_INDEX_HOST": f"http://127.0.0.1:{self.pinecone_port}",
+            "RETRIEVER_BACKEND": "pinecone",
+            "GOOGLE_SHEETS_WEB_URL": f"http://127.0.0.1:{self.openai_port}/contacts",
+            # Keep the run's local state out of the working tree
+            "CONTENT_STORE_PATH": os.path.join(self.workdir, "content_store.sqlite3"),
+            "LEXICAL_INDEX_PATH": os.path.join(self.workdir, "lexical_index.json"),
+            "CONTACT_SPILL_PATH": os.path.join(self.workdir, "contact_spill.jsonl"),
+            "EMBEDDING_CACHE_PATH": "",
+        })
+        if args.workers > 1:
+            # Pre-forked workers through main.py, sharing conversations in SQLite by default
+            env.update({
+                "WEB_CONCURRENCY": str(args.workers),
+                "HOST": "127.0.0.1",
+                "PORT": str(self.app_port),
+                "CONVERSATION_STORE_BACKEND": "sqlite",
+                "CONVERSATION_STORE_PATH": os.path.join(self.workdir, "conversations.sqlite3"),
+            })
+        env.update(dict(item.split("=", 1) for item in args.env))
+        if args.workers > 1:
+            command = [sys.executable, "main.py"]
+        else:
+            command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                       "--port", str(self.app_port), "--log-level", "warning", "--no-access-log"]
+        self.app = subprocess.Popen(command, cwd=backend_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        self.processes.append(self.app)
+
+    async def wait_ready(self, timeout: float = 60.0) -> None:
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as client:
+            while True:
+                if self.app.poll() is not None:
+                    raise RuntimeError(f"App exited with code {self.app.returncode}; see {self.workdir}/servers.log")
+                try:
+                    response = await client.get(f"{self.base_url}/ready")
+                    if response.status_code == 200:
+                        return
+                except httpx.HTTPError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"App not ready after {timeout}s; see {self.workdir}/servers.log")
+                await asyncio.sleep(0.2)
+
+    async def upstream_stats(self) -> Dict[str, Any]:
+        stats = {}
+        async with httpx.AsyncClient() as client:
+            for name, port in (("openai", self.openai_port), ("pinecone", self.pinecone_port)):
+                try:
+                    stats[name] = (await client.get(f"http://127.0.0.1:{port}/stats")).json()
+                except httpx.HTTPError as e:
+                    stats[name] = {"error": str(e)}
+        return stats
+
+    def stop(self) -> None:
+        for process in reversed(self.processes):
+            if process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+async def chat_request(client: httpx.AsyncClient, base_url: str, endpoint: str, kind: str,
+                       message: str, conversation_id: Optional[str]) -> Tuple[RequestResult, Optional[str]]:
+    """Send one chat message and time the NDJSON stream frame by frame."""
+    result = RequestResult(endpoint, kind)
+    body = {"message": message}
+    if conversation_id:
+        body["conversation_id"] = conversation_id
+    started = time.perf_counter()
+    last_frame = None
+    try:
+        async with client.stream("POST", base_url + endpoint, json=body) as response:
+            result.status = response.status_code
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                frame = json.loads(line)
+                now = time.perf_counter()
+                if "conversation_id" in frame:
+                    conversation_id = frame["conversation_id"]
+                elif "error" in frame:
+                    result.error = frame["error"]
+                elif "message" in frame:
+                    if result.ttft is None:
+                        result.ttft = now - started
+                    else:
+                        result.gaps.append(now - last_frame)
+                    last_frame = now
+                    result.frames += 1
+                    result.chars += len(frame["message"])
+        if result.status != 200 and result.error is None:
+            result.error = f"HTTP {result.status}"
+    except (httpx.HTTPError, ValueError) as e:
+        result.error = f"{type(e).__name__}: {e}"
+    result.latency = time.perf_counter() - started
+    return result, conversation_id
+
+async def run_session(client: httpx.AsyncClient, base_url: str, endpoint: str, turns: int,
+                      rng: random.Random, think_time: float) -> List[RequestResult]:
+    """One synthetic visitor: an opener, then questions with the odd bit of small talk."""
+    results = []
+    conversation_id = None
+    for turn in range(turns):
+        if turn == 0:
+            kind, message = "opener", rng.choice(openers)
+        elif rng.random() < 0.2:
+            kind, message = "small_talk", rng.choice(small_talk)
+        else:
+            kind, message = "question", rng.choice(questions)
+        result, conversation_id = await chat_request(client, base_url, endpoint, kind, message, conversation_id)
+        results.append(result)
+        if result.error or not conversation_id:
+            break
+        if think_time:
+            await asyncio.sleep(rng.uniform(0, 2 * think_time))
+    return results
+
+def summarize(results: List[RequestResult], duration: float) -> Dict[str, Any]:
+    ok = [result for result in results if result.error is None]
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "throughput_rps": round(len(ok) / duration, 2) if duration else None,
+        "chars_per_s": round(sum(result.chars for result in ok) / duration, 1) if duration else None,
+        "latency_ms": percentiles([result.latency for result in ok]),
+        "ttft_ms": percentiles([result.ttft for result in ok if result.ttft is not None]),
+        "inter_token_ms": percentiles([gap for result in ok for gap in result.gaps]),
+        "frames_per_response": round(sum(result.frames for result in ok) / len(ok), 2) if ok else None,
+    }
+
+async def sample_memory(pid: int, samples: List[Dict[str, float]], started: float, interval: float) -> None:
+    while True:
+        rss = rss_bytes(pid)
+        if rss is not None:
+            samples.append({"t": round(time.perf_counter() - started, 2), "rss_mb": round(rss / 2**20, 2)})
+        await asyncio.sleep(interval)
+
+async def run_load(args, servers: ServerProcesses) -> Dict[str, Any]:
+    endpoints = ["/chat", "/v2/chat"] if args.endpoint == "both" else [args.endpoint]
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    timeout = httpx.Timeout(args.request_timeout)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        # Warm-up sessions are not measured
+        warm_rng = random.Random(args.seed - 1)
+        await asyncio.gather(*(run_session(client, servers.base_url, endpoints[i % len(endpoints)], 2, warm_rng, 0)
+                               for i in range(args.warmup_sessions)))
+
+        rss_start = rss_bytes(servers.app.pid)
+        memory_samples: List[Dict[str, float]] = []
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def bounded(i: int) -> List[RequestResult]:
+            async with semaphore:
+                rng = random.Random(args.seed * 100003 + i)
+                return await run_session(client, servers.base_url, endpoints[i % len(endpoints)],
+                                         args.turns, rng, args.think_time)
+
+        started = time.perf_counter()
+        sampler = asyncio.create_task(sample_memory(servers.app.pid, memory_samples, started, 0.5))
+        sessions = await asyncio.gather(*(bounded(i) for i in range(args.sessions)))
+        duration = time.perf_counter() - started
+        sampler.cancel()
+        rss_end = rss_bytes(servers.app.pid)
+
+    results = [result for session in sessions for result in session]
+    report = {"duration_s": round(duration, 2), "summary": summarize(results, duration), "endpoints": {}, "kinds": {}}
+    for endpoint in endpoints:
+        report["endpoints"][endpoint] = summarize([r for r in results if r.endpoint == endpoint], duration)
+    for kind in ("opener", "question", "small_talk"):
+        report["kinds"][kind] = summarize([r for r in results if r.kind == kind], duration)
+    errors = sorted({result.error for result in results if result.error})
+    report["error_samples"] = errors[:10]
+    peak = max((sample["rss_mb"] for sample in memory_samples), default=None)
+    report["memory"] = {
+        "rss_start_mb": round(rss_start / 2**20, 2) if rss_start is not None else None,
+        "rss_end_mb": round(rss_end / 2**20, 2) if rss_end is not None else None,
+        "rss_peak_mb": peak,
+        "growth_mb": round((rss_end - rss_start) / 2**20, 2) if rss_start is not None and rss_end is not None else None,
+        "samples": memory_samples,
+    }
+    return report
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=backend_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Metrics shown by --compare, as (label, path into the report, True if higher is better)
+compared_metrics = [
+    ("throughput (req/s)", ("summary", "throughput_rps"), True),
+    ("streamed chars/s", ("summary", "chars_per_s"), True),
+    ("errors", ("summary", "errors"), False),
+    ("latency p50 (ms)", ("summary", "latency_ms", "p50"), False),
+    ("latency p95 (ms)", ("summary", "latency_ms", "p95"), False),
+    ("latency p99 (ms)", ("summary", "latency_ms", "p99"), False),
+    ("TTFT p50 (ms)", ("summary", "ttft_ms", "p50"), False),
+    ("TTFT p95 (ms)", ("summary", "ttft_ms", "p95"), False),
+    ("TTFT p99 (ms)", ("summary", "ttft_ms", "p99"), False),
+    ("inter-token p50 (ms)", ("summary", "inter_token_ms", "p50"), False),
+    ("inter-token p95 (ms)", ("summary", "inter_token_ms", "p95"), False),
+    ("memory growth (MB)", ("memory", "growth_mb"), False),
+]
+
+def lookup(report: Dict[str, Any], path) -> Optional[float]:
+    for key in path:
+        if not isinstance(report, dict):
+            return None
+        report = report.get(key)
+    return report
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    header = f"{'metric':<24}{'value':>12}"
+    if baseline:
+        header += f"{'baseline':>12}{'change':>10}"
+        print(f"Comparing {report['meta']['git_commit']} with baseline {baseline.get('meta', {}).get('git_commit')}")
+    print(header)
+    for label, path, higher_is_better in compared_metrics:
+        value = lookup(report, path)
+        line = f"{label:<24}{'-' if value is None else value:>12}"
+        if baseline:
+            before = lookup(baseline, path)
+            change = ""
+            if isinstance(value, (int, float)) and isinstance(before, (int, float)) and before:
+                delta = (value - before) / abs(before) * 100
+                worse = delta < 0 if higher_is_better else delta > 0
+                change = f"{delta:+.1f}%{' !' if worse and abs(delta) >= 10 else ''}"
+            line += f"{'-' if before is None else before:>12}{change:>10}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test /chat and /v2/chat against local fake OpenAI and Pinecone servers.")
+    parser.add_argument("--sessions", type=int, default=40, help="synthetic conversations to run (default: %(default)s)")
+    parser.add_argument("--concurrency", type=int, default=10, help="conversations in flight at once (default: %(default)s)")
+    parser.add_argument("--turns", type=int, default=4, help="messages per conversation (default: %(default)s)")
+    parser.add_argument("--endpoint", choices=["both", "/chat", "/v2/chat"], default="both")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between turns in seconds")
+    parser.add_argument("--warmup-sessions", type=int, default=4, help="unmeasured sessions run first")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for the app (pre-forked by main.py when > 1)")
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--first-token-latency", type=float, default=0.3, help="fake OpenAI seconds to first token")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="fake OpenAI streamed tokens per second")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="fake OpenAI seconds per embeddings call")
+    parser.add_argument("--completion-latency", type=float, default=0.4, help="fake OpenAI seconds per non-streamed completion")
+    parser.add_argument("--query-latency", type=float, default=0.03, help="fake Pinecone seconds per query")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="extra environment for the app, e.g. --env INTENT_ROUTER_ENABLED=false")
+    parser.add_argument("--output", default=None, help="result file (default: benchmark_results/<commit>-<time>.json)")
+    parser.add_argument("--compare", default=None, help="earlier result file to compare against")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    output = args.output or os.path.join(
+        backend_dir, "benchmark_results", f"{commit or 'unknown'}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+
+    servers = ServerProcesses(args)
+    servers.start()
+    try:
+        asyncio.run(servers.wait_ready())
+        print(f"Running {args.sessions} sessions x {args.turns} turns, {args.concurrency} concurrent, against {servers.base_url}")
+        report = asyncio.run(run_load(args, servers))
+        report["upstream_calls"] = asyncio.run(servers.upstream_stats())
+    finally:
+        servers.stop()
+    # Server logs and local state are only kept when the run fails
+    shutil.rmtree(servers.workdir, ignore_errors=True)
+
+    report["meta"] = {
+        "git_commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    print(f"Results written to {output}")
+    if report["summary"]["errors"]:
+        print(f"{report['summary']['errors']} requests failed, e.g. {report['error_samples'][0]}")
+
+if __name__ == "__main__":
+    main()
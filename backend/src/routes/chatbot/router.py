@@ -1,41 +1,43 @@
 import os
-import openai
-from pinecone import Pinecone
+import time
+import asyncio
 from dotenv import load_dotenv
-from fastapi import APIRouter, HTTPException, Body, Depends
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Body, Depends, Query, Request, Response
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from uuid import uuid4, UUID
 from datetime import datetime
 import re
-import requests
 import json
+from src.utils.embedding_cache import embedding_cache, normalize_query
+from src.utils.single_flight import embedding_flight, retrieval_flight
+from src.utils.answer_cache import answer_cache, context_key_for_matches
+from src.utils.context_builder import build_context, clamp_top_k
+from src.utils.retriever import retriever
+from src.utils.content_store import content_store
+from src.utils.lexical_index import lexical_index, reciprocal_rank_fusion
+from src.utils.intent_router import intent_router
+from src.utils.contact_logger import contact_logger
+from src.utils.conversation_store import StoredMessage, create_conversation_store, decode_cursor, encode_cursor, iter_conversations
+from src.utils.conversation_memory import conversation_memory, message_tokens
+from src.utils.stream_writer import StreamWriter, NDJSON, completion_deltas, dumps, frame, frames, stream_format, streaming_response
+from src.utils.stream_buffer import create_stream_buffers
+from src.utils.admission import Overloaded, Turn, conversation_turns, embedding_limiter, llm_limiter
+from src.utils.services import services
+from src.utils.telemetry import add_tokens, log, stage, timed_stream, upstream_error
 
 # Load environment variables
 load_dotenv()
 
-# Set up credentials
-openai_api_key = os.getenv("OPENAI_API_KEY")
-pinecone_api_key = os.getenv("PINECONE_API_KEY")
-google_sheets_web_url=os.getenv("GOOGLE_SHEETS_WEB_URL")
-
-# Initialize OpenAI client
-client = openai.OpenAI(api_key=openai_api_key)
-
-# Initialize Pinecone
-pc = Pinecone(api_key=pinecone_api_key)
-
-# Connect to the existing index
-index_name = "paloma"  # Paloma index as requested
-index = pc.Index(index_name)
-
 # Initialize router
 router = APIRouter()
 
-# In-memory storage for chat history
-# Structure: {conversation_id: [{"role": "user/assistant", "content": "message", "timestamp": datetime}]}
-chat_history = {}
+# Chat history, kept in this process or in a store shared by all workers
+# Structure: {conversation_id: Conversation(messages=[StoredMessage(role, content, timestamp)])}
+chat_history = create_conversation_store("v1")
+services.conversation_stores.append(chat_history)
+stream_buffers = create_stream_buffers("v1")
+services.stream_buffers.append(stream_buffers)
 
 # Define request and response models
 class Message(BaseModel):
@@ -47,6 +49,14 @@ class ChatSession(BaseModel):
     conversation_id: UUID
     messages: List[Message]
 
+class ConversationSummary(BaseModel):
+    conversation_id: UUID
+    last_active: datetime
+
+class ConversationPage(BaseModel):
+    conversations: List[ConversationSummary]
+    next_cursor: Optional[str] = None  # pass back as ``cursor`` for the next page; None on the last page
+
 class QueryRequest(BaseModel):
     message: str
     first_name: Optional[str] = None
@@ -64,74 +74,85 @@ class QueryResponse(BaseModel):
     sources: Dict[str, List[PageInfo]]
     conversation_id: UUID
 
-def log_user_contact(first_name: str, phone_number: str, message: str):
-    url = google_sheets_web_url  # Replace with your Google Apps Script web app URL
-    data = {
-        "firstName": first_name,
-        "phoneNumber": phone_number,
-        "message": message
-    }
-
-    response = requests.post(url, data=data)
-
-    if response.status_code == 200:
-        print(f"Contact information for {first_name} logged successfully")
-    else:
-        print("Failed to log contact information")
+def log_user_contact(first_name: str, phone_number: str, message: str, conversation_id: Optional[str] = None):
+    """Queue the contact for the Google Sheets web app; never waits on the sink."""
+    contact_logger.log(first_name, message, phone_number=phone_number, conversation_id=conversation_id)
 
-def get_text_embedding(text: str) -> List[float]:
+async def get_text_embedding(text: str) -> List[float]:
     """Get OpenAI embedding for text."""
     if not text.strip():
         return []
     
+    model = "text-embedding-3-small"
+    cached = await embedding_cache.get(text, model)
+    if cached is not None:
+        return cached
+    
+    # Identical queries arriving together share one embeddings call
+    with stage("embedding"):
+        return await embedding_flight.run((model, normalize_query(text)), lambda: fetch_text_embedding(text, model))
+
+async def fetch_text_embedding(text: str, model: str) -> List[float]:
+    """Call the embeddings API and cache the result; returns [] on failure."""
     try:
-        response = client.embeddings.create(
-            input=text,
-            model="text-embedding-3-small"
-        )
-        return [float(x) for x in response.data[0].embedding]  # Ensure all values are float
+        async with embedding_limiter.slot():
+            response = await services.openai.embeddings.create(
+                input=text,
+                model=model
+            )
+        embedding = [float(x) for x in response.data[0].embedding]  # Ensure all values are float
+        await embedding_cache.set(text, model, embedding)
+        return embedding
+    except Overloaded:
+        raise
     except Exception as e:
-        print(f"Error getting text embedding: {e}")
+        upstream_error("openai_embeddings", e)
+        log(f"Error getting text embedding: {e}")
         return []
 
-def query_pinecone(query_text: str, top_k: int = 10) -> List[Dict[str, Any]]:
-    """Query Pinecone for similar content based on text query."""
-    query_embedding = get_text_embedding(query_text)
-    
-    if not query_embedding:
-        raise HTTPException(status_code=500, detail="Failed to generate embedding for the query text.")
-    
-    try:
-        results = index.query(
-            vector=query_embedding,
-            top_k=top_k,
-            include_metadata=True
-        )
-        return results.get('matches', [])
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error querying Pinecone: {str(e)}")
+async def query_pinecone(query_text: str, top_k: int = 10) -> Tuple[List[Dict[str, Any]], Optional[List[float]]]:
+    """Query the vector index (Pinecone or local) and the BM25 index, fused by reciprocal rank.
 
-def extract_context_from_matches(matches: List[Dict[str, Any]]) -> str:
-    """Extract and format context from the search matches."""
-    if not matches:
-        return "No relevant information found."
-    
-    context_parts = []
-    
-    for match in matches:
-        metadata = match.get('metadata', {})
-        score = match.get('score', 0)
-        file_name = metadata.get('filename', 'Unknown file')
-        page_num = metadata.get('page', 0) + 1
-        content = metadata.get('content', '')
+    Returns the matches and the query embedding. The embedding is None when a
+    clear-cut keyword hit answered the query without calling the embeddings API.
+    """
+    with stage("lexical"):
+        lexical_matches = lexical_index.search(query_text, top_k) if lexical_index is not None else []
+    if lexical_matches and lexical_index.is_confident(query_text, lexical_matches):
+        log(f"Lexical fast path: {lexical_matches[0]['id']}")
+        matches = reciprocal_rank_fusion([lexical_matches], top_k)
+        query_embedding = None
+    else:
+        query_embedding = await get_text_embedding(query_text)
         
-        # Format the context part with file name as the primary identifier
-        context_part = f"[{file_name} (Page {page_num}, relevance: {score:.2f})]\n{content}\n"
-        context_parts.append(context_part)
+        if not query_embedding:
+            raise HTTPException(status_code=500, detail="Failed to generate embedding for the query text.")
+        
+        try:
+            with stage("retrieval"):
+                matches = list(await retrieval_flight.run(
+                    (normalize_query(query_text), top_k), lambda: retriever.query(query_embedding, top_k)))
+        except Exception as e:
+            upstream_error("vector_index", e)
+            raise HTTPException(status_code=500, detail=f"Error querying Pinecone: {str(e)}")
+        if lexical_matches:
+            matches = reciprocal_rank_fusion([matches, lexical_matches], top_k)
     
-    return "\n".join(context_parts)
+    # Chunk text is kept out of the index metadata; fill it in from the local store, off the event loop
+    if content_store is not None:
+        with stage("hydrate"):
+            await asyncio.to_thread(content_store.hydrate, matches)
+    return matches, query_embedding
 
-def generate_chat_response(query: str, context: str,  conversation_id: str, conversation_history: List[Dict[str, str]] = None) -> str:
+def extract_context_from_matches(matches: List[Dict[str, Any]]) -> str:
+    """Extract and format context from the search matches within the context token budget."""
+    with stage("context"):
+        result = build_context(matches)
+    add_tokens("context", result.tokens)
+    log(f"Context for this turn: {result.summary()}")
+    return result.text
+
+async def generate_chat_response(query: str, context: str,  conversation_id: str, conversation_history: List[Dict[str, str]] = None, query_embedding: List[float] = None, context_key: str = None, fmt: str = NDJSON) -> str:
     """Generate a conversational response using OpenAI's chat model with conversation history."""
     system_prompt = """
     You're a marketing assistant for *Paloma The Grandeur, a luxurious real estate project in Kanpur by **Paloma Realty*. Your task is to answer all questions in a way that highlights the positive aspects of Paloma The Grandeur. Ensure the responses are informative, engaging, to the point and always showcase the premium nature of the property.
@@ -152,37 +173,75 @@ def generate_chat_response(query: str, context: str,  conversation_id: str, conv
     # Initialize messages with system prompt
     messages = [{"role": "system", "content": system_prompt}]
     
-    # Add conversation history if available (limited to last 10 messages to avoid token limits)
+    # Add conversation history if available (already fitted to the memory token budget)
     if conversation_history:
-        for msg in conversation_history[-10:]:
+        for msg in conversation_history:
             messages.append({"role": msg["role"], "content": msg["content"]})
     
     # Add current query with context
     messages.append({"role": "user", "content": f"Context information is below:\n\n{context}\n\nQuestion: {query}"})
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini", # You can use "gpt-4o" for better responses
-            messages=messages,
-            temperature=0.3,  # Lower temperature for more factual responses
-            max_tokens=1000,
-            stream=True
-        )            
-        conversation_id_response = {"conversation_id": conversation_id}
-        yield json.dumps(conversation_id_response) + "\n" 
-        
-        fullResponse = ""  # Initialize variable to store complete response
+        # The LLM slot is held for the call and its whole stream
+        async with llm_limiter.slot():
+            llm_started = time.perf_counter()
+            response = await services.openai.chat.completions.create(
+                model="gpt-4o-mini", # You can use "gpt-4o" for better responses
+                messages=messages,
+                temperature=0.3,  # Lower temperature for more factual responses
+                max_tokens=1000,
+                stream=True
+            )            
+            writer = StreamWriter(fmt)
+            yield writer.event({"conversation_id": conversation_id})
         
-        for chunk in response:
-            if chunk.choices[0].delta.content:
-                data = {"message": chunk.choices[0].delta.content}
-                fullResponse += chunk.choices[0].delta.content  # Append to full response
-                yield json.dumps(data) + "\n"  # Send each chunk as a separate JSON object
+            # Tokens are coalesced into larger writes; the writer also keeps the full response
+            async for data in writer.messages(timed_stream(completion_deltas(response), llm_started)):
+                yield data
+        fullResponse = writer.text
             
-        conversation = chat_history.get(conversation_id, [])
-        conversation.append(Message(role="assistant", content=fullResponse, timestamp=datetime.now()))
+        await chat_history.append(conversation_id, "assistant", fullResponse)
+        
+        # Remember the answer so paraphrases over the same context can be replayed
+        if query_embedding and context_key:
+            answer_cache.add("v1", query_embedding, context_key, fullResponse)
                     
+    except Overloaded:
+        raise
+    except Exception as e:
+        upstream_error("openai_chat", e)
+        raise HTTPException(status_code=500, detail=f"Error generating chat response: {str(e)}")
+
+async def generate_small_talk_response(conversation_id: str, conversation_history: List[Dict[str, str]] = None, fmt: str = NDJSON):
+    """Reply to greetings, thanks, acknowledgements and goodbyes from a short prompt, without retrieval."""
+    system_prompt = """
+    You're a marketing assistant for *Paloma The Grandeur, a luxurious real estate project in Kanpur by **Paloma Realty*.
+
+    The user's latest message is small talk (a greeting, thanks, an acknowledgement or a goodbye). Reply warmly in one or two short sentences, in a friendly, professional tone, and invite them to ask about Paloma The Grandeur when it fits. Do not state any facts about the project.
+"""
+    # The history already ends with the user's latest message
+    messages = [{"role": "system", "content": system_prompt}] + (conversation_history or [])
+    
+    try:
+        # The LLM slot is held for the call and its whole stream
+        async with llm_limiter.slot():
+            llm_started = time.perf_counter()
+            response = await services.openai.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=messages,
+                temperature=0.5,
+                max_tokens=120,
+                stream=True
+            )
+            writer = StreamWriter(fmt)
+            yield writer.event({"conversation_id": conversation_id})
+            async for data in writer.messages(timed_stream(completion_deltas(response), llm_started)):
+                yield data
+        await chat_history.append(conversation_id, "assistant", writer.text)
+    except Overloaded:
+        raise
     except Exception as e:
+        upstream_error("openai_chat", e)
         raise HTTPException(status_code=500, detail=f"Error generating chat response: {str(e)}")
 
 def format_sources(matches: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
@@ -192,7 +251,7 @@ def format_sources(matches: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, An
     sources = {}
     
     for match in matches:
-        metadata = match.get('metadata', {})
+        metadata = (match.get('metadata') or {})
         score = match.get('score', 0)
         file_name = metadata.get('filename', 'Unknown file')
         page_num = metadata.get('page', 0) + 1
@@ -214,10 +273,20 @@ def format_sources(matches: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, An
     return sources
 
 @router.post("/chat")
-async def chat_with_documents(request: QueryRequest):
+async def chat_with_documents(request: QueryRequest, http_request: Request):
     """API endpoint to chat with document content - handles both initial and follow-up queries."""
+    # Turns of one conversation run one at a time; LLM slots are taken only around the calls themselves
+    turn = await conversation_turns.begin(request.conversation_id)
+    try:
+        return await answer_query(request, http_request, turn)
+    finally:
+        turn.close()
+
+async def answer_query(request: QueryRequest, http_request: Request, turn: Turn):
+    """Answer one message; streamed answers hold ``turn`` until they finish."""
     query = request.message
-    top_k = request.top_k
+    fmt = stream_format(http_request.headers.get("accept"))
+    top_k = clamp_top_k(request.top_k)
     conversation_id = request.conversation_id
     
     # Check if this is a new conversation or continuation
@@ -226,49 +295,71 @@ async def chat_with_documents(request: QueryRequest):
     # If new conversation, create a new ID and check for contact info
     if is_new_conversation:
         conversation_id = str(uuid4())
-        chat_history[conversation_id] = []
+        await chat_history.create(conversation_id)
         message=request.message
         
         # Log contact info if provided
         if request.first_name and request.phone_number and message:
-            log_user_contact(request.first_name, request.phone_number,message)
+            with stage("contact_log"):
+                log_user_contact(request.first_name, request.phone_number, message, conversation_id)
     else:
         conversation_id = str(request.conversation_id)
-        # For existing conversation, verify the ID exists
-        if conversation_id not in chat_history:
-            return StreamingResponse(
-                iter([json.dumps({
-                    "error": "Conversation not found. Please start a new conversation without providing a conversation_id."
-                }) + "\n"]), 
-                media_type="text/event-stream"
-            )
     
-    # Get conversation history
-    conversation = chat_history[conversation_id]
+    # Add the current query to history; this also verifies an existing ID
+    if not await chat_history.append(conversation_id, "user", query):
+        return streaming_response(
+            iter(frames(fmt, {
+                "error": "Conversation not found. Please start a new conversation without providing a conversation_id."
+            })), 
+            fmt
+        )
     
-    # Add the current query to history
-    current_time = datetime.now()
-    conversation.append(Message(role="user", content=query, timestamp=current_time))
+    try:
+        return await answer_turn(query, conversation_id, fmt, top_k, turn)
+    except Overloaded:
+        # Shed before any answer went out; undo this turn's writes so a retry starts from the same history
+        if is_new_conversation:
+            await chat_history.delete(conversation_id)
+        else:
+            await chat_history.remove_last(conversation_id, "user", query)
+        raise
+
+async def answer_turn(query: str, conversation_id: str, fmt: str, top_k: int, turn: Turn):
+    """Answer a message already added to the conversation; raises Overloaded if the turn is shed."""
+    # Get conversation history (read after the append; shared stores return snapshots)
+    conversation = await chat_history.get(conversation_id)
+    
+    # Recent history within the token budget, older turns folded into a rolling summary
+    with stage("history"):
+        openai_conversation_format = conversation_memory.history(conversation_id, conversation.messages, services.openai)
+    add_tokens("history", sum(message_tokens(msg["content"]) for msg in openai_conversation_format))
     
-    # Convert conversation history to format needed by OpenAI
-    openai_conversation_format = [
-        {"role": msg.role, "content": msg.content} 
-        for msg in conversation
-    ]
+    # Greetings, thanks and name replies need no documents; answer them from a short prompt
+    previous_assistant = next((msg.content for msg in reversed(conversation.messages) if msg.role == "assistant"), None)
+    with stage("intent"):
+        intent = await intent_router.classify(query, previous_assistant, get_text_embedding)
+    if not intent.needs_retrieval:
+        return await stream_buffers.stream(
+            turn.stream(generate_small_talk_response(conversation_id, openai_conversation_format, fmt)),
+            fmt
+        )
+    
+    # A "yes please" to an offer is answered as the offer it accepts
+    question = intent.query or query
     
     # Query Pinecone for relevant matches
-    matches = query_pinecone(query, top_k)
+    matches, query_embedding = await query_pinecone(question, top_k)
     
     if not matches:
         answer = "I couldn't find any relevant information in the documents to answer your question."
         # Add assistant's response to history
-        conversation.append(Message(role="assistant", content=answer, timestamp=datetime.now()))
-        return StreamingResponse(
-            iter([
-                json.dumps({"conversation_id": conversation_id}) + "\n",
-                json.dumps({"message": answer}) + "\n"
-                ]),
-            media_type="text/event-stream"
+        await chat_history.append(conversation_id, "assistant", answer)
+        return streaming_response(
+            iter(frames(fmt,
+                {"conversation_id": conversation_id},
+                {"message": answer}
+                )),
+            fmt
         )
         return {
             "answer": answer,
@@ -276,12 +367,28 @@ async def chat_with_documents(request: QueryRequest):
             "conversation_id": conversation_id
         }
     
+    # Replay a cached answer if a near-identical question was asked over the same context and
+    # earlier messages (not possible on the lexical fast path, which skips the query embedding)
+    context_key = context_key_for_matches(matches, openai_conversation_format[:-1])
+    with stage("answer_cache"):
+        cached_answer = answer_cache.lookup("v1", query_embedding, context_key) if query_embedding else None
+    if cached_answer is not None:
+        await chat_history.append(conversation_id, "assistant", cached_answer)
+        return streaming_response(
+            iter(frames(fmt,
+                {"conversation_id": conversation_id},
+                {"message": cached_answer}
+                )),
+            fmt
+        )
+    
     # Extract context from matches
     context = extract_context_from_matches(matches)
 
-    return StreamingResponse(
-        generate_chat_response(query, context, conversation_id, openai_conversation_format), 
-        media_type="text/event-stream"
+    # Generated in the background and buffered, so a dropped client can resume the stream
+    return await stream_buffers.stream(
+        turn.stream(generate_chat_response(question, context, conversation_id, openai_conversation_format, query_embedding, context_key, fmt)),
+        fmt
     )
     
     # Add assistant's response to history
@@ -296,27 +403,61 @@ async def chat_with_documents(request: QueryRequest):
         "conversation_id": conversation_id
     }
 
+@router.get("/chat/streams/{stream_id}")
+async def resume_chat_stream(stream_id: str, offset: int = Query(0, ge=0)):
+    """Resume a streamed answer after the first ``offset`` frames, from the buffer or the running generation."""
+    return await stream_buffers.resume(stream_id, offset)
+
+@router.get("/conversations/export")
+async def export_conversations(active_after: Optional[datetime] = None, active_before: Optional[datetime] = None):
+    """Stream whole conversations as NDJSON, one per line, loading them one at a time."""
+    active_after = active_after.timestamp() if active_after else None
+    active_before = active_before.timestamp() if active_before else None
+    
+    async def records():
+        async for conversation_id, conversation in iter_conversations(chat_history, active_after, active_before):
+            yield frame(conversation.to_record(conversation_id))
+    
+    return streaming_response(records())
+
 @router.get("/conversations/{conversation_id}", response_model=ChatSession)
 async def get_conversation(conversation_id: UUID):
     """Retrieve a conversation by ID."""
-    if conversation_id not in chat_history:
+    conversation = await chat_history.get(conversation_id)
+    if conversation is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
+    # Serialized directly; validating every message through the response model is slow for long chats
+    return Response(content=dumps({
+        "conversation_id": str(conversation_id),
+        "messages": [msg.to_json() for msg in list(conversation.messages)]
+    }), media_type="application/json")
+
+@router.get("/conversations", response_model=ConversationPage)
+async def list_conversations(limit: int = Query(100, ge=1, le=1000), cursor: Optional[str] = None,
+                             active_after: Optional[datetime] = None, active_before: Optional[datetime] = None):
+    """List conversations by last activity, oldest first, a page at a time."""
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rows = await chat_history.page(limit + 1, after,
+                                   active_after.timestamp() if active_after else None,
+                                   active_before.timestamp() if active_before else None)
+    next_cursor = encode_cursor((rows[limit - 1][1], rows[limit - 1][0])) if len(rows) > limit else None
     return {
-        "conversation_id": conversation_id,
-        "messages": chat_history[conversation_id]
+        "conversations": [
+            {"conversation_id": conversation_id, "last_active": datetime.fromtimestamp(last_active)}
+            for conversation_id, last_active in rows[:limit]
+        ],
+        "next_cursor": next_cursor,
     }
 
-@router.get("/conversations", response_model=List[UUID])
-async def list_conversations():
-    """List all available conversation IDs."""
-    return list(chat_history.keys())
-
 @router.delete("/conversations/{conversation_id}")
 async def delete_conversation(conversation_id: UUID):
     """Delete a conversation by ID."""
-    if conversation_id not in chat_history:
+    if not await chat_history.delete(conversation_id):
         raise HTTPException(status_code=404, detail="Conversation not found")
+    conversation_memory.forget(conversation_id)
     
-    del chat_history[conversation_id]
     return {"status": "success", "message": f"Conversation {conversation_id} deleted"}
\ No newline at end of file
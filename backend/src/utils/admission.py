@@ -0,0 +1,187 @@
+import os
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+load_dotenv()
+
+# Limits per worker process, overridable from the environment; a concurrency of 0 means unlimited
+llm_max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+llm_max_queue = int(os.getenv("LLM_MAX_QUEUE", "64"))
+llm_queue_timeout = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))  # seconds
+embedding_max_concurrency = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "16"))
+embedding_max_queue = int(os.getenv("EMBEDDING_MAX_QUEUE", "128"))
+embedding_queue_timeout = float(os.getenv("EMBEDDING_QUEUE_TIMEOUT", "5"))  # seconds
+conversation_turn_queue = int(os.getenv("CONVERSATION_TURN_QUEUE", "4"))
+conversation_turn_timeout = float(os.getenv("CONVERSATION_TURN_TIMEOUT", "30"))  # seconds
+
+class Overloaded(HTTPException):
+    """Raised instead of waiting when a limiter's queue is full (429) or the wait ran out (503)."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(status_code=status_code, detail=detail, headers={"Retry-After": str(retry_after)})
+
+class AdmissionLimiter:
+    """Caps concurrent work at ``max_concurrency`` with a bounded FIFO wait queue.
+
+    A caller that finds every slot taken waits in line, unless ``max_queue``
+    callers already are (429) or no slot frees up within ``queue_timeout``
+    seconds (503). Both carry a Retry-After estimated from how long slots
+    have recently been held. A released slot passes straight to the next
+    waiter, so late arrivals cannot overtake the queue.
+    """
+
+    def __init__(self, name: str, max_concurrency: int = 32, max_queue: int = 64, queue_timeout: float = 10):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.counts = {"admitted": 0, "queued": 0, "queue_full": 0, "timeout": 0}
+        self.hold_seconds = 1.0  # moving average of how long a slot is held
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> float:
+        """Take a slot, waiting in line if needed; returns the time it was taken, for ``release``."""
+        if self.max_concurrency <= 0 or (self.active < self.max_concurrency and not self._waiters):
+            self.active += 1
+            self.counts["admitted"] += 1
+            return time.monotonic()
+        if len(self._waiters) >= self.max_queue:
+            self.counts["queue_full"] += 1
+            raise Overloaded(429, f"Too many requests queued ({self.name}); please retry shortly.", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.counts["queued"] += 1
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except BaseException as e:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up; pass it on
+                self.release()
+            if isinstance(e, asyncio.TimeoutError):
+                self.counts["timeout"] += 1
+                raise Overloaded(503, f"Timed out in the queue ({self.name}); please retry shortly.", self.retry_after())
+            raise
+        self.counts["admitted"] += 1
+        return time.monotonic()
+
+    def release(self, taken: Optional[float] = None) -> None:
+        if taken is not None:
+            self.hold_seconds = 0.8 * self.hold_seconds + 0.2 * (time.monotonic() - taken)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # the slot changes hands; ``active`` stays the same
+                return
+        self.active = max(0, self.active - 1)
+
+    @asynccontextmanager
+    async def slot(self):
+        taken = await self.acquire()
+        try:
+            yield
+        finally:
+            self.release(taken)
+
+    def retry_after(self) -> int:
+        """Seconds until the queue has likely drained, between 1 and 60."""
+        slots = max(self.max_concurrency, 1)
+        return min(60, max(1, math.ceil(self.hold_seconds * (len(self._waiters) + 1) / slots)))
+
+    def stats(self) -> dict:
+        return {"active": self.active, "waiting": len(self._waiters), **self.counts}
+
+class Turn:
+    """Admissions held by one chat turn, released together when the turn is over.
+
+    A turn ends when the endpoint returns, unless it handed its answer stream
+    to ``stream``; then it ends when that stream does.
+    """
+
+    def __init__(self):
+        self._releases: List[Callable[[], None]] = []
+        self._streaming = False
+
+    async def admit(self, limiter: AdmissionLimiter) -> None:
+        taken = await limiter.acquire()
+        self._releases.append(lambda: limiter.release(taken))
+
+    def stream(self, frames: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        self._streaming = True
+        return self._follow(frames)
+
+    def close(self) -> None:
+        if not self._streaming:
+            self._release()
+
+    async def _follow(self, frames: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        try:
+            async for data in frames:
+                yield data
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        while self._releases:
+            self._releases.pop()()
+
+class ConversationTurns:
+    """Runs the turns of each conversation one at a time, in arrival order.
+
+    Each busy conversation gets a one-slot AdmissionLimiter, dropped again
+    once nobody holds or waits for it. This serializes turns within a worker
+    process; across workers the shared stores keep each append atomic.
+    """
+
+    def __init__(self, max_queue: int = 4, timeout: float = 30):
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._limiters: Dict[str, AdmissionLimiter] = {}
+
+    async def begin(self, conversation_id) -> Turn:
+        """Wait for the conversation's previous turn to finish.
+
+        Only the conversation is locked here; upstream calls take their own
+        limiter slots when (and if) the turn makes them.
+        """
+        turn = Turn()
+        if conversation_id is None:
+            return turn
+        key = str(conversation_id)
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            limiter = self._limiters[key] = AdmissionLimiter("conversation_turn", 1, self.max_queue, self.timeout)
+        # Releases run last-in first-out, so this runs after the conversation slot is freed
+        turn._releases.append(lambda: self._forget(key, limiter))
+        try:
+            await turn.admit(limiter)
+        except BaseException:
+            turn._release()
+            raise
+        return turn
+
+    def stats(self) -> dict:
+        return {"conversations": len(self._limiters),
+                "waiting": sum(limiter.waiting for limiter in self._limiters.values())}
+
+    def _forget(self, key: str, limiter: AdmissionLimiter) -> None:
+        if limiter.active == 0 and not limiter.waiting and self._limiters.get(key) is limiter:
+            del self._limiters[key]
+
+# Shared by both chatbot routers
+llm_limiter = AdmissionLimiter("llm", llm_max_concurrency, llm_max_queue, llm_queue_timeout)
+embedding_limiter = AdmissionLimiter("embeddings", embedding_max_concurrency, embedding_max_queue, embedding_queue_timeout)
+conversation_turns = ConversationTurns(conversation_turn_queue, conversation_turn_timeout)
@@ -0,0 +1,137 @@
+import os
+import time
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from src.utils.index_version import index_version_path, read_index_version
+
+load_dotenv()
+
+# Cache configuration, overridable from the environment
+answer_cache_threshold = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # cosine similarity
+answer_cache_size = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+answer_cache_ttl = float(os.getenv("ANSWER_CACHE_TTL", "86400"))  # seconds
+
+def context_key_for_matches(matches: List[Dict[str, Any]], history: Optional[List[Dict[str, str]]] = None) -> str:
+    """Fingerprint everything an answer was generated from besides the question.
+
+    That is the ids of the matches, in rank order, and the earlier messages
+    of the conversation (``history``, without the current question): a
+    follow-up like "tell me more" means something else in every conversation.
+    """
+    digest = hashlib.sha1("\n".join(str(match.get("id", "")) for match in matches).encode("utf-8"))
+    for message in history or []:
+        digest.update(f"\x00{message['role']}\x00{message['content']}".encode("utf-8"))
+    return digest.hexdigest()
+
+class SemanticAnswerCache:
+    """Replays stored answers for near-duplicate questions over the same context.
+
+    An entry matches when it was produced for the same namespace, retrieved
+    context and conversation history, and the cosine similarity between the query embeddings is at least
+    ``threshold``. The whole cache is dropped whenever the index version marker
+    written by the ingestion script changes.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_size: int = 512, ttl: float = 86400,
+                 version_path: str = index_version_path):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version_path = version_path
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[int, Tuple[str, str, np.ndarray, str, float]]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._version = read_index_version(version_path)
+        self._version_mtime = self._marker_mtime()
+
+    def lookup(self, namespace: str, query_embedding: List[float], context_key: str) -> Optional[str]:
+        vector = self._normalize(query_embedding)
+        if vector is None:
+            return None
+        now = time.time()
+        with self._lock:
+            self._check_version()
+            candidates = []
+            for entry_id, (entry_namespace, entry_context, entry_vector, answer, created) in list(self._entries.items()):
+                if now - created > self.ttl:
+                    del self._entries[entry_id]
+                    continue
+                if entry_namespace == namespace and entry_context == context_key:
+                    candidates.append((entry_id, entry_vector, answer))
+
+            if candidates:
+                similarities = np.stack([c[1] for c in candidates]) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    entry_id, _, answer = candidates[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return answer
+
+            self.misses += 1
+            return None
+
+    def add(self, namespace: str, query_embedding: List[float], context_key: str, answer: str) -> None:
+        vector = self._normalize(query_embedding)
+        if vector is None or not answer:
+            return
+        with self._lock:
+            self._check_version()
+            self._entries[self._next_id] = (namespace, context_key, vector, answer, time.time())
+            self._next_id += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "index_version": self._version,
+            }
+
+    def _marker_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.version_path).st_mtime
+        except OSError:
+            return None
+
+    def _check_version(self) -> None:
+        # A stat per call is cheap; only re-read the marker when it was touched
+        mtime = self._marker_mtime()
+        if mtime == self._version_mtime:
+            return
+        self._version_mtime = mtime
+        version = read_index_version(self.version_path)
+        if version != self._version:
+            self._version = version
+            self._entries.clear()
+            self.invalidations += 1
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> Optional[np.ndarray]:
+        if not embedding:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0:
+            return None
+        return vector / norm
+
+# Shared by both chatbot routers
+answer_cache = SemanticAnswerCache(answer_cache_threshold, answer_cache_size, answer_cache_ttl)
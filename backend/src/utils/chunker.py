@@ -0,0 +1,126 @@
+import os
+from statistics import median
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+from src.utils.tokens import load_encoding
+
+load_dotenv()
+
+# Chunking configuration, overridable from the environment
+chunk_mode = os.getenv("CHUNK_MODE", "tokens").lower()  # "tokens" or "page" (one vector per page)
+chunk_tokens = int(os.getenv("CHUNK_TOKENS", "256"))
+chunk_overlap = int(os.getenv("CHUNK_OVERLAP", "32"))
+chunk_layout = os.getenv("CHUNK_LAYOUT", "true").lower() == "true"  # heading-aware using PyMuPDF blocks
+heading_size_ratio = float(os.getenv("CHUNK_HEADING_SIZE_RATIO", "1.15"))
+
+# Tokenizer of the embedding model the chunks are sized for
+tokenizer_model = "text-embedding-3-small"
+
+# A page is a list of (text, font_size) blocks in reading order
+Block = Tuple[str, float]
+
+def find_headings(blocks: List[Block]) -> List[Tuple[str, bool]]:
+    """Mark short blocks set noticeably larger than the page's body text as headings."""
+    sizes = [size for text, size in blocks if size > 0 for _ in range(max(1, len(text) // 20))]
+    if not sizes:
+        return [(text, False) for text, _ in blocks]
+    body_size = median(sizes)
+    marked = []
+    for text, size in blocks:
+        is_heading = size >= body_size * heading_size_ratio and len(text) <= 120 and text.count("\n") <= 1
+        marked.append((text, is_heading))
+    return marked
+
+def split_sections(blocks: List[Block], layout: bool = True) -> List[Tuple[Optional[str], str]]:
+    """Group a page's blocks into (heading, body) sections; one section if layout is off."""
+    if not layout:
+        return [(None, "\n".join(text for text, _ in blocks))]
+    sections: List[Tuple[Optional[str], List[str]]] = []
+    for text, is_heading in find_headings(blocks):
+        if is_heading or not sections:
+            sections.append((" ".join(text.split()) if is_heading else None, [] if is_heading else [text]))
+        else:
+            sections[-1][1].append(text)
+    return [(heading, "\n".join(body)) for heading, body in sections]
+
+def chunk_page(blocks: List[Block], max_tokens: int = chunk_tokens, overlap: int = chunk_overlap,
+               layout: bool = chunk_layout) -> List[Dict[str, Any]]:
+    """Split one page into chunks of at most ``max_tokens`` tokens.
+
+    Small consecutive sections are packed into a chunk together, starting a
+    new chunk at a section boundary whenever the next section would not fit.
+    A section longer than ``max_tokens`` is cut into token windows that
+    overlap by ``overlap`` tokens, each prefixed with its section heading.
+    """
+    encoding = load_encoding(tokenizer_model)
+    overlap = max(0, min(overlap, max_tokens // 2))
+    chunks: List[Dict[str, Any]] = []
+    packed: List[str] = []
+    packed_tokens = 0
+    packed_heading: Optional[str] = None
+
+    def flush():
+        nonlocal packed, packed_tokens, packed_heading
+        if packed:
+            chunks.append({"text": "\n".join(packed), "heading": packed_heading, "tokens": packed_tokens})
+        packed, packed_tokens, packed_heading = [], 0, None
+
+    for heading, body in split_sections(blocks, layout):
+        text = f"{heading}\n{body}" if heading else body
+        if not text.strip():
+            continue
+        tokens = encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            if packed_tokens + len(tokens) > max_tokens:
+                flush()
+            if not packed:
+                packed_heading = heading
+            packed.append(text)
+            packed_tokens += len(tokens)
+            continue
+
+        # Oversized section: window the body, repeating the heading on every piece
+        flush()
+        prefix = f"{heading}\n" if heading else ""
+        prefix_tokens = len(encoding.encode(prefix)) if prefix else 0
+        window = max(32, max_tokens - prefix_tokens)
+        step = max(1, window - overlap)
+        body_tokens = encoding.encode(body)
+        for start in range(0, len(body_tokens), step):
+            piece = body_tokens[start:start + window]
+            chunks.append({
+                "text": prefix + encoding.decode(piece),
+                "heading": heading,
+                "tokens": prefix_tokens + len(piece),
+            })
+            if start + window >= len(body_tokens):
+                break
+    flush()
+    return chunks
+
+def chunk_records(filename: str, pages: Iterable[Tuple[int, List[Block]]], stats=None,
+                  mode: str = chunk_mode) -> Iterator[Dict[str, Any]]:
+    """Turn extracted pages into pipeline records, keeping page provenance on every chunk."""
+    for page_num, blocks in pages:
+        if mode == "page":
+            page_content = "\n".join(text for text, _ in blocks)
+            pieces = [{"id": f"{filename}_page_{page_num}_text", "text": page_content, "metadata": {}}]
+        else:
+            pieces = []
+            for chunk_num, chunk in enumerate(chunk_page(blocks)):
+                metadata = {"chunk": chunk_num, "tokens": chunk["tokens"]}
+                if chunk["heading"]:
+                    metadata["heading"] = chunk["heading"]
+                pieces.append({"id": f"{filename}_page_{page_num}_chunk_{chunk_num}", "text": chunk["text"], "metadata": metadata})
+
+        for piece in pieces:
+            if stats is not None:
+                stats.chunks += 1
+            piece["metadata"] = {
+                "type": "text",
+                "page": page_num,
+                "filename": filename,
+                "content": piece["text"],
+                **piece["metadata"],
+            }
+            yield piece
@@ -0,0 +1,253 @@
+import os
+import json
+import random
+import asyncio
+import httpx
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+google_sheets_web_url = os.getenv("GOOGLE_SHEETS_WEB_URL")
+
+# Queue, batching and retry behaviour, overridable from the environment
+contact_queue_size = int(os.getenv("CONTACT_QUEUE_SIZE", "1000"))
+contact_batch_size = int(os.getenv("CONTACT_BATCH_SIZE", "50"))
+contact_batch_window = float(os.getenv("CONTACT_BATCH_WINDOW", "1.0"))  # seconds to gather a batch
+contact_max_retries = int(os.getenv("CONTACT_MAX_RETRIES", "4"))
+contact_max_backoff = float(os.getenv("CONTACT_MAX_BACKOFF", "30"))  # longest wait between retries, in seconds
+contact_spill_path = os.getenv("CONTACT_SPILL_PATH", "contact_spill.jsonl")
+
+class ContactLogger:
+    """Delivers contact events to the Google Sheets web app off the request path.
+
+    ``log`` only enqueues and never waits. A background worker drains the queue
+    in batches, drops exact duplicates and coalesces each conversation's events
+    into a single row, then posts rows concurrently over one pooled HTTP client
+    with exponential backoff. Rows that still fail, or that arrive while the
+    queue is full, are appended to a spill file and replayed once the sink
+    accepts a batch again.
+    """
+
+    def __init__(self, url: Optional[str] = google_sheets_web_url, queue_size: int = 1000,
+                 batch_size: int = 50, batch_window: float = 1.0, max_retries: int = 4,
+                 spill_path: str = "contact_spill.jsonl", max_backoff: float = 30.0):
+        self.url = url
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.spill_path = spill_path
+        self.sent = 0
+        self.failed = 0
+        self.spilled = 0
+        self.deduplicated = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._worker: Optional[asyncio.Task] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._closing = False
+
+    def log(self, first_name: str, message: str, phone_number: Optional[str] = None,
+            conversation_id: Optional[str] = None) -> None:
+        """Queue a contact event for delivery; returns immediately."""
+        data = {"firstName": first_name, "message": message}
+        if phone_number:
+            data["phoneNumber"] = phone_number
+        event = {"conversation_id": conversation_id, "data": data}
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._spill([event])
+            return
+        self.start()
+
+    def start(self) -> None:
+        """Start the background worker if it is not already running."""
+        if self._worker is None or self._worker.done():
+            self._closing = False
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the worker and the HTTP pool, spilling anything still queued for the next start."""
+        self._closing = True
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        remaining = []
+        while not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+        if remaining:
+            self._spill(remaining)
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "spilled": self.spilled,
+            "deduplicated": self.deduplicated,
+        }
+
+    async def _run(self) -> None:
+        self._replay_spill()
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                deadline = asyncio.get_running_loop().time() + self.batch_window
+                while len(batch) < self.batch_size:
+                    timeout = deadline - asyncio.get_running_loop().time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                delivered = await self._deliver(batch)
+            except asyncio.CancelledError:
+                # Shutting down mid-batch; keep the events for the next start
+                self._spill(batch)
+                raise
+            except Exception as e:
+                print(f"Contact logger batch failed: {e}")
+                self._spill(batch)
+                continue
+            if delivered:
+                self._replay_spill()
+
+    async def _deliver(self, events: List[Dict]) -> bool:
+        """Send a batch; returns True if at least one row reached the sink."""
+        rows = self._coalesce(events)
+        if not self.url:
+            print("GOOGLE_SHEETS_WEB_URL is not set; spilling contact events")
+            self._spill(rows)
+            return False
+        results = await asyncio.gather(*(self._post(row) for row in rows))
+        # None means the sink rejected the row outright; retrying it later will not help
+        failed = [row for row, ok in zip(rows, results) if ok is False]
+        if failed:
+            self._spill(failed)
+        return len(failed) < len(rows)
+
+    def _coalesce(self, events: List[Dict]) -> List[Dict]:
+        seen = set()
+        by_conversation: Dict[str, Dict] = {}
+        rows = []
+        for event in events:
+            key = (event.get("conversation_id"), json.dumps(event["data"], sort_keys=True))
+            if key in seen:
+                self.deduplicated += 1
+                continue
+            seen.add(key)
+            conversation_id = event.get("conversation_id")
+            if conversation_id is None:
+                rows.append(event)
+                continue
+            existing = by_conversation.get(conversation_id)
+            if existing is None:
+                by_conversation[conversation_id] = {"conversation_id": conversation_id, "data": dict(event["data"])}
+                rows.append(by_conversation[conversation_id])
+            else:
+                # One row per conversation per batch; keep every message, latest details win
+                self.deduplicated += 1
+                merged = existing["data"]
+                message = merged.get("message", "")
+                merged.update(event["data"])
+                merged["message"] = f"{message}\n{event['data'].get('message', '')}".strip()
+        return rows
+
+    async def _post(self, row: Dict) -> Optional[bool]:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(10.0),
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+                follow_redirects=True,
+            )
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                response = await self._http.post(self.url, data=row["data"])
+                if response.status_code == 200:
+                    self.sent += 1
+                    print(f"Contact information for {row['data'].get('firstName')} logged successfully")
+                    return True
+                if response.status_code < 500 and response.status_code != 429:
+                    self.failed += 1
+                    print(f"Contact sink rejected row with status {response.status_code}")
+                    return None
+                retry_after = response.headers.get("Retry-After")
+            except httpx.HTTPError as e:
+                # A cancel that lands mid-connect can surface as a ConnectError instead
+                if self._closing:
+                    raise asyncio.CancelledError()
+                print(f"Failed to log contact information: {e}")
+            if attempt < self.max_retries:
+                try:
+                    delay = float(retry_after)
+                except (TypeError, ValueError):
+                    delay = min(self.max_backoff, 0.5 * (2 ** attempt)) * (0.5 + random.random())
+                if delay > self.max_backoff:
+                    # Waiting that long would stall every later batch; spill the row and replay it later
+                    print(f"Contact sink asked to retry after {delay:.0f}s; spilling the row")
+                    break
+                await asyncio.sleep(delay)
+        self.failed += 1
+        print("Failed to log contact information")
+        return False
+
+    def _spill(self, rows: List[Dict]) -> None:
+        try:
+            with open(self.spill_path, "a") as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+            self.spilled += len(rows)
+        except OSError as e:
+            print(f"Could not spill contact events to {self.spill_path}: {e}")
+
+    def _replay_spill(self) -> None:
+        """Move spilled rows back onto the queue, keeping any that do not fit.
+
+        The file is claimed by renaming it first, so when several worker
+        processes share it each row is replayed by only one of them.
+        """
+        claimed = f"{self.spill_path}.{os.getpid()}"
+        try:
+            os.replace(self.spill_path, claimed)
+        except OSError:
+            return
+        leftover = []
+        try:
+            with open(claimed) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        self._queue.put_nowait(json.loads(line))
+                    except ValueError:
+                        continue
+                    except asyncio.QueueFull:
+                        leftover.append(line if line.endswith("\n") else line + "\n")
+        except OSError as e:
+            print(f"Could not replay contact events from {claimed}: {e}")
+            return
+        if leftover:
+            with open(self.spill_path, "a") as f:
+                f.writelines(leftover)
+        os.remove(claimed)
+
+# Shared by both chatbot routers
+contact_logger = ContactLogger(
+    google_sheets_web_url,
+    queue_size=contact_queue_size,
+    batch_size=contact_batch_size,
+    batch_window=contact_batch_window,
+    max_retries=contact_max_retries,
+    spill_path=contact_spill_path,
+    max_backoff=contact_max_backoff,
+)
@@ -0,0 +1,153 @@
+import os
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Chunk text lives here instead of in vector metadata, keyed by vector id
+content_store_enabled = os.getenv("CONTENT_STORE_ENABLED", "true").lower() == "true"
+content_store_path = os.getenv("CONTENT_STORE_PATH", "content_store.sqlite3")
+content_cache_size = int(os.getenv("CONTENT_CACHE_SIZE", "4096"))  # chunks kept in memory
+
+class ContentStore:
+    """SQLite table of chunk text keyed by vector id, with an in-memory LRU in front.
+
+    Ingestion writes the text of every chunk here before upserting its vector,
+    so the index only has to carry small metadata. ``hydrate`` fills in
+    ``metadata["content"]`` on query matches that lack it. The cache is
+    dropped whenever another connection (e.g. an ingestion run) commits to the
+    database, detected through SQLite's ``data_version``.
+    """
+
+    def __init__(self, path: str = content_store_path, cache_size: int = content_cache_size):
+        self.path = path
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self.missing = 0
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._data_version = None
+
+    def put_many(self, items: Iterable[Tuple[str, str, Dict[str, Any]]]) -> int:
+        """Store ``(id, content, metadata)`` chunks; metadata is kept for rebuilding local indexes."""
+        rows = [(vector_id, content, json.dumps(metadata)) for vector_id, content, metadata in items]
+        with self._lock:
+            db = self._connect()
+            db.executemany("INSERT OR REPLACE INTO chunks (id, content, metadata) VALUES (?, ?, ?)", rows)
+            db.commit()
+            for vector_id, _, _ in rows:
+                self._cache.pop(vector_id, None)
+        return len(rows)
+
+    def iter_chunks(self) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """Every stored chunk as ``(id, content, metadata)``, in id order."""
+        with self._lock:
+            rows = self._connect().execute("SELECT id, content, metadata FROM chunks ORDER BY id").fetchall()
+        for vector_id, content, metadata in rows:
+            yield vector_id, content, json.loads(metadata) if metadata else {}
+
+    def delete(self, ids: List[str]) -> int:
+        with self._lock:
+            db = self._connect()
+            deleted = db.executemany("DELETE FROM chunks WHERE id = ?", [(vector_id,) for vector_id in ids]).rowcount
+            db.commit()
+            for vector_id in ids:
+                self._cache.pop(vector_id, None)
+        return deleted
+
+    def get_many(self, ids: List[str]) -> Dict[str, str]:
+        found: Dict[str, str] = {}
+        with self._lock:
+            if not os.path.exists(self.path) and self._db is None:
+                self.missing += len(ids)
+                return found
+            db = self._connect()
+            self._check_version(db)
+            wanted = []
+            for vector_id in ids:
+                content = self._cache.get(vector_id)
+                if content is None:
+                    wanted.append(vector_id)
+                else:
+                    self._cache.move_to_end(vector_id)
+                    found[vector_id] = content
+                    self.hits += 1
+            if wanted:
+                placeholders = ",".join("?" * len(wanted))
+                for vector_id, content in db.execute(
+                    f"SELECT id, content FROM chunks WHERE id IN ({placeholders})", wanted
+                ):
+                    found[vector_id] = content
+                    self._store(vector_id, content)
+                self.misses += len(wanted)
+                self.missing += sum(1 for vector_id in wanted if vector_id not in found)
+        return found
+
+    def hydrate(self, matches: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fill in ``metadata["content"]`` for matches whose index metadata has no text."""
+        ids = [match["id"] for match in matches if not (match.get("metadata") or {}).get("content")]
+        if not ids:
+            return matches
+        contents = self.get_many(ids)
+        for match in matches:
+            content = contents.get(match["id"])
+            if content is not None:
+                if match.get("metadata") is None:
+                    match["metadata"] = {}
+                match["metadata"]["content"] = content
+        return matches
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._cache),
+                "max_size": self.cache_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "missing": self.missing,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, content TEXT NOT NULL, metadata TEXT)")
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(chunks)")}
+            if "metadata" not in columns:
+                self._db.execute("ALTER TABLE chunks ADD COLUMN metadata TEXT")
+            self._db.commit()
+        return self._db
+
+    def _check_version(self, db: sqlite3.Connection) -> None:
+        version = db.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._cache.clear()
+            self._data_version = version
+
+    def _store(self, vector_id: str, content: str) -> None:
+        self._cache[vector_id] = content
+        self._cache.move_to_end(vector_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+def slim_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Index metadata without the chunk text, which goes to the content store."""
+    return {key: value for key, value in metadata.items() if key != "content"}
+
+# Shared by both chatbot routers; None when chunk text is kept in the index metadata
+content_store: Optional[ContentStore] = ContentStore() if content_store_enabled else None
@@ -0,0 +1,127 @@
+import os
+import re
+from typing import Any, Dict, List, Optional, Set
+from dotenv import load_dotenv
+from src.utils.tokens import count_tokens, truncate_tokens
+
+load_dotenv()
+
+# Context assembly limits, overridable from the environment
+context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+context_min_passage_tokens = int(os.getenv("CONTEXT_MIN_PASSAGE_TOKENS", "64"))
+context_duplicate_threshold = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))  # shingle Jaccard
+context_mmr_lambda = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))  # 1.0 = relevance only
+max_top_k = int(os.getenv("MAX_TOP_K", "20"))
+
+# Tokenizer of the chat model the context is sent to
+chat_model = "gpt-4o-mini"
+
+_word = re.compile(r"\w+", re.UNICODE)
+
+def shingles(text: str, size: int = 3) -> Set[str]:
+    words = _word.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def similarity(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def format_passage(match: Dict[str, Any], content: str) -> str:
+    metadata = (match.get('metadata') or {})
+    score = match.get('score', 0)
+    file_name = metadata.get('filename', 'Unknown file')
+    page_num = metadata.get('page', 0) + 1
+    return f"[{file_name} (Page {page_num}, relevance: {score:.2f})]\n{content}\n"
+
+class ContextResult:
+    """The assembled context plus what it cost, for logging and metrics."""
+
+    __slots__ = ("text", "tokens", "candidates", "selected", "duplicates", "truncated", "budget")
+
+    def __init__(self, text: str, tokens: int, candidates: int, selected: int, duplicates: int,
+                 truncated: int, budget: int):
+        self.text = text
+        self.tokens = tokens
+        self.candidates = candidates
+        self.selected = selected
+        self.duplicates = duplicates
+        self.truncated = truncated
+        self.budget = budget
+
+    def summary(self) -> str:
+        return (f"{self.selected}/{self.candidates} passages, {self.tokens}/{self.budget} tokens, "
+                f"{self.duplicates} duplicates dropped, {self.truncated} truncated")
+
+def build_context(matches: List[Dict[str, Any]], budget: int = context_token_budget,
+                  mmr_lambda: float = context_mmr_lambda,
+                  duplicate_threshold: float = context_duplicate_threshold,
+                  min_passage_tokens: int = context_min_passage_tokens) -> ContextResult:
+    """Assemble retrieved passages into a prompt context that fits ``budget`` tokens.
+
+    Near-duplicate passages (word-shingle Jaccard at or above
+    ``duplicate_threshold``) are dropped, keeping the more relevant one. The
+    rest are ordered by maximal marginal relevance so that each next passage
+    balances its retrieval score against overlap with those already chosen.
+    Passages are added in that priority order until the budget is reached;
+    the first one that does not fit is truncated to the remaining budget if at
+    least ``min_passage_tokens`` are left, and everything after it is dropped.
+    """
+    if not matches:
+        return ContextResult("No relevant information found.", 0, 0, 0, 0, 0, budget)
+
+    candidates = []
+    duplicates = 0
+    for match in sorted(matches, key=lambda m: m.get('score', 0), reverse=True):
+        content = (match.get('metadata') or {}).get('content', '')
+        if not content.strip():
+            continue
+        grams = shingles(content)
+        if any(similarity(grams, kept["shingles"]) >= duplicate_threshold for kept in candidates):
+            duplicates += 1
+            continue
+        candidates.append({"match": match, "content": content, "shingles": grams})
+
+    # Maximal marginal relevance ordering
+    ordered = []
+    remaining = list(candidates)
+    while remaining:
+        def mmr(candidate):
+            relevance = candidate["match"].get('score', 0)
+            redundancy = max((similarity(candidate["shingles"], chosen["shingles"]) for chosen in ordered), default=0.0)
+            return mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+        best = max(remaining, key=mmr)
+        ordered.append(best)
+        remaining.remove(best)
+
+    parts = []
+    used = 0
+    truncated = 0
+    for candidate in ordered:
+        passage = format_passage(candidate["match"], candidate["content"])
+        tokens = count_tokens(passage, chat_model)
+        if used + tokens <= budget:
+            parts.append(passage)
+            used += tokens
+            continue
+        left = budget - used
+        if left >= min_passage_tokens:
+            header_tokens = count_tokens(format_passage(candidate["match"], ""), chat_model)
+            content = truncate_tokens(candidate["content"], left - header_tokens, chat_model)
+            passage = format_passage(candidate["match"], content)
+            parts.append(passage)
+            used += count_tokens(passage, chat_model)
+            truncated += 1
+        break
+
+    if not parts:
+        return ContextResult("No relevant information found.", 0, len(matches), 0, duplicates, truncated, budget)
+    return ContextResult("\n".join(parts), used, len(matches), len(parts), duplicates, truncated, budget)
+
+def clamp_top_k(top_k: Optional[int], default: int = 10) -> int:
+    """Keep the client-supplied top_k within 1..MAX_TOP_K."""
+    if not top_k or top_k < 1:
+        return default
+    return min(top_k, max_top_k)
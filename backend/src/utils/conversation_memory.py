@@ -0,0 +1,166 @@
+import os
+import asyncio
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+from src.utils.admission import Overloaded, llm_limiter
+from src.utils.tokens import count_tokens
+from src.utils.telemetry import log, stage, upstream_error
+
+load_dotenv()
+
+# Memory limits, overridable from the environment
+memory_token_budget = int(os.getenv("MEMORY_TOKEN_BUDGET", "1200"))  # history tokens sent per turn
+memory_summary_tokens = int(os.getenv("MEMORY_SUMMARY_TOKENS", "250"))
+memory_summarize_after = int(os.getenv("MEMORY_SUMMARIZE_AFTER", "2"))  # messages out of the window before folding
+memory_max_conversations = int(os.getenv("MEMORY_MAX_CONVERSATIONS", "10000"))
+
+summary_model = "gpt-4o-mini"
+
+# Per-message framing overhead in the chat format
+message_overhead_tokens = 4
+
+summary_prompt = """
+You maintain a running summary of a chat between a customer and the concierge of Paloma The Grandeur, a luxury real estate project in Kanpur by Paloma Realty.
+
+Update the summary with the new messages. Keep the customer's name and contact details, their preferences, the questions they asked and what they were told. Drop greetings and small talk. Reply with the summary only, in at most {words} words.
+"""
+
+@lru_cache(maxsize=16384)
+def message_tokens(content: str) -> int:
+    return count_tokens(content, summary_model) + message_overhead_tokens
+
+class RollingSummary:
+    """Summary of every message up to and including ``through`` (a message timestamp)."""
+
+    __slots__ = ("text", "through", "tokens")
+
+    def __init__(self, text: str, through: float):
+        self.text = text
+        self.through = through
+        self.tokens = message_tokens(text)
+
+class ConversationMemory:
+    """Fits conversation history into a token budget with a rolling summary.
+
+    ``history`` returns the newest messages that fit the budget, preceded by a
+    summary of everything older. Messages that fall out of the window are
+    folded into that summary by a background task, incrementally (previous
+    summary plus the new messages), so the prompt stays roughly the same size
+    however long the conversation runs and no summarisation happens on the
+    request path. Messages that left the window before their summary is ready
+    are left out for that turn.
+    """
+
+    def __init__(self, token_budget: int = memory_token_budget, summary_tokens: int = memory_summary_tokens,
+                 summarize_after: int = memory_summarize_after, max_conversations: int = memory_max_conversations):
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.summarize_after = summarize_after
+        self.max_conversations = max_conversations
+        self.summaries_made = 0
+        self.summary_failures = 0
+        self._summaries: "OrderedDict[str, RollingSummary]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Task] = {}
+
+    def history(self, conversation_id: str, messages: List, client=None,
+                budget: Optional[int] = None) -> List[Dict[str, str]]:
+        """Return the budgeted history for ``messages`` in OpenAI chat format."""
+        conversation_id = str(conversation_id)
+        budget = self.token_budget if budget is None else budget
+        summary = self._summaries.get(conversation_id)
+        if summary is not None:
+            self._summaries.move_to_end(conversation_id)
+
+        used = summary.tokens if summary else 0
+        start = len(messages)
+        while start > 0:
+            message = messages[start - 1]
+            if summary and message.timestamp <= summary.through:
+                break
+            tokens = message_tokens(message.content)
+            # The newest message is always kept, even if it alone is over budget
+            if start < len(messages) and used + tokens > budget:
+                break
+            used += tokens
+            start -= 1
+
+        overflow = [message for message in messages[:start] if not summary or message.timestamp > summary.through]
+        if client is not None and len(overflow) >= self.summarize_after:
+            self._schedule(conversation_id, summary, overflow, client)
+
+        history = []
+        if summary:
+            history.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary.text}"})
+        history.extend({"role": message.role, "content": message.content} for message in messages[start:])
+        return history
+
+    def forget(self, conversation_id: str) -> None:
+        conversation_id = str(conversation_id)
+        self._summaries.pop(conversation_id, None)
+        task = self._pending.pop(conversation_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def close(self) -> None:
+        tasks = list(self._pending.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._pending.clear()
+
+    def stats(self) -> dict:
+        return {
+            "conversations": len(self._summaries),
+            "pending": len(self._pending),
+            "summaries_made": self.summaries_made,
+            "summary_failures": self.summary_failures,
+        }
+
+    def _schedule(self, conversation_id: str, summary: Optional[RollingSummary], overflow: List, client) -> None:
+        if conversation_id in self._pending:
+            return
+        task = asyncio.create_task(self._summarize(conversation_id, summary, list(overflow), client))
+        self._pending[conversation_id] = task
+        task.add_done_callback(lambda _: self._pending.pop(conversation_id, None))
+
+    async def _summarize(self, conversation_id: str, summary: Optional[RollingSummary], messages: List, client) -> None:
+        transcript = "\n".join(f"{message.role}: {message.content}" for message in messages)
+        previous = summary.text if summary else "(none yet)"
+        try:
+            with stage("summary"):
+                async with llm_limiter.slot():
+                    response = await client.chat.completions.create(
+                        model=summary_model,
+                        messages=[
+                            {"role": "system", "content": summary_prompt.format(words=int(self.summary_tokens * 0.7))},
+                            {"role": "user", "content": f"Current summary:\n{previous}\n\nNew messages:\n{transcript}"},
+                        ],
+                        temperature=0,
+                        max_tokens=self.summary_tokens,
+                    )
+            text = response.choices[0].message.content.strip()
+        except asyncio.CancelledError:
+            raise
+        except Overloaded:
+            # The overflow is still pending, so a later turn schedules the summary again
+            log(f"Summary of conversation {conversation_id} skipped: no LLM slot available")
+            return
+        except Exception as e:
+            self.summary_failures += 1
+            upstream_error("openai_summary", e)
+            log(f"Error summarizing conversation {conversation_id}: {e}")
+            return
+        # A newer summary may have been stored meanwhile (e.g. the conversation was reset)
+        current = self._summaries.get(conversation_id)
+        if current is not summary:
+            return
+        self._summaries[conversation_id] = RollingSummary(text, messages[-1].timestamp)
+        self._summaries.move_to_end(conversation_id)
+        self.summaries_made += 1
+        while len(self._summaries) > self.max_conversations:
+            self._summaries.popitem(last=False)
+
+# Shared by both chatbot routers; conversation ids are unique across them
+conversation_memory = ConversationMemory()
@@ -0,0 +1,740 @@
+import os
+import sys
+import time
+import json
+import base64
+import bisect
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Store limits, overridable from the environment
+conversation_max_count = int(os.getenv("CONVERSATION_MAX_COUNT", "10000"))
+conversation_idle_ttl = float(os.getenv("CONVERSATION_IDLE_TTL", "21600"))  # seconds
+conversation_max_bytes = int(os.getenv("CONVERSATION_MAX_BYTES", str(64 * 1024 * 1024)))
+conversation_max_messages = int(os.getenv("CONVERSATION_MAX_MESSAGES", "500"))
+
+# Where conversations live: "memory" (this process only), or "sqlite" / "redis",
+# which every worker process can share
+conversation_store_backend = os.getenv("CONVERSATION_STORE_BACKEND", "memory").lower()
+conversation_store_path = os.getenv("CONVERSATION_STORE_PATH", "conversations.sqlite3")
+conversation_redis_url = os.getenv("CONVERSATION_REDIS_URL", "redis://localhost:6379/0")
+conversation_redis_prefix = os.getenv("CONVERSATION_REDIS_PREFIX", "paloma")
+
+class StoredMessage:
+    """Compact chat message record; a fraction of the size of the pydantic model."""
+
+    __slots__ = ("role", "content", "timestamp")
+
+    def __init__(self, role: str, content: str, timestamp: Optional[float] = None):
+        self.role = role
+        self.content = content
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    @property
+    def nbytes(self) -> int:
+        return sys.getsizeof(self) + sys.getsizeof(self.content)
+
+    def to_dict(self) -> Dict:
+        return {
+            "role": self.role,
+            "content": self.content,
+            "timestamp": datetime.fromtimestamp(self.timestamp),
+        }
+
+    def to_json(self) -> Dict:
+        """Like ``to_dict`` with the timestamp already formatted, for responses built without pydantic."""
+        return {
+            "role": self.role,
+            "content": self.content,
+            "timestamp": datetime.fromtimestamp(self.timestamp).isoformat(),
+        }
+
+class Conversation:
+    """Messages of one conversation plus the bookkeeping the store needs."""
+
+    __slots__ = ("messages", "created", "last_active", "nbytes", "user_name")
+
+    def __init__(self):
+        self.messages: List[StoredMessage] = []
+        self.user_name: Optional[str] = None  # set once the user has told us their name
+        self.created = time.time()
+        self.last_active = self.created
+        self.nbytes = 0
+
+    def to_openai(self, limit: Optional[int] = None) -> List[Dict[str, str]]:
+        """Return the last ``limit`` messages (all if None) in OpenAI chat format."""
+        messages = self.messages if limit is None else self.messages[-limit:]
+        return [{"role": msg.role, "content": msg.content} for msg in messages]
+
+    def to_record(self, conversation_id: str) -> Dict:
+        """The whole conversation as one JSON-ready export record."""
+        return {
+            "conversation_id": conversation_id,
+            "user_name": self.user_name,
+            "created": datetime.fromtimestamp(self.created).isoformat(),
+            "last_active": datetime.fromtimestamp(self.last_active).isoformat(),
+            "messages": [message.to_json() for message in list(self.messages)],
+        }
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+# A page position: (last_active, conversation_id) of the last conversation returned
+Cursor = Tuple[float, str]
+
+def encode_cursor(position: Cursor) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(position)).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Inverse of ``encode_cursor``; raises ValueError for anything it did not produce."""
+    try:
+        last_active, conversation_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return float(last_active), str(conversation_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+def _activity_window(idle_ttl: float, active_after: Optional[float], active_before: Optional[float]) -> Tuple[float, float]:
+    """Bounds on last activity for a page: not idle-expired, ``active_after`` inclusive, ``active_before`` exclusive."""
+    lower = time.time() - idle_ttl
+    if active_after is not None:
+        lower = max(lower, active_after)
+    return lower, float("inf") if active_before is None else active_before
+
+async def iter_conversations(store, active_after: Optional[float] = None, active_before: Optional[float] = None,
+                             batch_size: int = 100) -> AsyncIterator[Tuple[str, Conversation]]:
+    """Walk a store page by page in order of last activity, loading one conversation at a time.
+
+    A conversation that is written to during the walk moves to the end of the
+    order and may be yielded again with its new messages.
+    """
+    after = None
+    while True:
+        rows = await store.page(batch_size, after, active_after, active_before)
+        for conversation_id, _ in rows:
+            conversation = await store.get(conversation_id)
+            if conversation is not None:
+                yield conversation_id, conversation
+        if len(rows) < batch_size:
+            return
+        after = (rows[-1][1], rows[-1][0])
+
+class ConversationStore:
+    """In-memory conversation store with LRU, idle-TTL and memory-cap eviction.
+
+    Conversations are kept in least-recently-active order. Every write drops
+    conversations that have been idle longer than ``idle_ttl``, then evicts the
+    least recently active ones until both ``max_count`` and ``max_bytes`` hold.
+    A single conversation keeps at most ``max_messages`` messages. Methods are
+    async to match the shared stores but never wait; each holds the lock only
+    for a few dictionary operations.
+    """
+
+    def __init__(self, max_count: int = 10000, idle_ttl: float = 21600,
+                 max_bytes: int = 64 * 1024 * 1024, max_messages: int = 500):
+        self.max_count = max_count
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+        self.nbytes = 0
+        self.evictions = {"idle": 0, "count": 0, "memory": 0}
+        self.trimmed_messages = 0
+        self._conversations: "OrderedDict[str, Conversation]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    async def create(self, conversation_id: str, messages: Optional[List[StoredMessage]] = None) -> Conversation:
+        conversation_id = str(conversation_id)
+        with self._lock:
+            self._remove(conversation_id)
+            conversation = Conversation()
+            self._conversations[conversation_id] = conversation
+            for message in messages or []:
+                self._append(conversation, message)
+            self._evict()
+            return conversation
+
+    async def get(self, conversation_id: str) -> Optional[Conversation]:
+        conversation_id = str(conversation_id)
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                return None
+            if time.time() - conversation.last_active > self.idle_ttl:
+                self._remove(conversation_id)
+                self.evictions["idle"] += 1
+                return None
+            return conversation
+
+    async def append(self, conversation_id: str, role: str, content: str) -> bool:
+        """Append a message; returns False if the conversation no longer exists."""
+        conversation_id = str(conversation_id)
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                return False
+            self._append(conversation, StoredMessage(role, content))
+            self._conversations.move_to_end(conversation_id)
+            self._evict()
+            return True
+
+    async def remove_last(self, conversation_id: str, role: str, content: str) -> bool:
+        """Drop the conversation's last message if it is this one; undoes an append whose turn was shed."""
+        with self._lock:
+            conversation = self._conversations.get(str(conversation_id))
+            if conversation is None or not conversation.messages:
+                return False
+            last = conversation.messages[-1]
+            if (last.role, last.content) != (role, content):
+                return False
+            conversation.messages.pop()
+            conversation.nbytes -= last.nbytes
+            self.nbytes -= last.nbytes
+            return True
+
+    async def set_user_name(self, conversation_id: str, user_name: str) -> bool:
+        """Remember the user's name; returns False if the conversation no longer exists."""
+        with self._lock:
+            conversation = self._conversations.get(str(conversation_id))
+            if conversation is None:
+                return False
+            conversation.user_name = user_name
+            return True
+
+    async def delete(self, conversation_id: str) -> bool:
+        with self._lock:
+            return self._remove(str(conversation_id))
+
+    async def ids(self) -> List[str]:
+        with self._lock:
+            return list(self._conversations.keys())
+
+    async def page(self, limit: int = 100, after: Optional[Cursor] = None, active_after: Optional[float] = None,
+             active_before: Optional[float] = None) -> List[Tuple[str, float]]:
+        """Up to ``limit`` (conversation_id, last_active) pairs after ``after``, by last activity then id."""
+        lower, upper = _activity_window(self.idle_ttl, active_after, active_before)
+        with self._lock:
+            # Already close to activity order, so this sort is cheap
+            order = sorted((conversation.last_active, conversation_id)
+                           for conversation_id, conversation in self._conversations.items())
+        start = bisect.bisect_left(order, (lower, ""))
+        if after is not None:
+            start = max(start, bisect.bisect_right(order, after))
+        rows = []
+        for last_active, conversation_id in order[start:]:
+            if last_active >= upper or len(rows) == limit:
+                break
+            rows.append((conversation_id, last_active))
+        return rows
+
+    async def stats(self) -> dict:
+        with self._lock:
+            return {
+                "conversations": len(self._conversations),
+                "bytes": self.nbytes,
+                "max_count": self.max_count,
+                "max_bytes": self.max_bytes,
+                "evictions": dict(self.evictions),
+                "trimmed_messages": self.trimmed_messages,
+            }
+
+    async def close(self) -> None:
+        pass
+
+    def _append(self, conversation: Conversation, message: StoredMessage) -> None:
+        conversation.messages.append(message)
+        conversation.nbytes += message.nbytes
+        conversation.last_active = message.timestamp
+        self.nbytes += message.nbytes
+        while len(conversation.messages) > self.max_messages:
+            dropped = conversation.messages.pop(0)
+            conversation.nbytes -= dropped.nbytes
+            self.nbytes -= dropped.nbytes
+            self.trimmed_messages += 1
+
+    def _remove(self, conversation_id: str) -> bool:
+        conversation = self._conversations.pop(conversation_id, None)
+        if conversation is None:
+            return False
+        self.nbytes -= conversation.nbytes
+        return True
+
+    def _evict(self) -> None:
+        now = time.time()
+        while self._conversations:
+            oldest_id, oldest = next(iter(self._conversations.items()))
+            if now - oldest.last_active > self.idle_ttl:
+                reason = "idle"
+            elif len(self._conversations) > self.max_count:
+                reason = "count"
+            elif self.nbytes > self.max_bytes and len(self._conversations) > 1:
+                reason = "memory"
+            else:
+                break
+            self._remove(oldest_id)
+            self.evictions[reason] += 1
+
+def _snapshot(created: float, last_active: float, user_name: Optional[str],
+              messages: List[StoredMessage]) -> Conversation:
+    """A Conversation built from rows read out of a shared store."""
+    conversation = Conversation()
+    conversation.created = created
+    conversation.last_active = last_active
+    conversation.user_name = user_name or None
+    conversation.messages = messages
+    conversation.nbytes = sum(message.nbytes for message in messages)
+    return conversation
+
+class SQLiteConversationStore:
+    """Conversation store in a SQLite database in WAL mode, shared by all workers on a host.
+
+    Has the same interface as ConversationStore, but ``get`` returns a
+    snapshot: re-read the conversation after appending to it. Every write is
+    its own ``BEGIN IMMEDIATE`` transaction, so appends from different workers
+    to one conversation are serialized and none is lost. Idle conversations
+    and those beyond ``max_count`` are removed when conversations are created;
+    there is no memory cap since nothing is held in process memory. Queries
+    run in a worker thread, so waiting on the database lock never blocks the
+    event loop.
+    """
+
+    def __init__(self, path: str = conversation_store_path, namespace: str = "default",
+                 max_count: int = 10000, idle_ttl: float = 21600, max_messages: int = 500):
+        self.path = path
+        self.namespace = namespace
+        self.max_count = max_count
+        self.idle_ttl = idle_ttl
+        self.max_messages = max_messages
+        self.evictions = {"idle": 0, "count": 0}
+        self.trimmed_messages = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._pid = None
+
+    def _create_sync(self, conversation_id: str, messages: Optional[List[StoredMessage]] = None) -> Conversation:
+        conversation_id = str(conversation_id)
+        now = time.time()
+        messages = list(messages or [])[-self.max_messages:]
+        with self._transaction() as db:
+            self._remove(db, conversation_id)
+            last_active = messages[-1].timestamp if messages else now
+            db.execute("INSERT INTO conversations (namespace, id, created, last_active) VALUES (?, ?, ?, ?)",
+                       (self.namespace, conversation_id, now, last_active))
+            db.executemany(
+                "INSERT INTO messages (namespace, conversation_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                [(self.namespace, conversation_id, message.role, message.content, message.timestamp) for message in messages],
+            )
+            self._evict(db, now)
+        return _snapshot(now, last_active, None, messages)
+
+    def _get_sync(self, conversation_id: str) -> Optional[Conversation]:
+        conversation_id = str(conversation_id)
+        with self._lock:
+            db = self._connect()
+            row = db.execute("SELECT created, last_active, user_name FROM conversations WHERE namespace = ? AND id = ?",
+                             (self.namespace, conversation_id)).fetchone()
+            if row is None:
+                return None
+            if time.time() - row[1] > self.idle_ttl:
+                return None
+            rows = db.execute("SELECT role, content, timestamp FROM messages WHERE namespace = ? AND conversation_id = ? "
+                              "ORDER BY seq", (self.namespace, conversation_id)).fetchall()
+        return _snapshot(row[0], row[1], row[2], [StoredMessage(role, content, timestamp) for role, content, timestamp in rows])
+
+    def _append_sync(self, conversation_id: str, role: str, content: str) -> bool:
+        conversation_id = str(conversation_id)
+        message = StoredMessage(role, content)
+        with self._transaction() as db:
+            updated = db.execute("UPDATE conversations SET last_active = ? WHERE namespace = ? AND id = ? AND last_active >= ?",
+                                 (message.timestamp, self.namespace, conversation_id, message.timestamp - self.idle_ttl))
+            if updated.rowcount == 0:
+                return False
+            db.execute("INSERT INTO messages (namespace, conversation_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                       (self.namespace, conversation_id, message.role, message.content, message.timestamp))
+            trimmed = db.execute(
+                "DELETE FROM messages WHERE namespace = ? AND conversation_id = ? AND seq <= ("
+                "SELECT seq FROM messages WHERE namespace = ? AND conversation_id = ? ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                (self.namespace, conversation_id, self.namespace, conversation_id, self.max_messages),
+            ).rowcount
+            self.trimmed_messages += max(trimmed, 0)
+        return True
+
+    def _remove_last_sync(self, conversation_id: str, role: str, content: str) -> bool:
+        with self._transaction() as db:
+            row = db.execute("SELECT seq, role, content FROM messages WHERE namespace = ? AND conversation_id = ? "
+                             "ORDER BY seq DESC LIMIT 1", (self.namespace, str(conversation_id))).fetchone()
+            if row is None or (row[1], row[2]) != (role, content):
+                return False
+            db.execute("DELETE FROM messages WHERE seq = ?", (row[0],))
+            return True
+
+    def _set_user_name_sync(self, conversation_id: str, user_name: str) -> bool:
+        with self._transaction() as db:
+            updated = db.execute("UPDATE conversations SET user_name = ? WHERE namespace = ? AND id = ?",
+                                 (user_name, self.namespace, str(conversation_id)))
+            return updated.rowcount > 0
+
+    def _delete_sync(self, conversation_id: str) -> bool:
+        with self._transaction() as db:
+            return self._remove(db, str(conversation_id))
+
+    def _ids_sync(self) -> List[str]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT id FROM conversations WHERE namespace = ? AND last_active >= ? ORDER BY last_active",
+                (self.namespace, time.time() - self.idle_ttl),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def _page_sync(self, limit: int, after: Optional[Cursor], active_after: Optional[float],
+                   active_before: Optional[float]) -> List[Tuple[str, float]]:
+        lower, upper = _activity_window(self.idle_ttl, active_after, active_before)
+        after_active, after_id = after if after is not None else (float("-inf"), "")
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT id, last_active FROM conversations WHERE namespace = ? AND last_active >= ? AND last_active < ? "
+                "AND (last_active > ? OR (last_active = ? AND id > ?)) ORDER BY last_active, id LIMIT ?",
+                (self.namespace, lower, upper, after_active, after_active, after_id, limit),
+            ).fetchall()
+        return [(conversation_id, last_active) for conversation_id, last_active in rows]
+
+    def _stats_sync(self) -> dict:
+        with self._lock:
+            db = self._connect()
+            conversations = db.execute("SELECT COUNT(*) FROM conversations WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+            messages = db.execute("SELECT COUNT(*) FROM messages WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "conversations": conversations,
+            "messages": messages,
+            "max_count": self.max_count,
+            "evictions": dict(self.evictions),
+            "trimmed_messages": self.trimmed_messages,
+        }
+
+    def _close_sync(self) -> None:
+        with self._lock:
+            if self._db is not None and self._pid == os.getpid():
+                self._db.close()
+            self._db = None
+
+    async def create(self, conversation_id: str, messages: Optional[List[StoredMessage]] = None) -> Conversation:
+        return await asyncio.to_thread(self._create_sync, conversation_id, messages)
+
+    async def get(self, conversation_id: str) -> Optional[Conversation]:
+        return await asyncio.to_thread(self._get_sync, conversation_id)
+
+    async def append(self, conversation_id: str, role: str, content: str) -> bool:
+        """Append a message; returns False if the conversation no longer exists."""
+        return await asyncio.to_thread(self._append_sync, conversation_id, role, content)
+
+    async def remove_last(self, conversation_id: str, role: str, content: str) -> bool:
+        """Drop the conversation's last message if it is this one; undoes an append whose turn was shed."""
+        return await asyncio.to_thread(self._remove_last_sync, conversation_id, role, content)
+
+    async def set_user_name(self, conversation_id: str, user_name: str) -> bool:
+        """Remember the user's name; returns False if the conversation no longer exists."""
+        return await asyncio.to_thread(self._set_user_name_sync, conversation_id, user_name)
+
+    async def delete(self, conversation_id: str) -> bool:
+        return await asyncio.to_thread(self._delete_sync, conversation_id)
+
+    async def ids(self) -> List[str]:
+        return await asyncio.to_thread(self._ids_sync)
+
+    async def page(self, limit: int = 100, after: Optional[Cursor] = None, active_after: Optional[float] = None,
+                   active_before: Optional[float] = None) -> List[Tuple[str, float]]:
+        """Up to ``limit`` (conversation_id, last_active) pairs after ``after``, by last activity then id."""
+        return await asyncio.to_thread(self._page_sync, limit, after, active_after, active_before)
+
+    async def stats(self) -> dict:
+        return await asyncio.to_thread(self._stats_sync)
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self._close_sync)
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection must not cross a fork; each worker opens its own
+        if self._db is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS conversations (namespace TEXT NOT NULL, id TEXT NOT NULL, "
+                       "created REAL NOT NULL, last_active REAL NOT NULL, user_name TEXT, PRIMARY KEY (namespace, id))")
+            db.execute("CREATE INDEX IF NOT EXISTS conversations_by_activity ON conversations (namespace, last_active)")
+            db.execute("CREATE TABLE IF NOT EXISTS messages (seq INTEGER PRIMARY KEY AUTOINCREMENT, namespace TEXT NOT NULL, "
+                       "conversation_id TEXT NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, timestamp REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS messages_by_conversation ON messages (namespace, conversation_id, seq)")
+            self._db = db
+            self._pid = os.getpid()
+        return self._db
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def _remove(self, db: sqlite3.Connection, conversation_id: str) -> bool:
+        db.execute("DELETE FROM messages WHERE namespace = ? AND conversation_id = ?", (self.namespace, conversation_id))
+        return db.execute("DELETE FROM conversations WHERE namespace = ? AND id = ?",
+                          (self.namespace, conversation_id)).rowcount > 0
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        idle = [row[0] for row in db.execute("SELECT id FROM conversations WHERE namespace = ? AND last_active < ?",
+                                             (self.namespace, now - self.idle_ttl))]
+        excess = db.execute("SELECT COUNT(*) FROM conversations WHERE namespace = ?",
+                            (self.namespace,)).fetchone()[0] - len(idle) - self.max_count
+        oldest = []
+        if excess > 0:
+            oldest = [row[0] for row in db.execute(
+                "SELECT id FROM conversations WHERE namespace = ? AND last_active >= ? ORDER BY last_active LIMIT ?",
+                (self.namespace, now - self.idle_ttl, excess))]
+        for conversation_id in idle + oldest:
+            self._remove(db, conversation_id)
+        self.evictions["idle"] += len(idle)
+        self.evictions["count"] += len(oldest)
+
+class RedisConversationStore:
+    """Conversation store on a Redis-protocol server, shared by workers on any host.
+
+    Each conversation is a hash of metadata plus a list of JSON messages, both
+    expiring after ``idle_ttl`` without activity, and a sorted set indexes the
+    ids by last activity. Appends run as a WATCH/MULTI transaction on the
+    conversation, so an append never resurrects a deleted conversation and
+    concurrent appends from different workers all land. Uses the asyncio
+    client of the ``redis`` package, imported on first use.
+    """
+
+    def __init__(self, url: str = conversation_redis_url, namespace: str = "default",
+                 prefix: str = conversation_redis_prefix, max_count: int = 10000,
+                 idle_ttl: float = 21600, max_messages: int = 500):
+        self.url = url
+        self.namespace = namespace
+        self.prefix = f"{prefix}:{namespace}"
+        self.max_count = max_count
+        self.idle_ttl = idle_ttl
+        self.max_messages = max_messages
+        self.evictions = {"idle": 0, "count": 0}
+        self.trimmed_messages = 0
+        self._client = None
+        self._owner = None
+
+    async def create(self, conversation_id: str, messages: Optional[List[StoredMessage]] = None) -> Conversation:
+        conversation_id = str(conversation_id)
+        now = time.time()
+        messages = list(messages or [])[-self.max_messages:]
+        last_active = messages[-1].timestamp if messages else now
+        meta_key, messages_key = self._keys(conversation_id)
+        async with self._connect().pipeline(transaction=True) as pipe:
+            pipe.delete(meta_key, messages_key)
+            pipe.hset(meta_key, mapping={"created": now, "last_active": last_active})
+            if messages:
+                pipe.rpush(messages_key, *(self._encode(message) for message in messages))
+                pipe.expire(messages_key, self._ttl())
+            pipe.expire(meta_key, self._ttl())
+            pipe.zadd(self._index_key(), {conversation_id: last_active})
+            await pipe.execute()
+        await self._evict(now)
+        return _snapshot(now, last_active, None, messages)
+
+    async def get(self, conversation_id: str) -> Optional[Conversation]:
+        meta_key, messages_key = self._keys(str(conversation_id))
+        async with self._connect().pipeline(transaction=True) as pipe:
+            pipe.hgetall(meta_key)
+            pipe.lrange(messages_key, 0, -1)
+            meta, rows = await pipe.execute()
+        if not meta:
+            return None
+        return _snapshot(float(meta["created"]), float(meta["last_active"]), meta.get("user_name"),
+                         [self._decode(row) for row in rows])
+
+    async def append(self, conversation_id: str, role: str, content: str) -> bool:
+        """Append a message; returns False if the conversation no longer exists."""
+        conversation_id = str(conversation_id)
+        message = StoredMessage(role, content)
+        meta_key, messages_key = self._keys(conversation_id)
+
+        async def write(pipe) -> bool:
+            if not await pipe.exists(meta_key):
+                return False
+            pipe.multi()
+            pipe.rpush(messages_key, self._encode(message))
+            pipe.ltrim(messages_key, -self.max_messages, -1)
+            pipe.hset(meta_key, "last_active", message.timestamp)
+            pipe.expire(meta_key, self._ttl())
+            pipe.expire(messages_key, self._ttl())
+            pipe.zadd(self._index_key(), {conversation_id: message.timestamp})
+            return True
+
+        return await self._watched(meta_key, write)
+
+    async def remove_last(self, conversation_id: str, role: str, content: str) -> bool:
+        """Drop the conversation's last message if it is this one; undoes an append whose turn was shed."""
+        _, messages_key = self._keys(str(conversation_id))
+
+        async def write(pipe) -> bool:
+            last = await pipe.lindex(messages_key, -1)
+            if last is None:
+                return False
+            message = self._decode(last)
+            if (message.role, message.content) != (role, content):
+                return False
+            pipe.multi()
+            pipe.rpop(messages_key)
+            return True
+
+        return await self._watched(messages_key, write)
+
+    async def set_user_name(self, conversation_id: str, user_name: str) -> bool:
+        """Remember the user's name; returns False if the conversation no longer exists."""
+        meta_key, _ = self._keys(str(conversation_id))
+
+        async def write(pipe) -> bool:
+            if not await pipe.exists(meta_key):
+                return False
+            pipe.multi()
+            pipe.hset(meta_key, "user_name", user_name)
+            return True
+
+        return await self._watched(meta_key, write)
+
+    async def delete(self, conversation_id: str) -> bool:
+        conversation_id = str(conversation_id)
+        meta_key, messages_key = self._keys(conversation_id)
+        async with self._connect().pipeline(transaction=True) as pipe:
+            pipe.delete(meta_key)
+            pipe.delete(messages_key)
+            pipe.zrem(self._index_key(), conversation_id)
+            deleted, _, _ = await pipe.execute()
+        return deleted > 0
+
+    async def ids(self) -> List[str]:
+        client = self._connect()
+        self.evictions["idle"] += await client.zremrangebyscore(self._index_key(), "-inf", time.time() - self.idle_ttl)
+        return list(await client.zrange(self._index_key(), 0, -1))
+
+    async def page(self, limit: int = 100, after: Optional[Cursor] = None, active_after: Optional[float] = None,
+                   active_before: Optional[float] = None) -> List[Tuple[str, float]]:
+        """Up to ``limit`` (conversation_id, last_active) pairs after ``after``, by last activity then id."""
+        lower, upper = _activity_window(self.idle_ttl, active_after, active_before)
+        if after is not None:
+            lower = max(lower, after[0])
+        upper_bound = "+inf" if upper == float("inf") else f"({upper!r}"
+        client = self._connect()
+        rows, offset = [], 0
+        # Sorted-set ties are ordered by member, matching (last_active, id); skip up to the cursor
+        while len(rows) < limit:
+            batch = await client.zrangebyscore(self._index_key(), lower, upper_bound, start=offset, num=limit, withscores=True)
+            if not batch:
+                break
+            offset += len(batch)
+            for conversation_id, last_active in batch:
+                if after is not None and (last_active, conversation_id) <= after:
+                    continue
+                rows.append((conversation_id, last_active))
+                if len(rows) == limit:
+                    break
+        return rows
+
+    async def stats(self) -> dict:
+        return {
+            "backend": "redis",
+            "conversations": await self._connect().zcard(self._index_key()),
+            "max_count": self.max_count,
+            "evictions": dict(self.evictions),
+            "trimmed_messages": self.trimmed_messages,
+        }
+
+    async def close(self) -> None:
+        if self._client is not None and self._owner == self._current_owner():
+            await self._client.aclose()
+        self._client = None
+
+    @staticmethod
+    def _current_owner():
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        return os.getpid(), loop
+
+    def _connect(self):
+        # Connections must not cross a fork or an event loop; each worker opens its own
+        owner = self._current_owner()
+        if self._client is None or self._owner != owner:
+            import redis.asyncio
+            self._client = redis.asyncio.Redis.from_url(self.url, decode_responses=True)
+            self._owner = owner
+        return self._client
+
+    async def _watched(self, key: str, write) -> bool:
+        """Run ``await write(pipe)`` under WATCH ``key``, retrying if another client changed it first."""
+        from redis.exceptions import WatchError
+        async with self._connect().pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    if not await write(pipe):
+                        await pipe.unwatch()
+                        return False
+                    await pipe.execute()
+                    return True
+                except WatchError:
+                    continue
+
+    async def _evict(self, now: float) -> None:
+        client = self._connect()
+        # Expired conversations are already gone; only their index entries remain
+        self.evictions["idle"] += await client.zremrangebyscore(self._index_key(), "-inf", now - self.idle_ttl)
+        excess = await client.zcard(self._index_key()) - self.max_count
+        if excess > 0:
+            for conversation_id, _ in await client.zpopmin(self._index_key(), excess):
+                await client.delete(*self._keys(conversation_id))
+                self.evictions["count"] += 1
+
+    def _keys(self, conversation_id: str):
+        return f"{self.prefix}:conversation:{conversation_id}", f"{self.prefix}:messages:{conversation_id}"
+
+    def _index_key(self) -> str:
+        return f"{self.prefix}:conversations"
+
+    def _ttl(self) -> int:
+        return max(1, int(self.idle_ttl))
+
+    @staticmethod
+    def _encode(message: StoredMessage) -> str:
+        return json.dumps([message.role, message.content, message.timestamp])
+
+    @staticmethod
+    def _decode(row: str) -> StoredMessage:
+        role, content, timestamp = json.loads(row)
+        return StoredMessage(role, content, timestamp)
+
+def create_conversation_store(namespace: str = "default", backend: str = conversation_store_backend):
+    """The configured store; ``namespace`` keeps each router's conversations apart in shared backends."""
+    if backend == "memory":
+        return ConversationStore(conversation_max_count, conversation_idle_ttl,
+                                 conversation_max_bytes, conversation_max_messages)
+    if backend == "sqlite":
+        return SQLiteConversationStore(conversation_store_path, namespace, conversation_max_count,
+                                       conversation_idle_ttl, conversation_max_messages)
+    if backend == "redis":
+        return RedisConversationStore(conversation_redis_url, namespace, conversation_redis_prefix,
+                                      conversation_max_count, conversation_idle_ttl, conversation_max_messages)
+    raise ValueError(f"Unknown CONVERSATION_STORE_BACKEND: {backend}")
@@ -0,0 +1,161 @@
+import os
+import re
+import time
+import asyncio
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Cache limits, overridable from the environment
+embedding_cache_size = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+embedding_cache_ttl = float(os.getenv("EMBEDDING_CACHE_TTL", "86400"))  # seconds
+embedding_cache_path = os.getenv("EMBEDDING_CACHE_PATH")  # optional on-disk tier
+embedding_cache_disk_size = int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", "100000"))  # rows kept on disk
+embedding_cache_prune_every = int(os.getenv("EMBEDDING_CACHE_PRUNE_EVERY", "256"))  # disk writes between prunes
+
+def normalize_query(text: str) -> str:
+    """Normalize query text so trivially different spellings share a cache entry."""
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+class EmbeddingCache:
+    """Bounded LRU + TTL cache for query embeddings with an optional SQLite tier.
+
+    Entries are keyed on (model, normalized text). The in-memory tier is checked
+    first; on a miss the disk tier (if configured) is consulted and any hit is
+    promoted back into memory. Expired entries are treated as misses. Disk
+    reads and writes run in a worker thread; every ``prune_every`` writes the
+    disk tier drops expired rows and then the oldest beyond ``max_disk_size``.
+    """
+
+    def __init__(self, max_size: int = 2048, ttl: float = 86400, path: Optional[str] = None,
+                 max_disk_size: int = 100000, prune_every: int = 256):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.max_disk_size = max_disk_size
+        self.prune_every = max(1, prune_every)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._writes = 0
+        if path:
+            self._open()
+            # Preforked workers (see serve.py) must not share the parent's connection
+            os.register_at_fork(after_in_child=self._open)
+
+    async def get(self, text: str, model: str) -> Optional[List[float]]:
+        key = (model, normalize_query(text))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, vector = entry
+                if now - created <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._entries[key]
+
+        if self._db is not None:
+            row = await asyncio.to_thread(self._get_sync, key)
+            if row and now - row[0] <= self.ttl:
+                vector = array("f", row[1]).tolist()
+                with self._lock:
+                    self._store(key, row[0], vector)
+                    self.hits += 1
+                    self.disk_hits += 1
+                return vector
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    async def set(self, text: str, model: str, vector: List[float]) -> None:
+        key = (model, normalize_query(text))
+        created = time.time()
+        with self._lock:
+            self._store(key, created, vector)
+        if self._db is not None:
+            await asyncio.to_thread(self._set_sync, key, created, array("f", vector).tobytes())
+
+    def prune(self) -> int:
+        """Drop expired disk rows, then the oldest beyond ``max_disk_size``; returns rows removed."""
+        if self._db is None:
+            return 0
+        with self._db_lock:
+            removed = self._db.execute(
+                "DELETE FROM embeddings WHERE created < ?", (time.time() - self.ttl,)
+            ).rowcount
+            removed += self._db.execute(
+                "DELETE FROM embeddings WHERE rowid IN ("
+                "SELECT rowid FROM embeddings ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_size,),
+            ).rowcount
+            self._db.commit()
+            return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+    def _open(self) -> None:
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, text TEXT NOT NULL, created REAL NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, text))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_created ON embeddings (created)")
+        self._db.commit()
+
+    def _get_sync(self, key: Tuple[str, str]) -> Optional[Tuple[float, bytes]]:
+        with self._db_lock:
+            return self._db.execute(
+                "SELECT created, vector FROM embeddings WHERE model = ? AND text = ?", key
+            ).fetchone()
+
+    def _set_sync(self, key: Tuple[str, str], created: float, vector: bytes) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO embeddings (model, text, created, vector) VALUES (?, ?, ?, ?)",
+                (key[0], key[1], created, vector),
+            )
+            self._db.commit()
+            self._writes += 1
+            due = self._writes % self.prune_every == 0
+        if due:
+            self.prune()
+
+    def _store(self, key: Tuple[str, str], created: float, vector: List[float]) -> None:
+        self._entries[key] = (created, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+# Shared by both chatbot routers
+embedding_cache = EmbeddingCache(embedding_cache_size, embedding_cache_ttl, embedding_cache_path,
+                                 embedding_cache_disk_size, embedding_cache_prune_every)
@@ -0,0 +1,23 @@
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Marker file rewritten by the ingestion script whenever the index content changes
+index_version_path = os.getenv("INDEX_VERSION_PATH", ".index_version")
+
+def read_index_version(path: str = index_version_path) -> str:
+    """Return the current index version marker, or an empty string if none exists."""
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+def bump_index_version(path: str = index_version_path) -> str:
+    """Record that the index was re-ingested so caches derived from it are dropped."""
+    version = f"{time.time():.6f}"
+    with open(path, "w") as f:
+        f.write(version)
+    return version
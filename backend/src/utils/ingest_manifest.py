@@ -0,0 +1,141 @@
+import os
+import re
+import json
+import hashlib
+from typing import Any, Dict, Iterable, Iterator, List
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Where the per-file chunk hashes of the last successful ingestion are kept
+ingest_manifest_path = os.getenv("INGEST_MANIFEST_PATH", "ingest_manifest.json")
+
+# Chunk ids, and the page-level ids that indexes built before chunking used for the same page
+chunk_id_pattern = re.compile(r"^(?P<page>.+_page_\d+)_chunk_\d+$")
+
+def content_hash(record: Dict[str, Any], model: str) -> str:
+    """Hash everything that ends up in the stored vector: text, metadata and embedding model."""
+    payload = json.dumps({"text": record["text"], "metadata": record["metadata"], "model": model}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class FileSync:
+    """Tracks one source file's chunks against the manifest during an ingestion run.
+
+    ``filter`` passes through only new or changed records. Hashes are recorded
+    for chunks once their upsert succeeds, so anything that fails is retried on
+    the next run. After the run, ``deleted_ids`` lists vectors whose source
+    chunk no longer exists, plus (on a first sync) legacy page ids to clear;
+    those are counted in ``legacy_cleared``, not ``deleted``.
+    """
+
+    def __init__(self, manifest: "IngestManifest", filename: str, model: str, full: bool = False):
+        self.manifest = manifest
+        self.filename = filename
+        self.model = model
+        self.full = full
+        self.previous: Dict[str, str] = dict(manifest.files.get(filename, {}))
+        self.current: Dict[str, str] = {}
+        self.pending: Dict[str, str] = {}
+        self.new = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.deleted = 0
+        self.legacy_cleared = 0
+        self._legacy: List[str] = []
+
+    def filter(self, records: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for record in records:
+            digest = content_hash(record, self.model)
+            previous = self.previous.get(record["id"])
+            if previous == digest and not self.full:
+                self.current[record["id"]] = digest
+                self.unchanged += 1
+                continue
+            if previous is None:
+                self.new += 1
+            else:
+                self.changed += 1
+            self.pending[record["id"]] = digest
+            yield record
+
+    def mark_upserted(self, ids: List[str]) -> None:
+        for vector_id in ids:
+            digest = self.pending.pop(vector_id, None)
+            if digest is not None:
+                self.current[vector_id] = digest
+
+    def deleted_ids(self) -> List[str]:
+        seen = set(self.current) | set(self.pending)
+        deleted = [vector_id for vector_id in self.previous if vector_id not in seen]
+        if not self.previous:
+            self._legacy = self.legacy_ids(seen)
+            deleted += self._legacy
+        return deleted
+
+    @staticmethod
+    def legacy_ids(ids: Iterable[str]) -> List[str]:
+        """``{file}_page_{n}_text`` ids left by page-level ingestion, for pages now stored as chunks.
+
+        Indexes built before the manifest existed are not tracked in it, so on
+        a file's first sync these are deleted to avoid returning each page
+        twice. Deleting an id that does not exist is a no-op.
+        """
+        ids = set(ids)
+        legacy = set()
+        for vector_id in ids:
+            match = chunk_id_pattern.match(vector_id)
+            if match:
+                legacy.add(f"{match.group('page')}_text")
+        return sorted(legacy - ids)
+
+    def commit(self, deleted: List[str]) -> None:
+        """Record the synced state; chunks that failed keep their previous hash (if any)."""
+        # Legacy ids may never have existed, so they are not reported as deletions
+        legacy = set(self._legacy)
+        self.legacy_cleared = sum(1 for vector_id in deleted if vector_id in legacy)
+        self.deleted = len(deleted) - self.legacy_cleared
+        state = dict(self.current)
+        for vector_id in self.pending:
+            if vector_id in self.previous:
+                state[vector_id] = self.previous[vector_id]
+        if state:
+            self.manifest.files[self.filename] = state
+        else:
+            self.manifest.files.pop(self.filename, None)
+
+    @property
+    def changes(self) -> int:
+        return self.new + self.changed + self.deleted
+
+    def summary(self) -> str:
+        summary = (f"{self.filename}: {self.new} new, {self.changed} changed, "
+                   f"{self.unchanged} unchanged, {self.deleted} deleted")
+        if self.legacy_cleared:
+            summary += f" ({self.legacy_cleared} legacy page ids cleared)"
+        return summary
+
+class IngestManifest:
+    """JSON manifest of ``{filename: {vector_id: content_hash}}`` for incremental sync."""
+
+    def __init__(self, path: str = ingest_manifest_path):
+        self.path = path
+        self.files: Dict[str, Dict[str, str]] = {}
+
+    @classmethod
+    def load(cls, path: str = ingest_manifest_path) -> "IngestManifest":
+        manifest = cls(path)
+        try:
+            with open(path) as f:
+                manifest.files = json.load(f)
+        except FileNotFoundError:
+            pass
+        return manifest
+
+    def save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.files, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def start_sync(self, filename: str, model: str, full: bool = False) -> FileSync:
+        return FileSync(self, filename, model, full)
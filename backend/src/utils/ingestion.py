@@ -0,0 +1,262 @@
+import os
+import time
+import random
+import asyncio
+import openai
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, Iterable, List, Optional, Union
+from dotenv import load_dotenv
+from src.utils.content_store import ContentStore, slim_metadata
+
+load_dotenv()
+
+openai_api_key = os.getenv("OPENAI_API_KEY")
+embedding_model = "text-embedding-3-small"
+
+# Pipeline sizing, overridable from the environment
+embed_batch_size = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "96"))  # inputs per embeddings request
+embed_batch_chars = int(os.getenv("INGEST_EMBED_BATCH_CHARS", "200000"))  # ~50k tokens per request
+embed_concurrency = int(os.getenv("INGEST_EMBED_CONCURRENCY", "4"))
+upsert_concurrency = int(os.getenv("INGEST_UPSERT_CONCURRENCY", "4"))
+max_attempts = int(os.getenv("INGEST_MAX_ATTEMPTS", "6"))
+progress_interval = float(os.getenv("INGEST_PROGRESS_INTERVAL", "5"))  # seconds between reports
+
+def status_of(error: Exception) -> Optional[int]:
+    """Best-effort HTTP status of an OpenAI or Pinecone client error."""
+    for attr in ("status_code", "status"):
+        status = getattr(error, attr, None)
+        if isinstance(status, int):
+            return status
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+def retry_after_of(error: Exception) -> Optional[float]:
+    """Seconds from a Retry-After header on the error's response, if any."""
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+class AdaptiveRateLimiter:
+    """Paces calls to an upstream API based on the throttling it reports.
+
+    Calls start unthrottled. A 429 doubles the spacing between calls (and
+    honours Retry-After before the next one); every success shrinks it again,
+    so throughput settles just under the upstream limit without fixed sleeps.
+    """
+
+    def __init__(self, name: str, min_interval: float = 0.0, max_interval: float = 30.0):
+        self.name = name
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.throttled_count = 0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            start = max(now, self._next_slot)
+            self._next_slot = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def throttled(self, retry_after: Optional[float] = None) -> None:
+        self.throttled_count += 1
+        self.interval = min(self.max_interval, max(self.interval * 2, 0.25))
+        pause = retry_after if retry_after is not None else self.interval
+        self._next_slot = max(self._next_slot, asyncio.get_running_loop().time() + pause)
+
+    def succeeded(self) -> None:
+        self.interval = max(self.min_interval, self.interval * 0.9)
+
+    async def call(self, fn: Callable, *args, attempts: int = max_attempts, **kwargs):
+        """Await ``fn(*args, **kwargs)``, retrying 429s, 5xx and connection errors."""
+        for attempt in range(attempts):
+            await self.wait()
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                status = status_of(e)
+                if attempt == attempts - 1:
+                    raise
+                if status == 429:
+                    self.throttled(retry_after_of(e))
+                elif status is None or status >= 500:
+                    await asyncio.sleep(min(30.0, 0.5 * (2 ** attempt)) * (0.5 + random.random()))
+                else:
+                    raise
+                continue
+            self.succeeded()
+            return result
+
+class IngestionStats:
+    """Counters and throughput for one ingestion run."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.pages = 0
+        self.chunks = 0
+        self.embedded = 0
+        self.upserted = 0
+        self.failed = 0
+        self.embedding_requests = 0
+        self.upsert_requests = 0
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def report(self) -> Dict[str, Any]:
+        elapsed = max(self.elapsed, 1e-9)
+        return {
+            "seconds": round(self.elapsed, 2),
+            "pages": self.pages,
+            "chunks": self.chunks,
+            "embedded": self.embedded,
+            "upserted": self.upserted,
+            "failed": self.failed,
+            "embedding_requests": self.embedding_requests,
+            "upsert_requests": self.upsert_requests,
+            "pages_per_second": round(self.pages / elapsed, 2),
+            "vectors_per_second": round(self.upserted / elapsed, 2),
+        }
+
+    def summary(self) -> str:
+        r = self.report()
+        return (f"{r['pages']} pages, {r['chunks']} chunks, {r['upserted']} vectors upserted, "
+                f"{r['failed']} failed in {r['seconds']}s "
+                f"({r['pages_per_second']} pages/s, {r['vectors_per_second']} vectors/s)")
+
+class IngestionPipeline:
+    """Streams records through batched embedding and concurrent upserts.
+
+    Records are ``{"id", "text", "metadata"}`` dicts produced lazily by the
+    caller, from a plain or async iterable. They are grouped into multi-input embeddings requests, and each
+    embedded batch is handed to a pool of upsert workers through a bounded
+    queue, so at most a few batches are held in memory regardless of corpus
+    size. Both stages are paced by AdaptiveRateLimiter instead of fixed sleeps.
+    With a ``content_store``, chunk text is written there ahead of each upsert
+    and left out of the vector metadata.
+    """
+
+    def __init__(self, index, client: Optional[openai.AsyncOpenAI] = None, stats: Optional[IngestionStats] = None,
+                 batch_size: int = embed_batch_size, batch_chars: int = embed_batch_chars,
+                 embed_workers: int = embed_concurrency, upsert_workers: int = upsert_concurrency,
+                 on_upserted: Optional[Callable[[List[str]], None]] = None,
+                 content_store: Optional[ContentStore] = None):
+        self.index = index
+        # Retries are handled by the rate limiter so 429s drive the pacing
+        self.client = client or openai.AsyncOpenAI(api_key=openai_api_key, max_retries=0)
+        self.stats = stats or IngestionStats()
+        self.batch_size = batch_size
+        self.batch_chars = batch_chars
+        self.embed_workers = embed_workers
+        self.upsert_workers = upsert_workers
+        self.on_upserted = on_upserted
+        self.content_store = content_store
+        self.embed_limiter = AdaptiveRateLimiter("embeddings")
+        self.upsert_limiter = AdaptiveRateLimiter("upsert")
+        self._last_progress = 0.0
+
+    async def run(self, records: Union[Iterable[Dict[str, Any]], AsyncIterable[Dict[str, Any]]]) -> IngestionStats:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.upsert_workers * 2)
+        workers = [asyncio.create_task(self._upsert_worker(queue)) for _ in range(self.upsert_workers)]
+        slots = asyncio.Semaphore(self.embed_workers)
+        embedding = set()
+
+        async for batch in self._batches(records):
+            await slots.acquire()
+            task = asyncio.create_task(self._embed_batch(batch, queue, slots))
+            embedding.add(task)
+            task.add_done_callback(embedding.discard)
+        if embedding:
+            await asyncio.gather(*embedding)
+
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+        self._progress(force=True)
+        return self.stats
+
+    async def close(self) -> None:
+        await self.client.close()
+
+    async def _batches(self, records) -> AsyncIterator[List[Dict[str, Any]]]:
+        if not hasattr(records, "__aiter__"):
+            records = self._aiter(records)
+        batch, chars = [], 0
+        async for record in records:
+            text = record["text"]
+            if batch and (len(batch) >= self.batch_size or chars + len(text) > self.batch_chars):
+                yield batch
+                batch, chars = [], 0
+            batch.append(record)
+            chars += len(text)
+        if batch:
+            yield batch
+
+    @staticmethod
+    async def _aiter(records: Iterable[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        for record in records:
+            yield record
+
+    async def _embed_batch(self, batch: List[Dict[str, Any]], queue: asyncio.Queue, slots: asyncio.Semaphore) -> None:
+        try:
+            try:
+                response = await self.embed_limiter.call(
+                    self.client.embeddings.create,
+                    input=[record["text"] for record in batch],
+                    model=embedding_model,
+                )
+            except Exception as e:
+                print(f"Error getting embeddings for {len(batch)} chunks: {e}")
+                self.stats.failed += len(batch)
+                return
+            self.stats.embedding_requests += 1
+            self.stats.embedded += len(batch)
+            vectors = []
+            contents = []
+            for item in sorted(response.data, key=lambda item: item.index):
+                record = batch[item.index]
+                metadata = record["metadata"]
+                if self.content_store is not None:
+                    metadata = slim_metadata(metadata)
+                    contents.append((record["id"], record["metadata"].get("content", record["text"]), metadata))
+                vectors.append({
+                    "id": record["id"],
+                    "values": [float(x) for x in item.embedding],
+                    "metadata": metadata,
+                })
+            await queue.put((vectors, contents))
+        finally:
+            slots.release()
+
+    async def _upsert_worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            vectors, contents = item
+            try:
+                # Text first, so a vector is never visible before its content can be hydrated
+                if contents:
+                    await asyncio.to_thread(self.content_store.put_many, contents)
+                await self.upsert_limiter.call(asyncio.to_thread, self.index.upsert, vectors=vectors)
+                self.stats.upsert_requests += 1
+                self.stats.upserted += len(vectors)
+                if self.on_upserted is not None:
+                    self.on_upserted([vector["id"] for vector in vectors])
+            except Exception as e:
+                print(f"Error upserting batch of {len(vectors)} vectors: {e}")
+                self.stats.failed += len(vectors)
+            self._progress()
+
+    def _progress(self, force: bool = False) -> None:
+        now = time.perf_counter()
+        if force or now - self._last_progress >= progress_interval:
+            self._last_progress = now
+            print(f"Progress: {self.stats.summary()}")
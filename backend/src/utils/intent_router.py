@@ -0,0 +1,187 @@
+import os
+import re
+import asyncio
+import numpy as np
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+from src.utils.name_extractor import asks_for_name, bare_name_reply, domain_words
+from src.utils.telemetry import log
+
+load_dotenv()
+
+# Intent routing settings, overridable from the environment
+intent_router_enabled = os.getenv("INTENT_ROUTER_ENABLED", "true").lower() == "true"
+intent_max_words = int(os.getenv("INTENT_MAX_WORDS", "6"))  # longer messages always go to retrieval
+intent_centroid_threshold = float(os.getenv("INTENT_CENTROID_THRESHOLD", "0.55"))
+intent_centroid_margin = float(os.getenv("INTENT_CENTROID_MARGIN", "0.05"))
+
+QUESTION = "question"
+GREETING = "greeting"
+THANKS = "thanks"
+FAREWELL = "farewell"
+ACKNOWLEDGEMENT = "acknowledgement"
+NAME = "name"
+
+_rules = [
+    (GREETING, re.compile(r"^(hi+|hello+|hey+|hiya|namaste|greetings|good (morning|afternoon|evening))\b")),
+    (THANKS, re.compile(r"^((many )?thanks?( a lot| so much)?|thank you( so much| very much)?|thx|ty|much appreciated)\b")),
+    (FAREWELL, re.compile(r"^(bye+|good ?bye|see you( later| soon)?|good night|take care|talk (to you )?later)\b")),
+    (ACKNOWLEDGEMENT, re.compile(r"^(ok(ay)?|k|yes|yeah|yep|no|nope|cool|great|nice|sure|got it|alright|fine|perfect|awesome|noted|i see|hmm+)\b")),
+]
+
+# Words that may trail a small-talk phrase without changing it ("thanks a lot", "ok great");
+# verbs such as "tell me" or "go ahead" are deliberately absent
+filler_words = frozenset("""
+a lot so much very really great good nice cool fine perfect awesome then thanks thank you ok okay sure got it
+alright noted again sir madam mam dear bro buddy friend man
+""".split())
+
+# Replies that accept what the assistant just offered or asked
+_affirmative = re.compile(
+    r"^(yes|yeah|yea|yep|yup|ya|sure|ok(ay)?|k|alright|please|go ahead|of course|definitely|absolutely|why not|"
+    r"tell me|go on|continue|do it|sounds good)\b"
+)
+_offer = re.compile(r"\b(would you like|do you want|shall i|should i|want me to|can i|may i|interested in|let me know if)\b")
+
+# Seed phrases for the nearest-centroid model, embedded once per process
+exemplars: Dict[str, List[str]] = {
+    GREETING: ["hi", "hello there", "hey, how are you?", "good morning", "namaste"],
+    THANKS: ["thanks a lot", "thank you so much", "that was helpful, thanks", "appreciate it"],
+    FAREWELL: ["bye", "see you later", "talk to you soon", "have a nice day", "that's all for now"],
+    ACKNOWLEDGEMENT: ["ok", "okay got it", "sounds good", "alright then", "cool"],
+    QUESTION: [
+        "What is the price of a 3 BHK apartment?",
+        "Tell me about the amenities",
+        "Where is the project located?",
+        "What is the carpet area?",
+        "Is parking available?",
+        "When is possession?",
+        "What is the RERA number?",
+        "Do you have 4 BHK units?",
+    ],
+}
+
+class Intent:
+    """A routing decision: what the message is and how that was decided."""
+
+    __slots__ = ("name", "source", "score", "query")
+
+    def __init__(self, name: str, source: str, score: float = 1.0, query: Optional[str] = None):
+        self.name = name
+        self.source = source  # "rule", "follow_up", "centroid", "default" or "disabled"
+        self.score = score
+        self.query = query  # what to retrieve and answer, when the message alone does not say it
+
+    @property
+    def needs_retrieval(self) -> bool:
+        return self.name == QUESTION
+
+    def __repr__(self) -> str:
+        return f"Intent({self.name!r}, {self.source!r}, {self.score:.2f})"
+
+def _offer_in(previous_assistant: Optional[str]) -> Optional[str]:
+    """The closing question or offer of the assistant's last turn, if it ended with one."""
+    if not previous_assistant or asks_for_name(previous_assistant):
+        return None
+    sentences = re.split(r"(?<=[.!?])\s+", previous_assistant.strip())
+    last = sentences[-1].strip() if sentences else ""
+    if last.endswith("?") or _offer.search(last.casefold()):
+        return last
+    return None
+
+class IntentRouter:
+    """Decides, without an LLM call, whether a message needs document retrieval.
+
+    Short messages are checked against rules first (greetings, thanks,
+    farewells, acknowledgements, and a bare name given in reply to the
+    assistant asking for it). A "yes"-style reply to an assistant turn that
+    ended with a question or an offer goes to retrieval, with that offer as
+    the query. Anything the rules cannot place is compared with
+    per-intent centroids of embedded seed phrases; the query embedding comes
+    from the shared embedding cache and is reused by retrieval. Messages with
+    domain words, question marks or more than ``max_words`` words always go to
+    retrieval.
+    """
+
+    def __init__(self, max_words: int = intent_max_words, threshold: float = intent_centroid_threshold,
+                 margin: float = intent_centroid_margin, enabled: bool = intent_router_enabled):
+        self.max_words = max_words
+        self.threshold = threshold
+        self.margin = margin
+        self.enabled = enabled
+        self.decisions: Counter = Counter()
+        self._centroids: Optional[Dict[str, np.ndarray]] = None
+        self._lock = asyncio.Lock()
+
+    async def classify(self, text: str, previous_assistant: Optional[str] = None,
+                       embed: Optional[Callable[[str], Awaitable[List[float]]]] = None) -> Intent:
+        intent = await self._classify(text, previous_assistant, embed)
+        self.decisions[(intent.name, intent.source)] += 1
+        log(f"Intent: {intent.name} via {intent.source} (score {intent.score:.2f})")
+        return intent
+
+    def stats(self) -> dict:
+        return {f"{name}/{source}": count for (name, source), count in sorted(self.decisions.items())}
+
+    async def _classify(self, text: str, previous_assistant: Optional[str], embed) -> Intent:
+        if not self.enabled:
+            return Intent(QUESTION, "disabled")
+        normalized = " ".join(re.sub(r"[^\w\s'.!?-]", " ", text.casefold()).split())
+        words = re.findall(r"[\w']+", normalized)
+        if not words or len(words) > self.max_words or "?" in normalized or domain_words.intersection(words):
+            return Intent(QUESTION, "default")
+
+        offer = _offer_in(previous_assistant)
+        if offer and _affirmative.match(normalized):
+            # "yes please" to "Would you like to know more about the payment plans?"
+            return Intent(QUESTION, "follow_up", query=f"{offer} {text.strip()}")
+
+        for name, pattern in _rules:
+            match = pattern.match(normalized)
+            # Whatever follows the phrase must be filler, e.g. "thanks a lot" or "ok great"
+            if match and all(word in filler_words for word in re.findall(r"[\w']+", normalized[match.end():])):
+                return Intent(name, "rule")
+
+        if bare_name_reply(text, previous_assistant):
+            return Intent(NAME, "rule")
+
+        if embed is not None:
+            return await self._nearest_centroid(text, embed)
+        return Intent(QUESTION, "default")
+
+    async def _nearest_centroid(self, text: str, embed) -> Intent:
+        centroids = await self._get_centroids(embed)
+        vector = np.asarray(await embed(text), dtype=np.float32)
+        if not centroids or not vector.size:
+            return Intent(QUESTION, "default")
+        vector /= np.linalg.norm(vector) or 1.0
+        scores = {name: float(centroid @ vector) for name, centroid in centroids.items()}
+        best = max(scores, key=scores.get)
+        if best != QUESTION and scores[best] >= self.threshold and scores[best] - scores[QUESTION] >= self.margin:
+            return Intent(best, "centroid", scores[best])
+        return Intent(QUESTION, "centroid", scores[QUESTION])
+
+    async def _get_centroids(self, embed) -> Dict[str, np.ndarray]:
+        if self._centroids is None:
+            async with self._lock:
+                if self._centroids is None:
+                    phrases = [(name, phrase) for name, group in exemplars.items() for phrase in group]
+                    vectors = await asyncio.gather(*(embed(phrase) for _, phrase in phrases))
+                    grouped: Dict[str, List[np.ndarray]] = {}
+                    for (name, _), vector in zip(phrases, vectors):
+                        if vector:
+                            row = np.asarray(vector, dtype=np.float32)
+                            grouped.setdefault(name, []).append(row / (np.linalg.norm(row) or 1.0))
+                    if QUESTION not in grouped:
+                        # Embeddings unavailable; try again on a later message
+                        return {}
+                    centroids = {}
+                    for name, rows in grouped.items():
+                        centroid = np.mean(rows, axis=0)
+                        centroids[name] = centroid / (np.linalg.norm(centroid) or 1.0)
+                    self._centroids = centroids
+        return self._centroids
+
+# Shared by both chatbot routers
+intent_router = IntentRouter()
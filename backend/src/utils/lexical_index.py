@@ -0,0 +1,166 @@
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Lexical (BM25) retrieval settings, overridable from the environment
+lexical_enabled = os.getenv("LEXICAL_ENABLED", "true").lower() == "true"
+lexical_index_path = os.getenv("LEXICAL_INDEX_PATH", "lexical_index.json")
+bm25_k1 = float(os.getenv("BM25_K1", "1.2"))
+bm25_b = float(os.getenv("BM25_B", "0.75"))
+rrf_k = int(os.getenv("RRF_K", "60"))
+# Skip the embedding call when the best keyword hit is this clear-cut
+fast_path_enabled = os.getenv("LEXICAL_FAST_PATH", "true").lower() == "true"
+fast_path_margin = float(os.getenv("LEXICAL_FAST_PATH_MARGIN", "1.5"))  # top score / runner-up score
+fast_path_max_terms = int(os.getenv("LEXICAL_FAST_PATH_MAX_TERMS", "4"))
+
+_token = re.compile(r"\w+", re.UNICODE)
+
+stopwords = frozenset("""
+a an and are as at be by can do does for from had has have how i in is it its me my of on or our please
+should tell that the their there these this to was what when where which who why will with would you your
+about any give know want
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _token.findall(text.casefold()) if token not in stopwords]
+
+class LexicalIndex:
+    """In-memory BM25 inverted index over the ingested chunks.
+
+    Built by the ingestion script from the content store and saved as JSON;
+    the server loads it on first search and reloads it when the file changes.
+    Exact tokens such as "3 BHK", "carpet area" or a RERA number are matched
+    literally, which dense embeddings do poorly.
+    """
+
+    def __init__(self, path: str = lexical_index_path, k1: float = bm25_k1, b: float = bm25_b):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._loaded_mtime = None
+        self._ids: List[str] = []
+        self._metadata: List[Dict[str, Any]] = []
+        self._lengths: List[int] = []
+        self._average_length = 0.0
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+
+    @staticmethod
+    def build(chunks: Iterable[Tuple[str, str, Dict[str, Any]]], path: str = lexical_index_path) -> int:
+        """Write an index for ``(id, content, metadata)`` chunks to ``path``; returns the chunk count."""
+        ids, metadata, lengths = [], [], []
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for row, (vector_id, content, meta) in enumerate(chunks):
+            terms = Counter(tokenize(content))
+            ids.append(vector_id)
+            metadata.append(meta)
+            lengths.append(sum(terms.values()))
+            for term, count in terms.items():
+                postings[term].append((row, count))
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"ids": ids, "metadata": metadata, "lengths": lengths, "postings": postings}, f)
+        os.replace(tmp_path, path)
+        return len(ids)
+
+    def search(self, query: str, top_k: int = 10) -> List[Dict[str, Any]]:
+        """BM25-ranked matches shaped like vector matches (id, score, metadata without content)."""
+        with self._lock:
+            self._reload_if_changed()
+            ids, metadata, lengths = self._ids, self._metadata, self._lengths
+            postings, average_length = self._postings, self._average_length
+        terms = set(tokenize(query))
+        if not ids or not terms or top_k <= 0:
+            return []
+
+        scores: Dict[int, float] = defaultdict(float)
+        matched: Dict[int, int] = defaultdict(int)
+        total = len(ids)
+        for term in terms:
+            docs = postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+            for row, count in docs:
+                norm = self.k1 * (1 - self.b + self.b * lengths[row] / average_length)
+                scores[row] += idf * count * (self.k1 + 1) / (count + norm)
+                matched[row] += 1
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [{
+            "id": ids[row],
+            "score": score,
+            "metadata": dict(metadata[row]),
+            "coverage": matched[row] / len(terms),
+        } for row, score in ranked]
+
+    def is_confident(self, query: str, matches: List[Dict[str, Any]]) -> bool:
+        """True when the top keyword hit alone is a safe answer source (see LEXICAL_FAST_PATH_*)."""
+        if not fast_path_enabled or not matches:
+            return False
+        if len(set(tokenize(query))) > fast_path_max_terms:
+            return False
+        top = matches[0]
+        if top["coverage"] < 1.0:
+            return False
+        runner_up = matches[1]["score"] if len(matches) > 1 else 0.0
+        return top["score"] >= fast_path_margin * runner_up
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._reload_if_changed()
+            return {"chunks": len(self._ids), "terms": len(self._postings)}
+
+    def _reload_if_changed(self) -> None:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            self._ids, self._metadata, self._lengths, self._postings = [], [], [], {}
+            self._loaded_mtime = None
+            return
+        if mtime == self._loaded_mtime:
+            return
+        with open(self.path) as f:
+            data = json.load(f)
+        self._ids = data["ids"]
+        self._metadata = data["metadata"]
+        self._lengths = data["lengths"]
+        self._average_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        self._postings = {term: [tuple(entry) for entry in docs] for term, docs in data["postings"].items()}
+        self._loaded_mtime = mtime
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], top_k: int = 10,
+                           k: int = rrf_k) -> List[Dict[str, Any]]:
+    """Merge ranked match lists by reciprocal rank fusion.
+
+    Each match scores ``sum(1 / (k + rank))`` over the lists it appears in.
+    Scores are rescaled so the best fused match is 1.0, keeping them on the
+    same 0-1 scale as cosine relevance for prompt formatting and MMR.
+    """
+    fused: Dict[str, float] = defaultdict(float)
+    best: Dict[str, Dict[str, Any]] = {}
+    for matches in result_lists:
+        for rank, match in enumerate(matches, start=1):
+            fused[match["id"]] += 1.0 / (k + rank)
+            # Prefer the copy that already carries text
+            if match["id"] not in best or (match.get("metadata") or {}).get("content"):
+                best[match["id"]] = match
+    if not fused:
+        return []
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    top_score = ranked[0][1]
+    results = []
+    for vector_id, score in ranked:
+        match = best[vector_id]
+        results.append({"id": vector_id, "score": score / top_score, "metadata": match.get("metadata") or {}})
+    return results
+
+# Shared by both chatbot routers; None when lexical retrieval is disabled
+lexical_index: Optional[LexicalIndex] = LexicalIndex() if lexical_enabled else None
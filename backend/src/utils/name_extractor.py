@@ -0,0 +1,99 @@
+import re
+from typing import List, Optional
+
+# Words that mean the user wants project information, whatever else the message looks like
+domain_words = frozenset("""
+price prices cost costs rate rates budget bhk flat flats apartment apartments unit units villa floor floors
+plan plans area carpet sq sqft feet amenities amenity clubhouse pool gym parking location located address
+rera kda approval possession booking payment emi loan builder developer paloma grandeur tower towers wing
+wings lift balcony bedroom bedrooms brochure site visit available availability project kanpur
+""".split())
+
+question_words = frozenset("what where when which who why how is are do does can could will should any".split())
+# Everyday, place and project words that can follow "I am" or make up a short reply without being a name
+not_name_words = question_words | domain_words | frozenset("""
+a an the and or but i me my you your we us our it this that tell show give send more less about want need know
+like looking interested info information details detail please help not now later just only also some all here
+there yes no okay ok sure maybe hello hi hey thanks thank good bad fine well much very really today buy sell
+book call contact number phone email whatsapp price anything something nothing from in at on for to with
+going planning trying calling writing new back glad happy sorry busy what's it's i'd
+based great nice awesome perfect cool done near living staying moving local resident
+""".split())
+
+_name_cue = re.compile(r"\b(my name is|my name's|name is|call me|this is|i am|i'm|im)\s+([a-z][a-z'-]*(?:\s+[a-z][a-z'-]*){0,2})")
+_bare_reply = re.compile(
+    r"^(?:(?:i am|i'm|im|my name is|my name's|this is|it's|its|call me|name is)\s+)?"
+    r"([a-z][a-z.'-]*(?:\s+[a-z][a-z.'-]*){0,2})[.!]*$"
+)
+_asks_for_name = re.compile(r"\byour (first |full )?name\b")
+# Cues that make the name unambiguous; "I am"/"this is" also introduce other things
+_explicit_cues = frozenset(["my name is", "my name's", "name is", "call me"])
+
+class NameMatch:
+    """Result of local name extraction; ``sure`` is False when an LLM should take a look."""
+
+    __slots__ = ("name", "sure")
+
+    def __init__(self, name: Optional[str], sure: bool):
+        self.name = name
+        self.sure = sure
+
+    def __repr__(self) -> str:
+        return f"NameMatch({self.name!r}, sure={self.sure})"
+
+def asks_for_name(assistant_message: Optional[str]) -> bool:
+    return bool(assistant_message and _asks_for_name.search(assistant_message.casefold()))
+
+def normalize(text: str) -> str:
+    # Commas stay so a name never runs into the next clause ("Anita, what's the price")
+    return " ".join(re.sub(r"[^\w\s'.,!?-]", " ", text.casefold()).split())
+
+def _name_words(words: List[str]) -> List[str]:
+    """Leading words of a candidate, stopping at the first one that is not name-like."""
+    kept = []
+    for word in words:
+        word = word.strip(".'-")
+        if not word or word in not_name_words:
+            break
+        kept.append(word)
+    return kept
+
+def _format(words: List[str]) -> str:
+    return " ".join(word.capitalize() for word in words)
+
+def bare_name_reply(text: str, previous_assistant: Optional[str]) -> Optional[str]:
+    """The name, if ``text`` is just a name given in reply to the assistant asking for it."""
+    if not asks_for_name(previous_assistant):
+        return None
+    match = _bare_reply.match(normalize(text))
+    if match is None:
+        return None
+    candidate = match.group(1).split()
+    words = _name_words(candidate)
+    return _format(words) if words and len(words) == len(candidate) else None
+
+def extract_name(text: str, previous_assistant: Optional[str] = None) -> NameMatch:
+    """Find the user's name in their latest message without calling a model.
+
+    Handles "my name is X", "call me X", "I am X", "this is X" and a bare
+    name sent right after the assistant asked for one. Returns ``sure=False``
+    when the message looks like it might carry a name but the rules cannot
+    tell, e.g. "I am X" or "this is X" when the assistant did not ask for a
+    name, or a reply to the name question that also asks something else.
+    """
+    name = bare_name_reply(text, previous_assistant)
+    if name:
+        return NameMatch(name, True)
+
+    normalized = normalize(text)
+    for match in _name_cue.finditer(normalized):
+        words = _name_words(match.group(2).split())
+        if not words:
+            continue
+        # "I am Ravi" vs "I am Kanpur based": only trust the weak cues when the name was asked for
+        sure = match.group(1) in _explicit_cues or asks_for_name(previous_assistant)
+        return NameMatch(_format(words), sure)
+
+    if asks_for_name(previous_assistant) or re.search(r"\bname\b", normalized):
+        return NameMatch(None, False)
+    return NameMatch(None, True)
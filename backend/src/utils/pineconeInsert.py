@@ -1,142 +1,259 @@
 import os
 import fitz  # PyMuPDF
-import openai
 from pinecone import Pinecone, ServerlessSpec
 from dotenv import load_dotenv
-import time
+import sys
+import glob
+import asyncio
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+# Allow running this file directly as a script from the backend directory
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from src.utils.index_version import bump_index_version
+from src.utils.retriever import LocalVectorIndex, retriever_backend
+from src.utils.ingestion import IngestionPipeline, IngestionStats, embedding_model
+from src.utils.content_store import content_store
+from src.utils.lexical_index import LexicalIndex, lexical_enabled, lexical_index_path
+from src.utils.ingest_manifest import IngestManifest
+from src.utils.chunker import chunk_records, chunk_layout, chunk_mode
+
 load_dotenv()
 
 # Set up credentials
-openai.api_key = os.getenv("OPENAI_API_KEY")
 pinecone_api_key = os.getenv("PINECONE_API_KEY")
 pinecone_environment = os.getenv("PINECONE_ENVIRONMENT")
 
-# Initialize Pinecone
-pc = Pinecone(api_key=pinecone_api_key)
-
 # Create or connect to an index
 index_name = "paloma"
 dimension = 1024  # OpenAI text embeddings dimension
 
-# Check if the index already exists
-existing_indexes = [index.name for index in pc.list_indexes()]
-if index_name not in existing_indexes:
-    # Create the index with ServerlessSpec
-    pc.create_index(
-        name=index_name,
-        dimension=dimension,
-        metric="cosine",
-        spec=ServerlessSpec(
-            cloud="aws",
-            region="us-east-1"  # Use your preferred region
-        )
-    )
-
-# Connect to the index
-index = pc.Index(index_name)
-
-def extract_text_from_pdf(pdf_path):
-    """Extract text from a PDF file, page by page."""
-    pages = []
-    try:
-        doc = fitz.open(pdf_path)
+# Connected lazily so importing this module never touches the network
+index = None
+
+def get_index():
+    """Connect to the configured index, creating the Pinecone index if it does not exist."""
+    global index
+    if index is None:
+        if retriever_backend == "local":
+            # Write to the on-disk NumPy index instead of Pinecone (see RETRIEVER_BACKEND)
+            index = LocalVectorIndex()
+        else:
+            # Initialize Pinecone
+            pc = Pinecone(api_key=pinecone_api_key)
+
+            # Check if the index already exists
+            existing_indexes = [existing.name for existing in pc.list_indexes()]
+            if index_name not in existing_indexes:
+                # Create the index with ServerlessSpec
+                pc.create_index(
+                    name=index_name,
+                    dimension=dimension,
+                    metric="cosine",
+                    spec=ServerlessSpec(
+                        cloud="aws",
+                        region="us-east-1"  # Use your preferred region
+                    )
+                )
+
+            # Connect to the index
+            index = pc.Index(index_name)
+    return index
+
+def extract_page_blocks(page, layout=True):
+    """Return a page's text as (text, font_size) blocks in reading order."""
+    if not layout:
+        return [(page.get_text(), 0.0)]
+    blocks = []
+    for block in page.get_text("dict")["blocks"]:
+        if block.get("type") != 0:  # Skip image blocks
+            continue
+        lines, size = [], 0.0
+        for line in block["lines"]:
+            lines.append("".join(span["text"] for span in line["spans"]))
+            size = max([size] + [span["size"] for span in line["spans"]])
+        text = "\n".join(lines).strip()
+        if text:
+            blocks.append((text, size))
+    return blocks
+
+def extract_text_from_pdf(pdf_path, stats=None, layout=None):
+    """Extract text from a PDF file, yielding (page_num, blocks) one page at a time."""
+    if layout is None:
+        layout = chunk_layout and chunk_mode != "page"
+    with fitz.open(pdf_path) as doc:
         for page_num in range(len(doc)):
             page = doc.load_page(page_num)
-            text = page.get_text()
-            if text.strip():  # Only add non-empty pages
-                pages.append(text)
+            blocks = extract_page_blocks(page, layout)
+            if stats is not None:
+                stats.pages += 1
+            if any(text.strip() for text, _ in blocks):  # Only yield non-empty pages
+                yield page_num, blocks
             else:
                 print(f"Page {page_num} is empty or contains only images")
-        return pages
-    except Exception as e:
-        print(f"Error extracting text from PDF: {e}")
-        return []
-
-def get_text_embedding(text):
-    """Get OpenAI embedding for text."""
-    if not text or not text.strip():
-        return None
-    
+
+def extract_pdf_pages(pdf_path, layout=None):
+    """Process-pool worker: extract a whole PDF, returning errors instead of raising them."""
+    stats = IngestionStats()
     try:
-        response = openai.embeddings.create(
-            input=text,
-            model="text-embedding-3-small"
-        )
-        return response.data[0].embedding
+        pages = list(extract_text_from_pdf(pdf_path, stats, layout))
+        return {"path": pdf_path, "pages": pages, "page_count": stats.pages, "error": None}
     except Exception as e:
-        print(f"Error getting text embedding: {e}")
-        return None
-
-def store_in_pinecone(filename, pages):
-    """Store the text embeddings in Pinecone."""
-    # Prepare the data for Pinecone
-    vectors_to_upsert = []
-    
-    for page_num, page_content in enumerate(pages):
-        # Skip empty pages
-        if not page_content or not page_content.strip():
-            print(f"Skipping empty page {page_num}")
-            continue
-            
-        embedding = get_text_embedding(page_content)
-        if embedding:
-            print(f"Got embedding for page {page_num}")
-            
-            # Ensure all embedding values are float type
-            text_embedding = [float(x) for x in embedding]
-            vectors_to_upsert.append({
-                "id": f"{filename}_page_{page_num}_text",
-                "values": text_embedding,
-                "metadata": {
-                    "type": "text",
-                    "page": page_num,
-                    "filename": filename,
-                    "content": page_content,
-                }
-            })
+        return {"path": pdf_path, "pages": [], "page_count": stats.pages, "error": f"{type(e).__name__}: {e}"}
+
+def resolve_pdf_paths(patterns):
+    """Expand files, directories (recursively) and glob patterns into a sorted list of PDFs."""
+    paths = set()
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            matches = path.rglob("*")
+        elif path.exists():
+            matches = [path]
         else:
-            print(f"Failed to get embedding for page {page_num}")
-    
-    # Upsert vectors in batches to avoid hitting limits
-    batch_size = 100
-    for i in range(0, len(vectors_to_upsert), batch_size):
-        batch = vectors_to_upsert[i:i+batch_size]
-        if batch:
-            try:
-                index.upsert(vectors=batch)
-                print(f"Upserted batch of {len(batch)} vectors")
-                # Small delay to avoid rate limits
-                time.sleep(0.5)
-            except Exception as e:
-                print(f"Error upserting batch to Pinecone: {e}")
-
-def process_pdf(pdf_path):
-    """Process a PDF file and upsert its content to Pinecone."""
-    # Extract the filename without extension
-    filename = Path(pdf_path).stem
-    
-    # Extract text from PDF
-    print(f"Extracting text from {filename}")
-    pages = extract_text_from_pdf(pdf_path)
-    
-    if pages:
-        print(f"Extracted {len(pages)} pages from {filename}")
-        # Store in Pinecone
-        store_in_pinecone(filename, pages)
-        print(f"Successfully processed {filename}")
+            matches = [Path(match) for match in glob.glob(pattern, recursive=True)]
+        for match in matches:
+            if match.is_file() and match.suffix.lower() == ".pdf":
+                paths.add(str(match))
+    return sorted(paths)
+
+async def extracted_files(pdf_paths, workers):
+    """Extract PDFs in a process pool, yielding results as they finish.
+
+    At most ``2 * workers`` files are in flight, so extracted text waiting for
+    the embedding stage stays bounded however many files are queued.
+    """
+    loop = asyncio.get_running_loop()
+    layout = chunk_layout and chunk_mode != "page"
+    remaining = iter(pdf_paths)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = set()
+        for pdf_path in itertools.islice(remaining, workers * 2):
+            in_flight.add(loop.run_in_executor(pool, extract_pdf_pages, pdf_path, layout))
+        while in_flight:
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                for pdf_path in itertools.islice(remaining, 1):
+                    in_flight.add(loop.run_in_executor(pool, extract_pdf_pages, pdf_path, layout))
+                yield future.result()
+
+async def ingest_files(pdf_paths, manifest=None, full=False, workers=None):
+    """Ingest many PDFs: parallel extraction feeding one shared embedding/upsert pipeline.
+
+    A file that fails to extract is reported and skipped without affecting
+    the others; its manifest entry and vectors are left untouched.
+    """
+    workers = workers or os.cpu_count() or 1
+    index = get_index()
+    stats = IngestionStats()
+    syncs = {}
+    owners = {}
+    errors = {}
+
+    def mark_upserted(ids):
+        for vector_id in ids:
+            sync = owners.pop(vector_id, None)
+            if sync is not None:
+                sync.mark_upserted([vector_id])
+
+    async def records():
+        async for result in extracted_files(pdf_paths, workers):
+            filename = Path(result["path"]).stem
+            stats.pages += result["page_count"]
+            if result["error"]:
+                errors[result["path"]] = result["error"]
+                print(f"Error extracting text from {result['path']}: {result['error']}")
+                continue
+            if filename in syncs:
+                errors[result["path"]] = f"duplicate file name {filename!r}"
+                print(f"Skipping {result['path']}: another file is already ingested as {filename!r}")
+                continue
+            print(f"Extracted {result['page_count']} pages from {filename}")
+            sync = manifest.start_sync(filename, embedding_model, full=full) if manifest is not None else None
+            syncs[filename] = (sync, result["page_count"])
+            file_records = chunk_records(filename, result["pages"], stats)
+            for record in (sync.filter(file_records) if sync else file_records):
+                if sync is not None:
+                    owners[record["id"]] = sync
+                yield record
+
+    pipeline = IngestionPipeline(index, stats=stats, on_upserted=mark_upserted, content_store=content_store)
+    try:
+        await pipeline.run(records())
+    finally:
+        await pipeline.close()
+
+    deleted_total = 0
+    for filename, (sync, page_count) in syncs.items():
+        if sync is None:
+            continue
+        deleted = []
+        # A file that yields no pages is never treated as "every chunk was removed"
+        if page_count:
+            deleted = sync.deleted_ids()
+            if deleted:
+                try:
+                    await asyncio.to_thread(index.delete, ids=deleted)
+                    if content_store is not None:
+                        await asyncio.to_thread(content_store.delete, deleted)
+                except Exception as e:
+                    print(f"Error deleting stale vectors for {filename}: {e}")
+                    deleted = []
+        sync.commit(deleted)
+        deleted_total += len(deleted)
+        print(f"Sync {sync.summary()}")
+    if manifest is not None:
+        manifest.save()
+
+    # The BM25 index covers every stored chunk, so it is rebuilt from the content store
+    if lexical_enabled and content_store is not None and (
+            stats.upserted or deleted_total or not os.path.exists(lexical_index_path)):
+        count = await asyncio.to_thread(LexicalIndex.build, content_store.iter_chunks(), lexical_index_path)
+        print(f"Lexical index rebuilt over {count} chunks")
+
+    if stats.upserted or deleted_total:
+        # Invalidate cached answers derived from the previous index content
+        bump_index_version()
+    return stats, errors
+
+def process_pdf(pdf_path, manifest=None, full=False):
+    """Process a PDF file and upsert its content to the configured vector index.
+
+    When a manifest is given, re-ingestion is incremental: unchanged pages are
+    skipped and pages removed from the PDF are deleted from the index.
+    """
+    stats, errors = asyncio.run(ingest_files([pdf_path], manifest, full, workers=1))
+    if errors:
+        print(f"Failed to process {pdf_path}: {errors[pdf_path]}")
     else:
-        print(f"No content extracted from {filename}")
+        print(f"Processed {Path(pdf_path).stem}: {stats.summary()}")
+    return stats
 
 def main():
-    # PDF path will be added directly in the main function
-    pdf_path = "Paloma Marketing Facts.pdf"  # Replace this with your PDF file path
-    
-    if os.path.exists(pdf_path) and pdf_path.lower().endswith('.pdf'):
-        process_pdf(pdf_path)
-    else:
-        print("Invalid PDF file path. Please check the file and try again.")
+    parser = argparse.ArgumentParser(description="Ingest PDFs into the configured vector index.")
+    parser.add_argument("paths", nargs="*", default=["Paloma Marketing Facts.pdf"],
+                        help="PDF files, directories or glob patterns (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None, help="extraction processes (default: CPU count)")
+    parser.add_argument("--full", action="store_true", help="re-embed every chunk even if unchanged")
+    parser.add_argument("--no-manifest", action="store_true", help="skip the incremental sync manifest entirely")
+    args = parser.parse_args()
+
+    pdf_paths = resolve_pdf_paths(args.paths)
+    if not pdf_paths:
+        print("No PDF files found. Please check the paths and try again.")
+        sys.exit(1)
+
+    print(f"Ingesting {len(pdf_paths)} PDF file(s)")
+    manifest = None if args.no_manifest else IngestManifest.load()
+    stats, errors = asyncio.run(ingest_files(pdf_paths, manifest, args.full, args.workers))
+
+    print(f"Ingested {len(pdf_paths) - len(errors)}/{len(pdf_paths)} files: {stats.summary()}")
+    for pdf_path, error in errors.items():
+        print(f"  failed: {pdf_path}: {error}")
+    if errors:
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,230 @@
+import os
+import json
+import asyncio
+import threading
+import numpy as np
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Retrieval backend: "pinecone" (remote index) or "local" (memory-mapped NumPy index)
+retriever_backend = os.getenv("RETRIEVER_BACKEND", "pinecone").lower()
+
+pinecone_api_key = os.getenv("PINECONE_API_KEY")
+pinecone_index_host = os.getenv("PINECONE_INDEX_HOST")
+pinecone_pool_size = int(os.getenv("PINECONE_POOL_SIZE", "0"))  # 0 keeps the client default
+index_name = "paloma"  # Paloma index as requested
+
+local_index_dir = os.getenv("LOCAL_INDEX_DIR", "local_index")
+local_index_dtype = os.getenv("LOCAL_INDEX_DTYPE", "float32")  # float32 or float16
+
+class LocalVectorIndex:
+    """A small on-disk vector index searched with vectorized cosine similarity.
+
+    Vectors are stored L2-normalized in ``vectors.npy`` and opened memory-mapped,
+    with one JSON record per row (id and metadata) in ``records.jsonl``. Writes
+    replace both files atomically; readers pick up the new files on their next
+    query, so the ingestion script can update the index under a running server.
+    """
+
+    def __init__(self, directory: str = local_index_dir, dtype: str = local_index_dtype):
+        self.directory = Path(directory)
+        self.dtype = np.dtype(dtype)
+        self.vectors_path = self.directory / "vectors.npy"
+        self.records_path = self.directory / "records.jsonl"
+        self._lock = threading.Lock()
+        self._loaded_mtime = None
+        self._vectors = None
+        self._ids: List[str] = []
+        self._metadata: List[Dict[str, Any]] = []
+
+    def query(self, vector: List[float], top_k: int = 10, include_metadata: bool = True) -> Dict[str, Any]:
+        with self._lock:
+            self._reload_if_changed()
+            vectors, ids, metadata = self._vectors, self._ids, self._metadata
+        if vectors is None or not ids or top_k <= 0:
+            return {"matches": []}
+
+        query = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(query))
+        if norm == 0.0:
+            return {"matches": []}
+        scores = np.asarray(vectors @ (query / norm), dtype=np.float32)
+
+        top_k = min(top_k, len(ids))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+
+        matches = []
+        for row in top:
+            match = {"id": ids[row], "score": float(scores[row])}
+            if include_metadata:
+                match["metadata"] = metadata[row]
+            matches.append(match)
+        return {"matches": matches}
+
+    def upsert(self, vectors: List[Dict[str, Any]]) -> int:
+        """Insert or replace Pinecone-shaped ``{"id", "values", "metadata"}`` records."""
+        with self._lock:
+            ids, rows, metadata = self._read_all()
+            positions = {vector_id: i for i, vector_id in enumerate(ids)}
+            for vector in vectors:
+                values = self._normalize(vector["values"])
+                if vector["id"] in positions:
+                    i = positions[vector["id"]]
+                    rows[i] = values
+                    metadata[i] = vector.get("metadata") or {}
+                else:
+                    positions[vector["id"]] = len(ids)
+                    ids.append(vector["id"])
+                    rows.append(values)
+                    metadata.append(vector.get("metadata") or {})
+            self._write_all(ids, rows, metadata)
+        return len(vectors)
+
+    def delete(self, ids: List[str]) -> int:
+        with self._lock:
+            existing_ids, rows, metadata = self._read_all()
+            to_delete = set(ids)
+            keep = [i for i, vector_id in enumerate(existing_ids) if vector_id not in to_delete]
+            self._write_all([existing_ids[i] for i in keep], [rows[i] for i in keep], [metadata[i] for i in keep])
+        return len(existing_ids) - len(keep)
+
+    def describe_index_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._reload_if_changed()
+            dimension = int(self._vectors.shape[1]) if self._vectors is not None and self._vectors.size else 0
+            return {"total_vector_count": len(self._ids), "dimension": dimension}
+
+    def _normalize(self, values: List[float]) -> np.ndarray:
+        row = np.asarray(values, dtype=np.float32)
+        norm = float(np.linalg.norm(row))
+        return row / norm if norm else row
+
+    def _reload_if_changed(self) -> None:
+        try:
+            mtime = os.stat(self.records_path).st_mtime_ns
+        except OSError:
+            self._vectors, self._ids, self._metadata, self._loaded_mtime = None, [], [], None
+            return
+        if mtime == self._loaded_mtime:
+            return
+        vectors = np.load(self.vectors_path, mmap_mode="r")
+        ids, metadata = [], []
+        with open(self.records_path) as f:
+            for line in f:
+                record = json.loads(line)
+                ids.append(record["id"])
+                metadata.append(record.get("metadata") or {})
+        if len(vectors) != len(ids):
+            # Caught between the two renames of a concurrent write; retry next query
+            return
+        self._vectors, self._ids, self._metadata = vectors, ids, metadata
+        self._loaded_mtime = mtime
+
+    def _read_all(self):
+        self._reload_if_changed()
+        rows = [np.asarray(row, dtype=np.float32) for row in self._vectors] if self._vectors is not None else []
+        return list(self._ids), rows, list(self._metadata)
+
+    def _write_all(self, ids: List[str], rows: List[np.ndarray], metadata: List[Dict[str, Any]]) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        matrix = np.stack(rows).astype(self.dtype) if rows else np.zeros((0, 0), dtype=self.dtype)
+        tmp_vectors = self.vectors_path.with_suffix(".tmp.npy")
+        tmp_records = self.records_path.with_suffix(".tmp")
+        np.save(tmp_vectors, matrix)
+        with open(tmp_records, "w") as f:
+            for vector_id, meta in zip(ids, metadata):
+                f.write(json.dumps({"id": vector_id, "metadata": meta}) + "\n")
+        # Vectors first: readers key their reload off the records file
+        os.replace(tmp_vectors, self.vectors_path)
+        os.replace(tmp_records, self.records_path)
+        self._loaded_mtime = None
+        self._reload_if_changed()
+
+class Retriever(ABC):
+    """Common interface for the vector search backends used by the chat routers."""
+
+    @abstractmethod
+    async def query(self, vector: List[float], top_k: int = 10) -> List[Dict[str, Any]]:
+        """Return the ``top_k`` matches for ``vector``, best first."""
+
+    async def warmup(self) -> Dict[str, Any]:
+        """Open connections ahead of the first query and return index stats."""
+        return {}
+
+    async def close(self) -> None:
+        pass
+
+class PineconeRetriever(Retriever):
+    """Queries the remote Pinecone index through the async client."""
+
+    def __init__(self, api_key: Optional[str] = pinecone_api_key, name: str = index_name,
+                 host: Optional[str] = pinecone_index_host):
+        self.api_key = api_key
+        self.name = name
+        self.host = host
+        self._pc = None
+        self._index = None
+        self._lock = asyncio.Lock()
+
+    async def get_index(self):
+        """Return the async index handle, resolving its host on first use."""
+        if self._index is None:
+            async with self._lock:
+                if self._index is None:
+                    from pinecone import PineconeAsyncio
+                    self._pc = PineconeAsyncio(api_key=self.api_key, connection_pool_maxsize=pinecone_pool_size)
+                    host = self.host
+                    if not host:
+                        description = await self._pc.describe_index(self.name)
+                        host = description.host
+                    self._index = self._pc.IndexAsyncio(host=host)
+        return self._index
+
+    async def query(self, vector: List[float], top_k: int = 10) -> List[Dict[str, Any]]:
+        index = await self.get_index()
+        results = await index.query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=True
+        )
+        return results.get('matches', [])
+
+    async def warmup(self) -> Dict[str, Any]:
+        index = await self.get_index()
+        stats = await index.describe_index_stats()
+        return {"total_vector_count": stats.get("total_vector_count", 0), "dimension": stats.get("dimension")}
+
+    async def close(self) -> None:
+        if self._index is not None:
+            await self._index.close()
+        if self._pc is not None:
+            await self._pc.close()
+        self._index = None
+        self._pc = None
+
+class LocalRetriever(Retriever):
+    """Searches a LocalVectorIndex in-process; no network round-trip."""
+
+    def __init__(self, index: Optional[LocalVectorIndex] = None):
+        self.index = index or LocalVectorIndex()
+
+    async def query(self, vector: List[float], top_k: int = 10) -> List[Dict[str, Any]]:
+        return self.index.query(vector, top_k=top_k)["matches"]
+
+    async def warmup(self) -> Dict[str, Any]:
+        return self.index.describe_index_stats()
+
+def create_retriever(backend: str = retriever_backend) -> Retriever:
+    if backend == "local":
+        return LocalRetriever()
+    if backend == "pinecone":
+        return PineconeRetriever()
+    raise ValueError(f"Unknown RETRIEVER_BACKEND: {backend}")
+
+# Shared by both chatbot routers
+retriever = create_retriever()
@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+import signal
+import uvicorn
+from typing import Dict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Process layout, overridable from the environment
+web_concurrency = int(os.getenv("WEB_CONCURRENCY", "1"))
+serve_host = os.getenv("HOST", "0.0.0.0")
+serve_port = int(os.getenv("PORT", "8000"))
+worker_restart_delay = float(os.getenv("WORKER_RESTART_DELAY", "1"))  # seconds
+
+def serve(app_path: str = "main:app", host: str = serve_host, port: int = serve_port,
+          workers: int = web_concurrency, reload: bool = False) -> None:
+    """Run the API in one process, or in ``workers`` pre-forked processes sharing a socket.
+
+    With several workers the app is imported once in the parent before
+    forking, so each worker starts from the same preloaded modules and only
+    runs its own lifespan (upstream clients, warmup). Workers share nothing
+    in memory, so conversations (and the frames of resumable streams) must
+    live in the sqlite or redis store.
+    """
+    if workers <= 1:
+        uvicorn.run(app_path, host=host, port=port, reload=reload)
+        return
+
+    from src.utils.conversation_store import conversation_store_backend
+    if conversation_store_backend == "memory":
+        raise SystemExit(
+            "WEB_CONCURRENCY > 1 needs a shared conversation store; "
+            "set CONVERSATION_STORE_BACKEND to sqlite or redis"
+        )
+    if reload:
+        print("Reload is not supported with several workers; ignoring it")
+
+    config = uvicorn.Config(app_path, host=host, port=port)
+    config.load()
+    sock = config.bind_socket()
+    supervisor = WorkerSupervisor(config, sock, workers)
+    supervisor.run()
+
+class WorkerSupervisor:
+    """Forks the workers, restarts any that die and forwards shutdown signals."""
+
+    def __init__(self, config: uvicorn.Config, sock, workers: int):
+        self.config = config
+        self.sock = sock
+        self.workers = workers
+        self.children: Dict[int, int] = {}  # pid -> worker slot
+        self.stopping = False
+
+    def spawn(self, slot: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            code = 0
+            try:
+                uvicorn.Server(self.config).run(sockets=[self.sock])
+            except BaseException as e:
+                print(f"Worker {os.getpid()} crashed: {e}")
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        self.children[pid] = slot
+        print(f"Started worker {slot} (pid {pid})")
+
+    def stop(self, signum, frame) -> None:
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> None:
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        print(f"Serving on {self.config.host}:{self.config.port} with {self.workers} workers (parent pid {os.getpid()})")
+        for slot in range(self.workers):
+            self.spawn(slot)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            slot = self.children.pop(pid, None)
+            if slot is None or self.stopping:
+                continue
+            print(f"Worker {slot} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}; restarting")
+            time.sleep(worker_restart_delay)
+            if not self.stopping:
+                self.spawn(slot)
+        self.sock.close()
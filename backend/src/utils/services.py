@@ -0,0 +1,125 @@
+import os
+import time
+import httpx
+import openai
+from typing import Optional
+from dotenv import load_dotenv
+from src.utils.retriever import retriever
+from src.utils.contact_logger import contact_logger
+from src.utils.conversation_memory import conversation_memory, summary_model
+from src.utils.context_builder import chat_model
+from src.utils.tokens import preload_encodings
+from src.utils.content_store import content_store
+
+load_dotenv()
+
+openai_api_key = os.getenv("OPENAI_API_KEY")
+
+# Connection-pool tuning for the shared OpenAI HTTP client
+http_max_connections = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+http_max_keepalive_connections = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+http_keepalive_expiry = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))  # seconds
+http_connect_timeout = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+http_timeout = float(os.getenv("HTTP_TIMEOUT", "60"))
+openai_max_retries = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+# Whether startup should pre-open upstream connections before serving
+warmup_enabled = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+
+class Services:
+    """Process-wide upstream clients, created in the FastAPI lifespan.
+
+    Importing the routers only binds to this container; nothing connects to
+    OpenAI or the vector index until ``start`` runs. ``start`` builds one pooled
+    OpenAI client, then (optionally) warms it and the retriever so the first
+    user request does not pay for DNS, TLS and index host resolution.
+    """
+
+    def __init__(self):
+        self.openai: Optional[openai.AsyncOpenAI] = None
+        self.retriever = retriever
+        self.contact_logger = contact_logger
+        self.conversation_memory = conversation_memory
+        self.conversation_stores = []  # registered by the routers
+        self.stream_buffers = []
+        self.ready = False
+        self.warmup_report = {}
+
+    async def start(self, warmup: bool = warmup_enabled) -> None:
+        self.openai = openai.AsyncOpenAI(
+            api_key=openai_api_key,
+            max_retries=openai_max_retries,
+            # openai.Timeout matches the HTTP library the SDK was built against
+            timeout=openai.Timeout(http_timeout, connect=http_connect_timeout),
+            http_client=openai.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=http_max_connections,
+                    max_keepalive_connections=http_max_keepalive_connections,
+                    keepalive_expiry=http_keepalive_expiry,
+                ),
+            ),
+        )
+        # Replay any contact events spilled by a previous run
+        self.contact_logger.start()
+        # Tokenizers are loaded here, never on a request; a failed load keeps /ready false
+        report = {"tokenizer": await self.load_tokenizers()}
+        if warmup:
+            report.update(await self.warmup())
+        self.warmup_report = report
+        self.ready = all(result["ok"] for result in report.values())
+
+    async def load_tokenizers(self) -> dict:
+        started = time.perf_counter()
+        errors = await preload_encodings(sorted({chat_model, summary_model}))
+        failed = {model: error for model, error in errors.items() if error is not None}
+        result = {"ok": not failed, "models": sorted(errors)}
+        if failed:
+            result["error"] = "; ".join(f"{model}: {error}" for model, error in failed.items())
+            print(f"Could not load tokenizer, not ready: {result['error']}")
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        return result
+
+    async def warmup(self) -> dict:
+        """Pre-open upstream connections and check the index; failures are reported, not raised."""
+        report = {}
+
+        started = time.perf_counter()
+        try:
+            await self.openai.models.retrieve("gpt-4o-mini")
+            report["openai"] = {"ok": True}
+        except Exception as e:
+            report["openai"] = {"ok": False, "error": str(e)}
+        report["openai"]["seconds"] = round(time.perf_counter() - started, 3)
+
+        started = time.perf_counter()
+        try:
+            stats = await self.retriever.warmup()
+            report["retriever"] = {"ok": True, "total_vector_count": stats.get("total_vector_count")}
+        except Exception as e:
+            report["retriever"] = {"ok": False, "error": str(e)}
+        report["retriever"]["seconds"] = round(time.perf_counter() - started, 3)
+
+        for name, result in report.items():
+            if result["ok"]:
+                print(f"Warmup {name} ok in {result['seconds']}s")
+            else:
+                print(f"Warmup {name} failed: {result['error']}")
+        return report
+
+    async def close(self) -> None:
+        self.ready = False
+        await self.contact_logger.close()
+        await self.conversation_memory.close()
+        await self.retriever.close()
+        if content_store is not None:
+            content_store.close()
+        for store in self.conversation_stores:
+            await store.close()
+        for buffers in self.stream_buffers:
+            await buffers.close()
+        if self.openai is not None:
+            await self.openai.close()
+            self.openai = None
+
+# Shared by both chatbot routers and managed by the app lifespan in main.py
+services = Services()
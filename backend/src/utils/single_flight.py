@@ -0,0 +1,53 @@
+import os
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from dotenv import load_dotenv
+
+load_dotenv()
+
+single_flight_enabled = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+class SingleFlight:
+    """Shares one in-flight upstream call between concurrent callers with the same key.
+
+    The first caller for a key starts ``fetch()`` as its own task; callers that
+    arrive while it is running await that task instead of starting another.
+    The key is forgotten as soon as the call finishes, so this only collapses
+    bursts; caching results is left to the caches. The task is shielded, so
+    a caller that disconnects does not cancel the call for the others.
+    """
+
+    def __init__(self, name: str, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self.calls = 0      # upstream calls actually made
+        self.coalesced = 0  # callers that shared another caller's call
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+    async def run(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.enabled:
+            self.calls += 1
+            return await fetch()
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fetch())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Nobody may be left to await a failed call; read the error so it is not reported as unhandled
+        if not task.cancelled():
+            task.exception()
+
+# Shared by both chatbot routers
+embedding_flight = SingleFlight("embedding", single_flight_enabled)
+retrieval_flight = SingleFlight("retrieval", single_flight_enabled)
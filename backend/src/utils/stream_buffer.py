@@ -0,0 +1,472 @@
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import AsyncIterator, Dict, List, Optional
+from uuid import uuid4
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from src.utils.conversation_store import (conversation_redis_prefix, conversation_redis_url,
+                                          conversation_store_backend, conversation_store_path)
+from src.utils.stream_writer import NDJSON, streaming_response
+from src.utils.telemetry import log
+
+load_dotenv()
+
+# Replay buffer limits, overridable from the environment
+stream_buffer_max_streams = int(os.getenv("STREAM_BUFFER_MAX_STREAMS", "1000"))
+stream_buffer_ttl = float(os.getenv("STREAM_BUFFER_TTL", "300"))  # seconds after the stream finished
+stream_buffer_max_bytes = int(os.getenv("STREAM_BUFFER_MAX_BYTES", str(256 * 1024)))  # per stream
+stream_resume_poll_interval = float(os.getenv("STREAM_RESUME_POLL_INTERVAL", "0.1"))  # seconds, for streams of other workers
+
+stream_id_header = "X-Stream-ID"
+
+class BufferedStream:
+    """Frames emitted by one streamed turn, kept so a dropped client can pick up where it left off.
+
+    Offsets count frames from the start of the stream. If the frames outgrow
+    ``max_bytes`` the oldest are dropped and ``first_offset`` moves forward.
+    """
+
+    def __init__(self, stream_id: str, fmt: str, max_bytes: int):
+        self.id = stream_id
+        self.fmt = fmt
+        self.max_bytes = max_bytes
+        self.frames: List[bytes] = []
+        self.first_offset = 0
+        self.nbytes = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def end_offset(self) -> int:
+        return self.first_offset + len(self.frames)
+
+    def push(self, data: bytes) -> None:
+        self.frames.append(data)
+        self.nbytes += len(data)
+        while self.nbytes > self.max_bytes and len(self.frames) > 1:
+            self.nbytes -= len(self.frames.pop(0))
+            self.first_offset += 1
+        self._notify()
+
+    async def first_frame(self) -> None:
+        """Wait for the first frame or the end of the stream, re-raising an error that came before any frame."""
+        while self.end_offset == 0 and not self.done:
+            await self._changed.wait()
+        if self.end_offset == 0 and self.error is not None:
+            raise self.error
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.done = True
+        self.error = error
+        self.finished_at = time.time()
+        self._notify()
+
+    async def follow(self, offset: int = 0) -> AsyncIterator[bytes]:
+        """Yield frames from ``offset`` on, waiting for new ones until the stream finishes."""
+        while True:
+            changed = self._changed
+            while offset < self.end_offset:
+                if offset < self.first_offset:
+                    # A slow reader fell behind the window; it cannot be resumed exactly
+                    raise RuntimeError(f"Stream {self.id} dropped frames before offset {self.first_offset}")
+                yield self.frames[offset - self.first_offset]
+                offset += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await changed.wait()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+class LoggedStream:
+    """A stream as read back from a shared frame log: its state plus frames from the requested offset."""
+
+    __slots__ = ("fmt", "first_offset", "end_offset", "done", "error", "updated", "frames")
+
+    def __init__(self, fmt: str, first_offset: int, end_offset: int, done: bool, error: Optional[str],
+                 updated: float, frames: List[bytes]):
+        self.fmt = fmt
+        self.first_offset = first_offset
+        self.end_offset = end_offset
+        self.done = done
+        self.error = error or None
+        self.updated = updated
+        self.frames = frames
+
+class StreamBuffers:
+    """Runs streamed turns in the background and keeps their frames for resuming.
+
+    ``start`` consumes a frame generator in its own task, so the generation
+    finishes (and is saved to the conversation) even if the client goes
+    away. Readers follow the buffer instead of the generator. Finished
+    streams are kept for ``ttl`` seconds and at most ``max_streams`` are
+    held, oldest first out.
+
+    Stream ids start with ``namespace``, so each router only resumes its own
+    streams. Buffers live in the producing process; with a ``frame_log`` the
+    frames are also written to the shared store, and a resume that reaches
+    another worker follows them from there.
+    """
+
+    def __init__(self, namespace: str = "default", max_streams: int = 1000, ttl: float = 300,
+                 max_bytes: int = 256 * 1024, frame_log=None, poll_interval: float = 0.1):
+        self.namespace = namespace
+        self.max_streams = max_streams
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.frame_log = frame_log
+        self.poll_interval = poll_interval
+        self.started = 0
+        self.resumes = {"ok": 0, "shared": 0, "not_found": 0, "gone": 0}
+        self._streams: "OrderedDict[str, BufferedStream]" = OrderedDict()
+
+    def start(self, frames: AsyncIterator[bytes], fmt: str = NDJSON) -> BufferedStream:
+        self._evict(self.max_streams - 1)
+        stream = BufferedStream(f"{self.namespace}-{uuid4()}", fmt, self.max_bytes)
+        stream.task = asyncio.ensure_future(self._produce(stream, frames))
+        if self.frame_log is not None:
+            asyncio.ensure_future(self._persist(stream))
+        self._streams[stream.id] = stream
+        self.started += 1
+        return stream
+
+    async def stream(self, frames: AsyncIterator[bytes], fmt: str = NDJSON):
+        """Start ``frames`` and respond once the first frame is out.
+
+        Errors raised before that frame (e.g. Overloaded waiting for an LLM
+        slot) propagate here, so the client gets their status code instead
+        of a stream that breaks off.
+        """
+        stream = self.start(frames, fmt)
+        await stream.first_frame()
+        return self.response(stream)
+
+    def get(self, stream_id: str) -> Optional[BufferedStream]:
+        self._evict(self.max_streams)
+        return self._streams.get(stream_id)
+
+    def response(self, stream: BufferedStream, offset: int = 0):
+        """Stream ``stream`` from ``offset``, telling the client its id so it can resume."""
+        response = streaming_response(stream.follow(offset), stream.fmt)
+        response.headers[stream_id_header] = stream.id
+        return response
+
+    async def resume(self, stream_id: str, offset: int = 0):
+        """Response for a client reconnecting after ``offset`` frames; 404/410/400 if that is impossible."""
+        if not stream_id.startswith(f"{self.namespace}-"):
+            # Another router's stream, or not a stream id at all
+            self.resumes["not_found"] += 1
+            raise HTTPException(status_code=404, detail="Stream not found or expired")
+        stream = self.get(stream_id)
+        if stream is None and self.frame_log is not None:
+            return await self._resume_shared(stream_id, offset)
+        if stream is None:
+            self.resumes["not_found"] += 1
+            raise HTTPException(status_code=404, detail="Stream not found or expired")
+        self._check_offset(offset, stream.first_offset, stream.end_offset)
+        self.resumes["ok"] += 1
+        return self.response(stream, offset)
+
+    def stats(self) -> dict:
+        running = sum(1 for stream in self._streams.values() if not stream.done)
+        return {
+            "streams": len(self._streams),
+            "running": running,
+            "bytes": sum(stream.nbytes for stream in self._streams.values()),
+            "started": self.started,
+            "resumes": dict(self.resumes),
+        }
+
+    async def close(self) -> None:
+        if self.frame_log is not None:
+            await self.frame_log.close()
+
+    def _check_offset(self, offset: int, first_offset: int, end_offset: int) -> None:
+        if offset < first_offset:
+            self.resumes["gone"] += 1
+            raise HTTPException(status_code=410, detail=f"Frames before offset {first_offset} are no longer buffered")
+        if offset > end_offset:
+            raise HTTPException(status_code=400, detail=f"Offset is past the {end_offset} frames sent so far")
+
+    async def _resume_shared(self, stream_id: str, offset: int):
+        """Follow a stream produced by another worker through the shared frame log."""
+        stream = await self.frame_log.read(stream_id, offset)
+        if stream is None:
+            self.resumes["not_found"] += 1
+            raise HTTPException(status_code=404, detail="Stream not found or expired")
+        self._check_offset(offset, stream.first_offset, stream.end_offset)
+        self.resumes["shared"] += 1
+        response = streaming_response(self._follow_shared(stream_id, offset, stream), stream.fmt)
+        response.headers[stream_id_header] = stream_id
+        return response
+
+    async def _follow_shared(self, stream_id: str, offset: int, stream: LoggedStream) -> AsyncIterator[bytes]:
+        while True:
+            if offset < stream.first_offset:
+                raise RuntimeError(f"Stream {stream_id} dropped frames before offset {stream.first_offset}")
+            for data in stream.frames:
+                yield data
+                offset += 1
+            if stream.done:
+                if stream.error is not None:
+                    raise RuntimeError(f"Stream {stream_id} failed: {stream.error}")
+                return
+            if time.time() - stream.updated > self.ttl:
+                raise RuntimeError(f"Stream {stream_id} stopped without finishing")
+            await asyncio.sleep(self.poll_interval)
+            stream = await self.frame_log.read(stream_id, offset)
+            if stream is None:
+                raise RuntimeError(f"Stream {stream_id} expired")
+
+    async def _produce(self, stream: BufferedStream, frames: AsyncIterator[bytes]) -> None:
+        try:
+            async for data in frames:
+                stream.push(data)
+        except BaseException as e:
+            if not isinstance(e, asyncio.CancelledError):
+                log(f"Stream {stream.id} failed: {e}")
+            stream.finish(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        else:
+            stream.finish()
+
+    async def _persist(self, stream: BufferedStream) -> None:
+        """Copy a stream's frames to the frame log as they arrive, a batch per write."""
+        stored = 0  # frames before this offset are in the log
+        try:
+            await self.frame_log.open(stream.id, stream.fmt)
+            while True:
+                changed = stream._changed
+                done = stream.done
+                start = max(stored, stream.first_offset)
+                frames = stream.frames[start - stream.first_offset:]
+                if frames or done:
+                    error = None
+                    if stream.error is not None:
+                        error = "cancelled" if isinstance(stream.error, asyncio.CancelledError) else str(stream.error)
+                    await self.frame_log.write(stream.id, stream.first_offset, start, frames, done, error)
+                    stored = start + len(frames)
+                if done:
+                    return
+                await changed.wait()
+        except Exception as e:
+            # The local buffer still serves this worker's readers
+            log(f"Could not write stream {stream.id} to the shared store: {e}")
+
+    def _evict(self, keep: int) -> None:
+        now = time.time()
+        for stream_id, stream in list(self._streams.items()):
+            if stream.done and now - stream.finished_at > self.ttl:
+                del self._streams[stream_id]
+        while len(self._streams) > max(keep, 0):
+            self._streams.popitem(last=False)
+
+class SQLiteStreamLog:
+    """Frames of streamed turns in the SQLite database the conversations live in.
+
+    Only the producing worker writes a stream; any worker on the host can
+    read it. Streams are removed ``ttl`` seconds after their last write.
+    Queries run in a worker thread, like those of SQLiteConversationStore.
+    """
+
+    def __init__(self, path: str = conversation_store_path, namespace: str = "default", ttl: float = 300):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = None
+        self._pid = None
+
+    async def open(self, stream_id: str, fmt: str) -> None:
+        await asyncio.to_thread(self._open_sync, stream_id, fmt)
+
+    async def write(self, stream_id: str, first_offset: int, start: int, frames: List[bytes],
+                    done: bool, error: Optional[str]) -> None:
+        """Store ``frames`` from offset ``start`` and drop those before ``first_offset``."""
+        await asyncio.to_thread(self._write_sync, stream_id, first_offset, start, frames, done, error)
+
+    async def read(self, stream_id: str, offset: int) -> Optional[LoggedStream]:
+        return await asyncio.to_thread(self._read_sync, stream_id, offset)
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self._close_sync)
+
+    def _open_sync(self, stream_id: str, fmt: str) -> None:
+        now = time.time()
+        with self._transaction() as db:
+            expired = [row[0] for row in db.execute("SELECT id FROM streams WHERE namespace = ? AND updated < ?",
+                                                    (self.namespace, now - self.ttl))]
+            for expired_id in expired:
+                db.execute("DELETE FROM stream_frames WHERE namespace = ? AND stream_id = ?", (self.namespace, expired_id))
+                db.execute("DELETE FROM streams WHERE namespace = ? AND id = ?", (self.namespace, expired_id))
+            db.execute("INSERT OR REPLACE INTO streams (namespace, id, fmt, first_offset, end_offset, done, error, updated) "
+                       "VALUES (?, ?, ?, 0, 0, 0, NULL, ?)", (self.namespace, stream_id, fmt, now))
+
+    def _write_sync(self, stream_id: str, first_offset: int, start: int, frames: List[bytes],
+                    done: bool, error: Optional[str]) -> None:
+        with self._transaction() as db:
+            db.executemany("INSERT OR REPLACE INTO stream_frames (namespace, stream_id, position, data) VALUES (?, ?, ?, ?)",
+                           [(self.namespace, stream_id, start + i, data) for i, data in enumerate(frames)])
+            db.execute("DELETE FROM stream_frames WHERE namespace = ? AND stream_id = ? AND position < ?",
+                       (self.namespace, stream_id, first_offset))
+            db.execute("UPDATE streams SET first_offset = ?, end_offset = ?, done = ?, error = ?, updated = ? "
+                       "WHERE namespace = ? AND id = ?",
+                       (first_offset, start + len(frames), int(done), error, time.time(), self.namespace, stream_id))
+
+    def _read_sync(self, stream_id: str, offset: int) -> Optional[LoggedStream]:
+        with self._transaction("BEGIN") as db:
+            row = db.execute("SELECT fmt, first_offset, end_offset, done, error, updated FROM streams "
+                             "WHERE namespace = ? AND id = ?", (self.namespace, stream_id)).fetchone()
+            if row is None or time.time() - row[5] > self.ttl:
+                return None
+            frames = [data for (data,) in db.execute(
+                "SELECT data FROM stream_frames WHERE namespace = ? AND stream_id = ? AND position >= ? ORDER BY position",
+                (self.namespace, stream_id, max(offset, row[1])))]
+        return LoggedStream(row[0], row[1], row[2], bool(row[3]), row[4], row[5], frames)
+
+    def _close_sync(self) -> None:
+        with self._lock:
+            if self._db is not None and self._pid == os.getpid():
+                self._db.close()
+            self._db = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection must not cross a fork; each worker opens its own
+        if self._db is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS streams (namespace TEXT NOT NULL, id TEXT NOT NULL, fmt TEXT NOT NULL, "
+                       "first_offset INTEGER NOT NULL, end_offset INTEGER NOT NULL, done INTEGER NOT NULL, error TEXT, "
+                       "updated REAL NOT NULL, PRIMARY KEY (namespace, id))")
+            db.execute("CREATE TABLE IF NOT EXISTS stream_frames (namespace TEXT NOT NULL, stream_id TEXT NOT NULL, "
+                       "position INTEGER NOT NULL, data BLOB NOT NULL, PRIMARY KEY (namespace, stream_id, position))")
+            self._db = db
+            self._pid = os.getpid()
+        return self._db
+
+    @contextmanager
+    def _transaction(self, begin: str = "BEGIN IMMEDIATE"):
+        with self._lock:
+            db = self._connect()
+            db.execute(begin)
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+class RedisStreamLog:
+    """Frames of streamed turns on the Redis server the conversations live in.
+
+    Each stream is a hash of its state plus a hash of frames by offset, both
+    expiring ``ttl`` seconds after the last write. Only the producing worker
+    writes a stream; workers on any host can read it.
+    """
+
+    def __init__(self, url: str = conversation_redis_url, namespace: str = "default",
+                 prefix: str = conversation_redis_prefix, ttl: float = 300):
+        self.url = url
+        self.prefix = f"{prefix}:{namespace}"
+        self.ttl = ttl
+        self._client = None
+        self._owner = None
+
+    async def open(self, stream_id: str, fmt: str) -> None:
+        state_key, frames_key = self._keys(stream_id)
+        async with self._connect().pipeline(transaction=True) as pipe:
+            pipe.delete(state_key, frames_key)
+            pipe.hset(state_key, mapping={"fmt": fmt, "first_offset": 0, "end_offset": 0, "done": 0,
+                                          "error": "", "updated": time.time()})
+            pipe.expire(state_key, self._ttl())
+            await pipe.execute()
+
+    async def write(self, stream_id: str, first_offset: int, start: int, frames: List[bytes],
+                    done: bool, error: Optional[str]) -> None:
+        """Store ``frames`` from offset ``start`` and drop those before ``first_offset``."""
+        state_key, frames_key = self._keys(stream_id)
+        client = self._connect()
+        previous_first = int(await client.hget(state_key, "first_offset") or 0)
+        async with client.pipeline(transaction=True) as pipe:
+            if frames:
+                pipe.hset(frames_key, mapping={start + i: data for i, data in enumerate(frames)})
+            if first_offset > previous_first:
+                pipe.hdel(frames_key, *range(previous_first, first_offset))
+            pipe.hset(state_key, mapping={"first_offset": first_offset, "end_offset": start + len(frames),
+                                          "done": int(done), "error": error or "", "updated": time.time()})
+            pipe.expire(state_key, self._ttl())
+            pipe.expire(frames_key, self._ttl())
+            await pipe.execute()
+
+    async def read(self, stream_id: str, offset: int) -> Optional[LoggedStream]:
+        state_key, frames_key = self._keys(stream_id)
+        async with self._connect().pipeline(transaction=True) as pipe:
+            pipe.hgetall(state_key)
+            pipe.hgetall(frames_key)
+            state, stored = await pipe.execute()
+        if not state:
+            return None
+        state = {key.decode(): value.decode() for key, value in state.items()}
+        first_offset = int(state["first_offset"])
+        frames: Dict[int, bytes] = {int(key): value for key, value in stored.items()}
+        start = max(offset, first_offset)
+        return LoggedStream(state["fmt"], first_offset, int(state["end_offset"]), state["done"] == "1",
+                            state["error"], float(state["updated"]),
+                            [frames[i] for i in range(start, int(state["end_offset"])) if i in frames])
+
+    async def close(self) -> None:
+        if self._client is not None and self._owner == self._current_owner():
+            await self._client.aclose()
+        self._client = None
+
+    @staticmethod
+    def _current_owner():
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        return os.getpid(), loop
+
+    def _connect(self):
+        # Connections must not cross a fork or an event loop; each worker opens its own
+        owner = self._current_owner()
+        if self._client is None or self._owner != owner:
+            import redis.asyncio
+            self._client = redis.asyncio.Redis.from_url(self.url)
+            self._owner = owner
+        return self._client
+
+    def _keys(self, stream_id: str):
+        return f"{self.prefix}:stream:{stream_id}", f"{self.prefix}:stream_frames:{stream_id}"
+
+    def _ttl(self) -> int:
+        return max(1, int(self.ttl))
+
+def create_stream_buffers(namespace: str = "default", backend: str = conversation_store_backend) -> StreamBuffers:
+    """Buffers for one router; with a shared conversation store, frames are also written there for other workers."""
+    if backend == "memory":
+        frame_log = None
+    elif backend == "sqlite":
+        frame_log = SQLiteStreamLog(conversation_store_path, namespace, stream_buffer_ttl)
+    elif backend == "redis":
+        frame_log = RedisStreamLog(conversation_redis_url, namespace, conversation_redis_prefix, stream_buffer_ttl)
+    else:
+        raise ValueError(f"Unknown CONVERSATION_STORE_BACKEND: {backend}")
+    return StreamBuffers(namespace, stream_buffer_max_streams, stream_buffer_ttl, stream_buffer_max_bytes,
+                         frame_log, stream_resume_poll_interval)
@@ -0,0 +1,127 @@
+import os
+import json
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional
+from dotenv import load_dotenv
+from fastapi.responses import StreamingResponse
+
+try:
+    import orjson
+except ImportError:  # plain json is used if orjson is not installed
+    orjson = None
+
+load_dotenv()
+
+# Coalescing window for streamed model output, overridable from the environment
+stream_flush_interval = float(os.getenv("STREAM_FLUSH_INTERVAL", "0.03"))  # seconds
+stream_flush_bytes = int(os.getenv("STREAM_FLUSH_BYTES", "512"))
+
+NDJSON = "ndjson"
+SSE = "sse"
+
+media_types = {
+    NDJSON: "application/x-ndjson",
+    SSE: "text/event-stream",
+}
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def stream_format(accept: Optional[str]) -> str:
+    """SSE if the client asks for ``text/event-stream``, NDJSON otherwise."""
+    if accept and "text/event-stream" in accept.lower():
+        return SSE
+    return NDJSON
+
+def frame(obj: Dict[str, Any], fmt: str = NDJSON) -> bytes:
+    # Encoded JSON never contains a raw newline, so one data line per event is enough
+    if fmt == SSE:
+        return b"data: " + dumps(obj) + b"\n\n"
+    return dumps(obj) + b"\n"
+
+def frames(fmt: str, *objects: Dict[str, Any]) -> List[bytes]:
+    return [frame(obj, fmt) for obj in objects]
+
+def streaming_response(body, fmt: str = NDJSON) -> StreamingResponse:
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"} if fmt == SSE else None
+    return StreamingResponse(body, media_type=media_types[fmt], headers=headers)
+
+async def completion_deltas(response) -> AsyncIterator[str]:
+    """Text deltas of a streamed OpenAI chat completion."""
+    async for chunk in response:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+class StreamWriter:
+    """Frames a streamed answer, coalescing model tokens into fewer, larger writes.
+
+    ``coalesce`` groups deltas until ``flush_bytes`` have accumulated or
+    ``flush_interval`` has passed since the first pending delta, whichever
+    comes first; a stalled upstream never holds back text longer than the
+    interval. Every delta is also kept in a list so the full answer is joined
+    once at the end instead of being rebuilt on every token.
+    """
+
+    def __init__(self, fmt: str = NDJSON, flush_interval: float = stream_flush_interval,
+                 flush_bytes: int = stream_flush_bytes):
+        self.fmt = fmt
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.parts: List[str] = []
+        self.writes = 0
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def event(self, obj: Dict[str, Any]) -> bytes:
+        self.writes += 1
+        return frame(obj, self.fmt)
+
+    def message(self, text: str) -> bytes:
+        return self.event({"message": text})
+
+    async def messages(self, deltas: AsyncIterator[str]) -> AsyncIterator[bytes]:
+        async for text in self.coalesce(deltas):
+            yield self.message(text)
+
+    async def coalesce(self, deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        iterator = deltas.__aiter__()
+        pending: List[str] = []
+        pending_bytes = 0
+        deadline = None
+        next_delta = None
+        try:
+            while True:
+                if next_delta is None:
+                    next_delta = asyncio.ensure_future(iterator.__anext__())
+                if pending:
+                    # Wait for more text only until the window closes; the read stays in flight
+                    done, _ = await asyncio.wait({next_delta}, timeout=max(0.0, deadline - loop.time()))
+                    if not done:
+                        yield "".join(pending)
+                        pending, pending_bytes, deadline = [], 0, None
+                        continue
+                try:
+                    delta = await next_delta
+                except StopAsyncIteration:
+                    break
+                finally:
+                    if next_delta.done():
+                        next_delta = None
+                self.parts.append(delta)
+                pending.append(delta)
+                pending_bytes += len(delta.encode("utf-8"))
+                if deadline is None:
+                    deadline = loop.time() + self.flush_interval
+                if pending_bytes >= self.flush_bytes or self.flush_interval <= 0:
+                    yield "".join(pending)
+                    pending, pending_bytes, deadline = [], 0, None
+            if pending:
+                yield "".join(pending)
+        finally:
+            if next_delta is not None and not next_delta.done():
+                next_delta.cancel()
@@ -0,0 +1,391 @@
+import os
+import re
+import json
+import time
+import uuid
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Observability settings, overridable from the environment
+metrics_enabled = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+server_timing_enabled = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+request_log_enabled = os.getenv("REQUEST_LOG_ENABLED", "true").lower() == "true"  # one timing line per request
+
+request_id_header = "x-request-id"
+_valid_request_id = re.compile(r"^[\w.:-]{1,64}$")
+
+# Seconds; chat stages range from sub-millisecond cache hits to multi-second completions
+stage_buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter with optional labels, rendered in the Prometheus text format."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        key = tuple(str(value) for value in label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, *label_values: str) -> float:
+        with self._lock:
+            return self._values.get(tuple(str(value) for value in label_values), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in items]
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels, rendered in the Prometheus text format."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = stage_buckets):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # per-bucket counts, then +Inf, sum
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        key = tuple(str(label) for label in label_values)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def count(self, *label_values: str) -> int:
+        with self._lock:
+            series = self._series.get(tuple(str(label) for label in label_values))
+            return int(sum(series[:-1])) if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {int(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {int(cumulative)}")
+        return lines
+
+# A collector returns (name, kind, help, [(labels, value), ...]) tuples read from existing stats at scrape time
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]
+
+class MetricsRegistry:
+    """Process-wide metrics, exposed on ``/metrics`` in the Prometheus text format.
+
+    Counters and histograms are updated on the request path. Components that
+    already keep their own counters (caches, intent router, contact logger)
+    are read through collectors when the endpoint is scraped instead of being
+    counted twice. With several worker processes each worker reports its own
+    values; Prometheus sums them across scrape targets.
+    """
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._collectors: List[Collector] = []
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = stage_buckets) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, collector: Collector) -> Collector:
+        self._collectors.append(collector)
+        return collector
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                log(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    names = tuple(labels)
+                    lines.append(f"{name}{_format_labels(names, tuple(labels[key] for key in names))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+http_requests = metrics.counter("paloma_http_requests_total", "HTTP requests by route, method and status.",
+                                ("route", "method", "status"))
+http_duration = metrics.histogram("paloma_http_request_duration_seconds",
+                                  "Time from request start to the last byte of the response, streaming included.",
+                                  ("route", "method"))
+stage_duration = metrics.histogram("paloma_stage_duration_seconds", "Time spent in each stage of a chat turn.",
+                                   ("route", "stage"))
+tokens_total = metrics.counter("paloma_tokens_total",
+                               "Tokens by kind: context (retrieved passages), history and completion (streamed chunks).",
+                               ("route", "kind"))
+upstream_errors = metrics.counter("paloma_upstream_errors_total", "Failed upstream calls by upstream and error type.",
+                                  ("upstream", "error"))
+
+class RequestTimings:
+    """Correlation id and stage timings of the request being served."""
+
+    __slots__ = ("request_id", "started", "stages", "_scope")
+
+    def __init__(self, request_id: str, scope: Optional[dict] = None):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+        self._scope = scope
+
+    @property
+    def route(self) -> str:
+        """Path template of the matched route, so ids in the URL do not become label values."""
+        scope = self._scope or {}
+        template = getattr(scope.get("route"), "path", None)
+        if template is None:
+            return "unmatched" if scope else "none"
+        # Routes of an included router may only know their own part of the path;
+        # take the router prefix from the segments in front of it
+        template_segments = [segment for segment in template.split("/") if segment]
+        path_segments = scope.get("path", "").rstrip("/").split("/")
+        prefix = "/".join(path_segments[:len(path_segments) - len(template_segments)])
+        return prefix + template if template_segments else (prefix or "") + "/"
+
+    def server_timing(self) -> str:
+        totals: Dict[str, float] = {}
+        for name, seconds in self.stages:
+            totals[name] = totals.get(name, 0.0) + seconds
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items()]
+        parts.append(f"app;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+current_request: ContextVar[Optional[RequestTimings]] = ContextVar("current_request", default=None)
+
+def current_request_id() -> Optional[str]:
+    timings = current_request.get()
+    return timings.request_id if timings is not None else None
+
+def log(message: str) -> None:
+    """Print a log line tagged with the current request's correlation id, if any."""
+    request_id = current_request_id()
+    print(f"[{request_id}] {message}" if request_id else message)
+
+def record_stage(name: str, seconds: float) -> None:
+    timings = current_request.get()
+    if timings is not None:
+        timings.stages.append((name, seconds))
+        stage_duration.observe(seconds, timings.route, name)
+    else:
+        stage_duration.observe(seconds, "background", name)
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as one stage of the current request; works around ``await``s too."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+def add_tokens(kind: str, count: int) -> None:
+    if count:
+        timings = current_request.get()
+        tokens_total.inc(timings.route if timings is not None else "background", kind, amount=count)
+
+def upstream_error(upstream: str, error: BaseException) -> None:
+    upstream_errors.inc(upstream, type(error).__name__)
+
+async def timed_stream(deltas: AsyncIterator[str], started: float) -> AsyncIterator[str]:
+    """Pass completion deltas through, recording time to first token, stream time and chunk count.
+
+    ``started`` is when the completion request was sent. These stages end
+    after the response headers, so they show up in the metrics and the
+    request log line but not in ``Server-Timing``.
+    """
+    chunks = 0
+    try:
+        async for delta in deltas:
+            if chunks == 0:
+                record_stage("llm_first_token", time.perf_counter() - started)
+            chunks += 1
+            yield delta
+    finally:
+        record_stage("llm_total", time.perf_counter() - started)
+        add_tokens("completion", chunks)
+
+class RequestIdFilter(logging.Filter):
+    """Adds ``request_id`` to log records so handlers can include it in their format."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = current_request_id() or "-"
+        return True
+
+class TelemetryMiddleware:
+    """ASGI middleware that gives each HTTP request a correlation id and timings.
+
+    Honors an incoming ``X-Request-ID`` (or makes one) and returns it on the
+    response, adds a ``Server-Timing`` header with the stages finished before
+    the headers went out, records request counts and durations, and logs one
+    JSON line per request with every stage, including those that ran while
+    the response was streaming.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", []):
+            if name == request_id_header.encode():
+                candidate = value.decode("latin-1")
+                if _valid_request_id.match(candidate):
+                    request_id = candidate
+                break
+        timings = RequestTimings(request_id or uuid.uuid4().hex[:16], scope)
+        token = current_request.set(timings)
+        status = {"code": 500}
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((request_id_header.encode(), timings.request_id.encode()))
+                if server_timing_enabled:
+                    headers.append((b"server-timing", timings.server_timing().encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            elapsed = time.perf_counter() - timings.started
+            route = timings.route
+            method = scope.get("method", "")
+            http_requests.inc(route, method, status["code"])
+            http_duration.observe(elapsed, route, method)
+            if request_log_enabled and route != "/metrics":
+                stages: Dict[str, float] = {}
+                for name, seconds in timings.stages:
+                    stages[name] = round(stages.get(name, 0.0) + seconds * 1000, 1)
+                print(json.dumps({
+                    "request_id": timings.request_id,
+                    "method": method,
+                    "route": route,
+                    "status": status["code"],
+                    "total_ms": round(elapsed * 1000, 1),
+                    "stages_ms": stages,
+                }))
+            current_request.reset(token)
+
+@metrics.collector
+def _component_stats():
+    """Counters the caches, single-flight layer, stream buffers, limiters, intent router and contact logger already keep."""
+    from src.utils.embedding_cache import embedding_cache
+    from src.utils.answer_cache import answer_cache
+    from src.utils.content_store import content_store
+    from src.utils.intent_router import intent_router
+    from src.utils.contact_logger import contact_logger
+    from src.utils.single_flight import embedding_flight, retrieval_flight
+    from src.utils.services import services
+    from src.utils.admission import conversation_turns, embedding_limiter, llm_limiter
+
+    lookups, entries = [], []
+    embedding = embedding_cache.stats()
+    lookups += [({"cache": "embedding", "result": "hit"}, embedding["hits"]),
+                ({"cache": "embedding", "result": "disk_hit"}, embedding["disk_hits"]),
+                ({"cache": "embedding", "result": "miss"}, embedding["misses"])]
+    entries.append(({"cache": "embedding"}, embedding["size"]))
+    answers = answer_cache.stats()
+    lookups += [({"cache": "answer", "result": "hit"}, answers["hits"]),
+                ({"cache": "answer", "result": "miss"}, answers["misses"])]
+    entries.append(({"cache": "answer"}, answers["size"]))
+    if content_store is not None:
+        content = content_store.stats()
+        lookups += [({"cache": "content", "result": "hit"}, content["hits"]),
+                    ({"cache": "content", "result": "miss"}, content["misses"])]
+        entries.append(({"cache": "content"}, content["size"]))
+    yield "paloma_cache_lookups_total", "counter", "Cache lookups by cache and result.", lookups
+    yield "paloma_cache_entries", "gauge", "Entries held in memory by each cache.", entries
+
+    yield ("paloma_intent_decisions_total", "counter", "Intent router decisions by intent and how they were made.",
+           [({"intent": name, "source": source}, count) for (name, source), count in sorted(intent_router.decisions.items())])
+
+    flights = [(flight.name, flight.stats()) for flight in (embedding_flight, retrieval_flight)]
+    yield ("paloma_single_flight_calls_total", "counter", "Upstream lookups by call and whether they started a call or joined one in flight.",
+           [({"call": name, "result": result}, stats[key]) for name, stats in flights
+            for result, key in (("started", "calls"), ("coalesced", "coalesced"))])
+    yield ("paloma_single_flight_in_flight", "gauge", "Distinct upstream calls currently in flight.",
+           [({"call": name}, stats["in_flight"]) for name, stats in flights])
+
+    buffers = [(buffers.namespace, buffers.stats()) for buffers in services.stream_buffers]
+    yield ("paloma_stream_buffers", "gauge", "Chat streams held for resuming, by router and state.",
+           [({"router": name, "state": state}, count) for name, streams in buffers
+            for state, count in (("running", streams["running"]), ("finished", streams["streams"] - streams["running"]))])
+    yield ("paloma_stream_resumes_total", "counter", "Stream resume attempts by router and result.",
+           [({"router": name, "result": result}, count) for name, streams in buffers
+            for result, count in streams["resumes"].items()])
+
+    limiters = [(limiter.name, limiter.stats()) for limiter in (llm_limiter, embedding_limiter)]
+    yield ("paloma_admission_total", "counter", "Admission decisions by limiter and result.",
+           [({"limiter": name, "result": result}, stats[result]) for name, stats in limiters
+            for result in ("admitted", "queued", "queue_full", "timeout")])
+    yield ("paloma_admission_active", "gauge", "Slots in use by limiter.",
+           [({"limiter": name}, stats["active"]) for name, stats in limiters])
+    yield ("paloma_admission_waiting", "gauge", "Callers waiting for a slot, by limiter.",
+           [({"limiter": name}, stats["waiting"]) for name, stats in limiters]
+           + [({"limiter": "conversation_turn"}, conversation_turns.stats()["waiting"])])
+
+    contacts = contact_logger.stats()
+    yield ("paloma_contact_events_total", "counter", "Contact events by outcome.",
+           [({"outcome": outcome}, contacts[outcome]) for outcome in ("sent", "failed", "spilled", "deduplicated")])
+    yield "paloma_contact_queue_size", "gauge", "Contact events waiting to be sent.", [({}, contacts["queued"])]
@@ -0,0 +1,81 @@
+import re
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional
+import tiktoken
+
+# Rough fallback: each word or punctuation mark (with trailing whitespace) is one token
+_approximate_token = re.compile(r"\s*(?:\w+|[^\w\s])\s*|\s+", re.UNICODE)
+
+class _ApproximateEncoding:
+    """Stand-in used when a tiktoken encoding cannot be loaded (e.g. offline, cold cache)."""
+
+    name = "approximate"
+
+    def encode(self, text: str) -> List[str]:
+        return _approximate_token.findall(text)
+
+    def decode(self, tokens: List[str]) -> str:
+        return "".join(tokens)
+
+_approximate_encoding = _ApproximateEncoding()
+
+# Encodings loaded so far, and models whose encoding failed to load (with the error)
+_encodings: Dict[str, Any] = {}
+_failures: Dict[str, str] = {}
+
+def load_encoding(model: str = "gpt-4o-mini"):
+    """Return the tiktoken encoding for ``model``, downloading it on a cold cache; raises if that fails.
+
+    Blocking; the API preloads its encodings in a worker thread at startup.
+    Ingestion uses this directly, since approximate counts would move every
+    chunk boundary and re-embed the whole corpus.
+    """
+    encoding = _encodings.get(model)
+    if encoding is None:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        _encodings[model] = encoding
+        _failures.pop(model, None)
+    return encoding
+
+async def preload_encodings(models: Iterable[str]) -> Dict[str, Optional[str]]:
+    """Load the encodings off the event loop; returns each model's load error, None if it loaded."""
+    errors: Dict[str, Optional[str]] = {}
+    for model in models:
+        try:
+            await asyncio.to_thread(load_encoding, model)
+            errors[model] = None
+        except Exception as e:
+            _failures[model] = str(e)
+            errors[model] = str(e)
+    return errors
+
+def get_encoding(model: str = "gpt-4o-mini"):
+    """Return the tokenizer for ``model``, or an approximation if it failed to load.
+
+    A failed load is not retried here, so a request never waits on a
+    download; the failure is printed once and keeps the API not ready.
+    """
+    encoding = _encodings.get(model)
+    if encoding is not None:
+        return encoding
+    if model not in _failures:
+        try:
+            return load_encoding(model)
+        except Exception as e:
+            _failures[model] = str(e)
+            print(f"Could not load tokenizer for {model}, using approximate token counts: {e}")
+    return _approximate_encoding
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    return len(get_encoding(model).encode(text))
+
+def truncate_tokens(text: str, max_tokens: int, model: str = "gpt-4o-mini") -> str:
+    """Cut ``text`` to at most ``max_tokens`` tokens."""
+    encoding = get_encoding(model)
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max(0, max_tokens)])
@@ -0,0 +1,18 @@
+from src.utils.answer_cache import SemanticAnswerCache, context_key_for_matches
+
+MATCHES = [{"id": "brochure.pdf_page_3_chunk_0"}, {"id": "pricing.pdf_page_1_chunk_2"}]
+
+def test_history_is_part_of_the_context_key():
+    first = [{"role": "user", "content": "Tell me about the 3 BHK"}, {"role": "assistant", "content": "It is 1850 sq ft."}]
+    other = [{"role": "user", "content": "Tell me about the 4 BHK"}, {"role": "assistant", "content": "It is 2400 sq ft."}]
+    assert context_key_for_matches(MATCHES) == context_key_for_matches(MATCHES, [])
+    assert context_key_for_matches(MATCHES, first) != context_key_for_matches(MATCHES, other)
+
+def test_follow_up_is_not_replayed_into_another_conversation(tmp_path):
+    cache = SemanticAnswerCache(version_path=str(tmp_path / ".index_version"))
+    embedding = [0.1, 0.2, 0.3]
+    history_a = [{"role": "user", "content": "Tell me about the 3 BHK"}]
+    history_b = [{"role": "user", "content": "Tell me about the clubhouse"}]
+    cache.add("v1", embedding, context_key_for_matches(MATCHES, history_a), "The 3 BHK also has ...")
+    assert cache.lookup("v1", embedding, context_key_for_matches(MATCHES, history_b)) is None
+    assert cache.lookup("v1", embedding, context_key_for_matches(MATCHES, history_a)) == "The 3 BHK also has ..."
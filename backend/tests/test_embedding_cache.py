@@ -0,0 +1,21 @@
+import asyncio
+import time
+from src.utils.embedding_cache import EmbeddingCache
+
+MODEL = "text-embedding-3-small"
+
+def test_disk_hit_is_promoted_into_memory(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    asyncio.run(EmbeddingCache(path=path).set("Price of the 3 BHK?", MODEL, [0.5, 0.25]))
+    cache = EmbeddingCache(path=path)
+    assert asyncio.run(cache.get("price of the  3 bhk?", MODEL)) == [0.5, 0.25]
+    assert cache.stats()["disk_hits"] == 1
+
+def test_prune_drops_expired_then_oldest_rows(tmp_path):
+    cache = EmbeddingCache(ttl=60, path=str(tmp_path / "embeddings.sqlite3"), max_disk_size=2, prune_every=1000)
+    for i in range(4):
+        asyncio.run(cache.set(f"query {i}", MODEL, [float(i)]))
+    cache._db.execute("UPDATE embeddings SET created = ? WHERE text = 'query 0'", (time.time() - 120,))
+    assert cache.prune() == 2
+    rows = [text for (text,) in cache._db.execute("SELECT text FROM embeddings ORDER BY text")]
+    assert rows == ["query 2", "query 3"]
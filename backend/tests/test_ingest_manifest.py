@@ -0,0 +1,28 @@
+from src.utils.ingest_manifest import IngestManifest
+
+MODEL = "text-embedding-3-small"
+
+def record(vector_id, text):
+    return {"id": vector_id, "text": text, "metadata": {"source": "brochure.pdf"}}
+
+def sync_records(manifest, records):
+    sync = manifest.start_sync("brochure.pdf", MODEL)
+    sync.mark_upserted([r["id"] for r in sync.filter(records)])
+    sync.commit(sync.deleted_ids())
+    return sync
+
+def test_first_sync_reports_legacy_cleanup_apart_from_deletions(tmp_path):
+    manifest = IngestManifest(str(tmp_path / "manifest.json"))
+    records = [record(f"brochure.pdf_page_{page}_chunk_0", f"page {page}") for page in (1, 2)]
+    sync = sync_records(manifest, records)
+    assert (sync.new, sync.deleted, sync.legacy_cleared) == (2, 0, 2)
+    assert sync.summary() == ("brochure.pdf: 2 new, 0 changed, 0 unchanged, 0 deleted "
+                              "(2 legacy page ids cleared)")
+
+def test_removed_chunk_is_deleted_on_a_later_sync(tmp_path):
+    manifest = IngestManifest(str(tmp_path / "manifest.json"))
+    records = [record(f"brochure.pdf_page_{page}_chunk_0", f"page {page}") for page in (1, 2)]
+    sync_records(manifest, records)
+    sync = sync_records(manifest, records[:1])
+    assert (sync.unchanged, sync.deleted, sync.legacy_cleared) == (1, 1, 0)
+    assert sync.changes == 1
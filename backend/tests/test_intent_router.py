@@ -0,0 +1,25 @@
+import asyncio
+import pytest
+from src.utils.intent_router import ACKNOWLEDGEMENT, QUESTION, THANKS, IntentRouter
+
+OFFER = "The project offers flexible options. Would you like to know more about the payment plans?"
+
+def classify(text, previous_assistant=None):
+    return asyncio.run(IntentRouter(enabled=True).classify(text, previous_assistant))
+
+@pytest.mark.parametrize("reply", ["yes", "yes please", "sure, go ahead", "ok tell me", "yeah"])
+def test_accepting_an_offer_goes_to_retrieval(reply):
+    intent = classify(reply, OFFER)
+    assert intent.needs_retrieval
+    assert intent.query == f"Would you like to know more about the payment plans? {reply}"
+
+def test_declining_an_offer_is_small_talk():
+    assert classify("no", OFFER).name == ACKNOWLEDGEMENT
+
+def test_acknowledgement_without_an_offer_is_small_talk():
+    assert classify("yes", "Here are the amenities.").name == ACKNOWLEDGEMENT
+    assert classify("thanks a lot", OFFER).name == THANKS
+
+def test_trailing_verbs_are_not_filler():
+    intent = classify("ok tell me", "Here are the amenities.")
+    assert intent.name == QUESTION and intent.query is None
@@ -0,0 +1,25 @@
+from src.utils.name_extractor import extract_name
+
+ASKED = "Before we continue, may I know your name?"
+
+def test_place_after_i_am_is_not_a_name():
+    match = extract_name("I am Kanpur based")
+    assert match.name is None
+
+def test_project_after_this_is_is_not_a_name():
+    match = extract_name("this is Paloma?")
+    assert match.name is None
+
+def test_capitalized_sentence_is_not_a_name():
+    match = extract_name("This Is Great")
+    assert match.name is None
+
+def test_weak_cue_is_unsure_unless_asked():
+    assert not extract_name("I am Ravi").sure
+    assert not extract_name("This is Meera").sure
+    match = extract_name("I am Ravi", ASKED)
+    assert (match.name, match.sure) == ("Ravi", True)
+
+def test_explicit_cue_is_sure():
+    match = extract_name("my name is Anita")
+    assert (match.name, match.sure) == ("Anita", True)